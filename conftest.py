@@ -9,6 +9,11 @@ def pytest_addoption(parser):
                     help="dump binary file for each test" )
   parser.addoption( "--test-verilog", action="store", default='', nargs='?', const='zeros', choices=[ '', 'zeros', 'ones', 'rand' ],
                     help="run verilog translation, " )
+  parser.addoption( "--line-trace", action="store", default='full',
+                    metavar="off|tail:N|full",
+                    help="line tracing mode (default: full), tail:N only "
+                         "keeps the last N cycles and prints them for "
+                         "failing tests" )
 
 @pytest.fixture
 def dump_vcd(request):
@@ -35,12 +40,44 @@ def test_verilog(request):
   """Test Verilog translation rather than python."""
   return request.config.option.test_verilog
 
+def pytest_configure(config):
+  """Set the line trace mode of all simulators."""
+  from pymtl.tools.simulation.SimulationTool import SimulationTool
+  from pymtl.tools.simulation.linetrace      import parse_line_trace_mode
+  try:
+    parse_line_trace_mode( config.option.line_trace )
+  except ValueError as e:
+    raise pytest.UsageError( str( e ) )
+  SimulationTool.line_trace_mode = config.option.line_trace
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+  """Print the captured line traces of failing tests."""
+  from pymtl.tools.simulation.linetrace import active_line_traces
+  outcome = yield
+  report  = outcome.get_result()
+  if report.failed:
+    for buf in active_line_traces():
+      try:
+        trace = buf.format()
+      except Exception as e:
+        trace = "Failed to format the line trace: {}".format( e )
+      report.sections.append( ( "Line trace ({})".format( report.when ),
+                                trace ) )
+
+def pytest_runtest_teardown(item, nextitem):
+  """Write out the waveforms of the simulators created by the test."""
+  from pymtl.tools.simulation.tracebuffer import close_waveforms
+  close_waveforms()
+
 def pytest_cmdline_preparse(config, args):
   """Don't write *.pyc and __pycache__ files."""
   import sys
   sys.dont_write_bytecode = True
 
 def pytest_runtest_setup(item):
+  from pymtl.tools.simulation.linetrace import clear_line_traces
+  clear_line_traces()
   test_verilog = item.config.option.test_verilog
   if test_verilog and 'test_verilog' not in item.funcargnames:
     pytest.skip("ignoring non-Verilog tests")
@@ -66,10 +66,11 @@ class TestRandomDelay( Model ):
 
       # If the input transaction occured, then write the input message into
       # our internal buffer, update the buffer full bit, and reset the
-      # counter.
+      # counter. The buffer is only copied into the output port, so the
+      # message is frozen instead of copied.
 
       if in_go:
-        s.buf      = s.in_.msg[:]
+        s.buf      = freeze( s.in_.msg )
         s.buf_full = True
         s.counter  = s.rgen.randint( 1, s.max_random_delay )
 
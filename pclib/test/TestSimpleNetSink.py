@@ -16,6 +16,9 @@ from pclib.ifcs import InValRdyBundle, OutValRdyBundle
 # information
 class TestSimpleNetSink( Model ):
 
+  # Python state printed by line_trace(), see linetrace.py
+  line_trace_attrs = [ 'idx' ]
+
   def __init__( s, dtype, msgs ):
 
     s.in_  = InValRdyBundle( dtype )
@@ -2,8 +2,6 @@
 # TestSimpleSink
 #=======================================================================
 
-from copy       import deepcopy
-
 from pymtl      import *
 from pclib.ifcs import InValRdyBundle
 
@@ -16,12 +14,18 @@ class TestSinkError( Exception ):
 
 class TestSimpleSink( Model ):
 
+  # Python state printed by line_trace(), see linetrace.py
+  line_trace_attrs = [ 'idx' ]
+
   def __init__( s, dtype, msgs ):
 
     s.in_  = InValRdyBundle( dtype )
     s.done = OutPort       ( 1     )
 
-    s.msgs = deepcopy( msgs )
+    # Messages are only compared to the input port, so they are frozen
+    # (and shared) instead of deep copied
+
+    s.msgs = [ freeze( msg ) for msg in msgs ]
     s.idx  = 0
 
     @s.tick
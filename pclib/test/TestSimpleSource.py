@@ -2,8 +2,6 @@
 # TestSimpleSource
 #=======================================================================
 
-from copy       import deepcopy
-
 from pymtl      import *
 from pclib.ifcs import OutValRdyBundle
 
@@ -13,12 +11,18 @@ from pclib.ifcs import OutValRdyBundle
 class TestSimpleSource( Model ):
   'Outputs data provided in ``msgs`` onto a val/rdy interface.'
 
+  # Python state printed by line_trace(), see linetrace.py
+  line_trace_attrs = [ 'idx' ]
+
   def __init__( s, dtype, msgs ):
 
     s.out  = OutValRdyBundle( dtype )
     s.done = OutPort        ( 1     )
 
-    s.msgs = deepcopy( msgs )
+    # Messages are only copied into the output port, so they are frozen
+    # (and shared) instead of deep copied
+
+    s.msgs = [ freeze( msg ) for msg in msgs ]
     s.idx  = 0
 
     @s.tick
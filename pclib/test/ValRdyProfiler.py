@@ -0,0 +1,295 @@
+#=========================================================================
+# ValRdyProfiler.py
+#=========================================================================
+# Instrumentation which profiles every val/rdy interface of an elaborated
+# design. Interfaces are discovered by walking the model hierarchy for
+# InValRdyBundles and OutValRdyBundles (including PortLists of bundles),
+# and bundles which are connected to the same nets (e.g., the out bundle
+# of a source and the in bundle of the model it feeds) are profiled once
+# as a single channel, which is reachable through any of its hierarchy
+# paths.
+#
+# The val and rdy nets of every channel are sampled at each rising clock
+# edge, after the combinational logic has settled, and every cycle is
+# counted as either:
+#
+#  - fire  : val and rdy, a message is transferred
+#  - stall : val without rdy, the consumer applies backpressure
+#  - idle  : no val, the producer has nothing to send
+#
+# Cycles in which the reset signal is high are not counted.
+#
+# Request and response channels can also be paired to measure latency:
+# each request is matched with the response carrying the same key (the
+# opaque field of messages which have one, e.g., MemMsg), or with the
+# next response in order otherwise. Pairs record a latency histogram in
+# cycles and the mean number of outstanding requests.
+#
+#   sim      = SimulationTool( model )
+#   profiler = ValRdyProfiler( sim )
+#   profiler.match( 'top.src.out', 'top.sink.in_' )
+#   ...
+#   print( profiler.format() )
+
+from __future__ import print_function
+
+import collections
+
+from pclib.ifcs.ValRdyBundle import ValRdyBundle
+
+#-------------------------------------------------------------------------
+# find_valrdy_bundles
+#-------------------------------------------------------------------------
+# Yields ( path, bundle ) for every val/rdy bundle of a model and of its
+# submodules, in hierarchical order.
+def find_valrdy_bundles( model, path ):
+
+  for port in model.get_ports( preserve_hierarchy=True ):
+    if isinstance( port, ValRdyBundle ):
+      yield path + '.' + port.name, port
+    elif isinstance( port, list ):
+      for item in port:
+        if isinstance( item, ValRdyBundle ):
+          yield path + '.' + item.name, item
+
+  for submodel in model.get_submodules():
+    for item in find_valrdy_bundles( submodel, path + '.' + submodel.name ):
+      yield item
+
+#-------------------------------------------------------------------------
+# ValRdyChannel
+#-------------------------------------------------------------------------
+class ValRdyChannel( object ):
+
+  def __init__( self, path, bundle ):
+    self.path  = path
+    self.paths = [ path ]
+    self.val   = bundle.val
+    self.rdy   = bundle.rdy
+    self.msg   = bundle.msg
+    self.nbits = bundle.msg.nbits
+    self.fire  = 0
+    self.stall = 0
+
+#-------------------------------------------------------------------------
+# find_valrdy_channels
+#-------------------------------------------------------------------------
+# Returns the list of channels of a simulated model and an ordered dict
+# mapping every hierarchy path to its channel. Bundles connected to the
+# same val and rdy nets are a single channel named after the first path.
+def find_valrdy_channels( model ):
+
+  channels = []
+  paths    = collections.OrderedDict()
+  nets     = {}
+
+  for path, bundle in find_valrdy_bundles( model, 'top' ):
+    key = ( id( bundle.val ), id( bundle.rdy ) )
+    if key in nets:
+      channel = nets[ key ]
+      channel.paths.append( path )
+    else:
+      channel = nets[ key ] = ValRdyChannel( path, bundle )
+      channels.append( channel )
+    paths[ path ] = channel
+
+  return channels, paths
+
+#-------------------------------------------------------------------------
+# ValRdyPair
+#-------------------------------------------------------------------------
+class ValRdyPair( object ):
+
+  def __init__( self, req, resp, key ):
+    self.req         = req
+    self.resp        = resp
+    self.key         = key
+    self.pending     = collections.defaultdict( collections.deque )
+    self.outstanding = 0
+    self.occupancy   = 0
+    self.histogram   = collections.Counter()
+    self.unmatched   = 0
+
+#-------------------------------------------------------------------------
+# ValRdyProfiler
+#-------------------------------------------------------------------------
+class ValRdyProfiler( object ):
+
+  #-----------------------------------------------------------------------
+  # __init__
+  #-----------------------------------------------------------------------
+  # If match is True, the request and response bundles of each model are
+  # paired automatically (e.g., reqs[0] with resps[0], memreq with
+  # memresp).
+  def __init__( self, sim, match=False ):
+
+    self.sim      = sim
+    self.model    = sim.model
+    self.pairs    = []
+    self.cycles   = 0
+
+    self.channels, self._paths = find_valrdy_channels( self.model )
+
+    if match:
+      self._match_all()
+
+    sim._edge_callbacks.append( self._sample )
+
+  #-----------------------------------------------------------------------
+  # _sample
+  #-----------------------------------------------------------------------
+  # Called at every rising clock edge, only integer operations are done
+  # for channels which are not part of a pair.
+  def _sample( self ):
+
+    if self.model.reset._uint:
+      return
+
+    self.cycles += 1
+
+    for channel in self.channels:
+      if channel.val._uint:
+        if channel.rdy._uint: channel.fire  += 1
+        else:                 channel.stall += 1
+
+    ncycles = self.sim.ncycles
+    for pair in self.pairs:
+
+      req  = pair.req
+      resp = pair.resp
+
+      if req.val._uint and req.rdy._uint:
+        key = pair.key( req.msg ) if pair.key else None
+        pair.pending[ key ].append( ncycles )
+        pair.outstanding += 1
+
+      if resp.val._uint and resp.rdy._uint:
+        key   = pair.key( resp.msg ) if pair.key else None
+        queue = pair.pending.get( key )
+        if queue:
+          pair.histogram[ ncycles - queue.popleft() ] += 1
+          pair.outstanding -= 1
+        else:
+          pair.unmatched += 1
+
+      pair.occupancy += pair.outstanding
+
+  #-----------------------------------------------------------------------
+  # match
+  #-----------------------------------------------------------------------
+  # Pair a request and a response channel given their hierarchy paths.
+  # By default responses are matched by opaque field when the message
+  # has one and in order otherwise, key can be a function returning the
+  # matching key of a message.
+  def match( self, req_path, resp_path, key=None ):
+
+    req  = self._channel( req_path  )
+    resp = self._channel( resp_path )
+
+    if key is None and hasattr( req.msg, 'opaque' ) \
+                   and hasattr( resp.msg, 'opaque' ):
+      key = lambda msg: msg.opaque.uint()
+
+    self.pairs.append( ValRdyPair( req, resp, key ) )
+
+  def _channel( self, path ):
+    try:
+      return self._paths[ path ]
+    except KeyError:
+      raise KeyError( 'No val/rdy interface named "{}"!'.format( path ) )
+
+  #-----------------------------------------------------------------------
+  # _match_all
+  #-----------------------------------------------------------------------
+  # Pair bundles of the same model whose names only differ by req/resp.
+  def _match_all( self ):
+
+    paired = set()
+    for path, channel in self._paths.items():
+      scope, name = path.rsplit( '.', 1 )
+      resp_path   = scope + '.' + name.replace( 'req', 'resp' )
+      if 'req' not in name or resp_path not in self._paths:
+        continue
+      channels = ( channel, self._paths[ resp_path ] )
+      if channels not in paired:
+        paired.add( channels )
+        self.match( path, resp_path )
+
+  #-----------------------------------------------------------------------
+  # report
+  #-----------------------------------------------------------------------
+  # Returns the statistics of every channel indexed by hierarchy path,
+  # bandwidth is in bits per cycle.
+  def report( self ):
+
+    cycles = self.cycles
+    stats  = collections.OrderedDict()
+
+    for channel in self.channels:
+      busy = channel.fire + channel.stall
+      stats[ channel.path ] = {
+        'paths'      : channel.paths,
+        'cycles'     : cycles,
+        'fire'       : channel.fire,
+        'stall'      : channel.stall,
+        'idle'       : cycles - busy,
+        'nbits'      : channel.nbits,
+        'throughput' : float( channel.fire  ) / cycles if cycles else 0.0,
+        'stall_rate' : float( channel.stall ) / busy   if busy   else 0.0,
+        'bandwidth'  : float( channel.fire * channel.nbits ) / cycles
+                       if cycles else 0.0,
+      }
+
+    return stats
+
+  #-----------------------------------------------------------------------
+  # latency
+  #-----------------------------------------------------------------------
+  # Returns the latency statistics of every pair indexed by the paths of
+  # its request and response channels.
+  def latency( self ):
+
+    stats = collections.OrderedDict()
+
+    for pair in self.pairs:
+      hist  = pair.histogram
+      count = sum( hist.values() )
+      stats[ ( pair.req.path, pair.resp.path ) ] = {
+        'count'       : count,
+        'histogram'   : dict( hist ),
+        'min'         : min( hist ) if count else None,
+        'max'         : max( hist ) if count else None,
+        'mean'        : float( sum( k*v for k, v in hist.items() ) ) / count
+                        if count else None,
+        'outstanding' : pair.outstanding,
+        'occupancy'   : float( pair.occupancy ) / self.cycles
+                        if self.cycles else 0.0,
+        'unmatched'   : pair.unmatched,
+      }
+
+    return stats
+
+  #-----------------------------------------------------------------------
+  # format
+  #-----------------------------------------------------------------------
+  def format( self ):
+
+    width = max( [ len( x ) for x in self._paths ] + [ 9 ] )
+    lines = [ '{:<{w}} {:>8} {:>8} {:>8} {:>6} {:>6}'.format(
+              'interface', 'fire', 'stall', 'idle', 'thru', 'stall%', w=width ) ]
+
+    for path, s in self.report().items():
+      lines.append( '{:<{w}} {:>8} {:>8} {:>8} {:>6.3f} {:>6.1%}'.format(
+                    path, s['fire'], s['stall'], s['idle'], s['throughput'],
+                    s['stall_rate'], w=width ) )
+
+    for ( req, resp ), s in self.latency().items():
+      if s['count']:
+        lines.append( '{} -> {}: {} transactions, latency min/mean/max '
+                      '{}/{:.2f}/{}, {:.2f} outstanding'.format(
+                      req, resp, s['count'], s['min'], s['mean'], s['max'],
+                      s['occupancy'] ) )
+      else:
+        lines.append( '{} -> {}: no transactions'.format( req, resp ) )
+
+    return '\n'.join( lines )
@@ -0,0 +1,179 @@
+#=========================================================================
+# ValRdyProfiler_test.py
+#=========================================================================
+
+from __future__ import print_function
+
+import pytest
+
+from pymtl      import *
+from pclib.test import TestSource, TestSink, TestMemory
+from pclib.ifcs import MemMsg4B
+
+from ValRdyProfiler  import ValRdyProfiler
+from TestMemory_test import req, resp
+
+#-------------------------------------------------------------------------
+# SrcSinkHarness
+#-------------------------------------------------------------------------
+
+class SrcSinkHarness( Model ):
+
+  def __init__( s, msgs, src_delay, sink_delay, nbits=16 ):
+
+    s.src  = TestSource( nbits, msgs, src_delay  )
+    s.sink = TestSink  ( nbits, msgs, sink_delay )
+
+    s.connect( s.src.out, s.sink.in_ )
+
+  def done( s ):
+    return s.src.done and s.sink.done
+
+  def line_trace( s ):
+    return s.src.line_trace() + " > " + s.sink.line_trace()
+
+#-------------------------------------------------------------------------
+# MemHarness
+#-------------------------------------------------------------------------
+
+class MemHarness( Model ):
+
+  def __init__( s, src_msgs, sink_msgs, latency ):
+
+    mem_msgs = MemMsg4B()
+
+    s.src  = TestSource( mem_msgs.req,  src_msgs  )
+    s.mem  = TestMemory( mem_msgs, 1, 0, latency )
+    s.sink = TestSink  ( mem_msgs.resp, sink_msgs )
+
+    s.connect( s.src.out,  s.mem.reqs[0]  )
+    s.connect( s.sink.in_, s.mem.resps[0] )
+
+  def done( s ):
+    return s.src.done and s.sink.done
+
+  def line_trace( s ):
+    return s.src.line_trace() + " " + s.mem.line_trace()
+
+def run_profiled( model, match=False ):
+
+  model.elaborate()
+  sim      = SimulationTool( model )
+  profiler = ValRdyProfiler( sim, match )
+
+  sim.reset()
+  while not model.done() and sim.ncycles < 1000:
+    sim.print_line_trace()
+    sim.cycle()
+
+  assert model.done()
+  return sim, profiler
+
+#-------------------------------------------------------------------------
+# test_discovery
+#-------------------------------------------------------------------------
+
+def test_discovery():
+
+  model = SrcSinkHarness( [], 0, 0 )
+  model.elaborate()
+  profiler = ValRdyProfiler( SimulationTool( model ) )
+
+  # Connected bundles are one channel reachable through all its paths
+
+  paths = set( profiler._paths )
+  assert set( [ 'top.src.out', 'top.sink.in_',
+                'top.src.src.out', 'top.sink.sink.in_' ] ) <= paths
+  assert profiler._paths[ 'top.src.out'  ] is \
+         profiler._paths[ 'top.sink.in_' ]
+
+  report = profiler.report()
+  assert 'top.src.out' in report
+  assert 'top.sink.in_' in report[ 'top.src.out' ]['paths']
+  assert len( report ) == len( profiler.channels )
+
+  with pytest.raises( KeyError ):
+    profiler.match( 'top.src.out', 'top.nothing' )
+
+#-------------------------------------------------------------------------
+# test_fire_stall_idle
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'src_delay, sink_delay', [
+  ( 0, 0 ), ( 0, 5 ), ( 5, 0 ),
+])
+def test_fire_stall_idle( src_delay, sink_delay ):
+
+  msgs = [ Bits( 16, i ) for i in range( 20 ) ]
+  sim, profiler = run_profiled( SrcSinkHarness( msgs, src_delay, sink_delay ) )
+
+  s = profiler.report()[ 'top.src.out' ]
+
+  assert s['fire'] == len( msgs )
+  assert s['fire'] + s['stall'] + s['idle'] == s['cycles']
+  assert s['cycles'] == profiler.cycles
+  assert s['nbits'] == 16
+  assert s['bandwidth'] == pytest.approx( 16 * s['throughput'] )
+
+  # The inner source always has a message, it is only stalled by the
+  # random delay; the sink delay stalls the connecting channel
+
+  if sink_delay: assert s['stall'] > 0
+  else:          assert s['stall'] == 0
+
+  if not src_delay and not sink_delay:
+    assert s['idle'] <= 1
+
+  print()
+  print( profiler.format() )
+
+#-------------------------------------------------------------------------
+# test_latency
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'latency', [ 0, 3 ] )
+def test_latency( latency ):
+
+  src_msgs  = []
+  sink_msgs = []
+  for i in range( 10 ):
+    src_msgs .append( req ( 'wr', i, 0x1000+4*i, 0, i ) )
+    sink_msgs.append( resp( 'wr', i, 0, 0 ) )
+
+  sim, profiler = run_profiled( MemHarness( src_msgs, sink_msgs, latency ),
+                                match=True )
+
+  stats = profiler.latency()
+  assert stats.keys() == [ ( 'top.src.out', 'top.mem.resps[0]' ) ]
+
+  s = stats.values()[0]
+  assert s['count'] == len( src_msgs )
+  assert s['unmatched'] == 0
+  assert s['outstanding'] == 0
+  assert s['min'] == s['max'] == latency + 1
+  assert s['histogram'] == { latency + 1 : len( src_msgs ) }
+  assert s['occupancy'] > 0
+
+  print()
+  print( profiler.format() )
+
+def test_latency_in_order():
+
+  msgs = [ Bits( 16, i ) for i in range( 10 ) ]
+  model = SrcSinkHarness( msgs, 0, 0 )
+  model.elaborate()
+  sim      = SimulationTool( model )
+  profiler = ValRdyProfiler( sim )
+
+  # Pair the inner source and sink, the latency is the time through the
+  # random delays
+
+  profiler.match( 'top.src.src.out', 'top.sink.sink.in_' )
+
+  sim.reset()
+  while not model.done():
+    sim.cycle()
+
+  s = profiler.latency().values()[0]
+  assert s['count'] == len( msgs )
+  assert s['min'] == s['max']
@@ -0,0 +1,313 @@
+#=========================================================================
+# ValRdyRecorder.py
+#=========================================================================
+# Message-level transaction log of selected val/rdy interfaces.
+#
+# The recorder appends a record for every message transferred on the
+# recorded interfaces (i.e., every cycle in which val and rdy are both
+# high) to a binary file. Each record holds the cycle, the id of the
+# interface and the raw message bits, stored in the fixed-width layout of
+# the message type used by pack_many() (see pymtl/datatypes/serialize.py):
+#
+#   header : magic, version, number of interfaces, and for each interface
+#            its message bitwidth and hierarchy path
+#   record : cycle (uint32), interface id (uint16), message bytes
+#
+# Records are only ever appended, so a log which was cut short (e.g., the
+# simulation crashed) can still be read up to its last complete record.
+# The log is much smaller than a VCD of the same interfaces, and the
+# messages of an interface can be replayed into a TestSource:
+#
+#   recorder = ValRdyRecorder( sim, 'txns.bin', [ 'top.mem.reqs*' ] )
+#   ...
+#   recorder.close()
+#
+#   log  = ValRdyLog( 'txns.bin', { 'top.mem.reqs[0]' : MemReqMsg4B() } )
+#   msgs = log.select( 'top.mem.reqs[0]', start=100, stop=200 ).msgs()
+#   src  = TestSource( MemReqMsg4B(), msgs )
+
+import mmap
+import array
+import struct
+import fnmatch
+import collections
+
+from pymtl                     import Bits, pack_many
+from pymtl.datatypes.serialize import PackedBits
+from ValRdyProfiler            import find_valrdy_channels
+
+_header_fmt    = '<8sII'
+_header_size   = struct.calcsize( _header_fmt )
+_header_magic  = b'PYMTLTXN'
+_version       = 1
+
+_ifc_fmt       = '<IH'
+_ifc_size      = struct.calcsize( _ifc_fmt )
+
+_record_fmt    = '<IH'
+_record_size   = struct.calcsize( _record_fmt )
+_record_struct = struct.Struct( _record_fmt )
+
+#-------------------------------------------------------------------------
+# _match_paths
+#-------------------------------------------------------------------------
+# Return the names matching one or several fnmatch patterns, in order.
+# Names are also matched exactly since the brackets of list elements
+# (e.g., reqs[0]) are character classes in patterns.
+def _match_paths( names, patterns ):
+  if isinstance( patterns, basestring ):
+    patterns = [ patterns ]
+  return [ x for x in names
+           if any( x == p or fnmatch.fnmatchcase( x, p ) for p in patterns ) ]
+
+#-------------------------------------------------------------------------
+# ValRdyRecorder
+#-------------------------------------------------------------------------
+class ValRdyRecorder( object ):
+
+  #-----------------------------------------------------------------------
+  # __init__
+  #-----------------------------------------------------------------------
+  # interfaces is a list of hierarchy paths or fnmatch patterns (e.g.,
+  # 'top.mem.*'), all interfaces are recorded by default. Interfaces are
+  # recorded once under the name of their channel (see ValRdyProfiler.py)
+  # even if several of their paths match.
+  def __init__( self, sim, filename, interfaces=None ):
+
+    self.sim      = sim
+    self.model    = sim.model
+    self.filename = filename
+    self.count    = 0
+
+    channels, paths = find_valrdy_channels( self.model )
+
+    selected = paths.keys()
+    if interfaces is not None:
+      selected = _match_paths( selected, interfaces )
+
+    self.channels   = []
+    self.interfaces = []
+    for path in selected:
+      channel = paths[ path ]
+      if channel not in self.channels:
+        self.channels.append( channel )
+        self.interfaces.append( channel.path )
+
+    if len( self.channels ) > 0xffff:
+      raise ValueError( 'Cannot record more than 65535 interfaces!' )
+
+    # Write the header
+
+    self._fd = open( filename, 'wb' )
+    self._fd.write( struct.pack( _header_fmt, _header_magic, _version,
+                                 len( self.channels ) ) )
+    for path, channel in zip( self.interfaces, self.channels ):
+      self._fd.write( struct.pack( _ifc_fmt, channel.nbits, len( path ) ) )
+      self._fd.write( path )
+
+    sim._edge_callbacks.append( self._sample )
+
+  #-----------------------------------------------------------------------
+  # _sample
+  #-----------------------------------------------------------------------
+  # Called at every rising clock edge, append a record for every fired
+  # handshake.
+  def _sample( self ):
+
+    if self.model.reset._uint or self._fd is None:
+      return
+
+    cycle = self.sim.ncycles
+    for i, channel in enumerate( self.channels ):
+      if channel.val._uint and channel.rdy._uint:
+        self._fd.write( _record_struct.pack( cycle, i ) +
+                        pack_many( [ channel.msg ] ) )
+        self.count += 1
+
+  #-----------------------------------------------------------------------
+  # flush
+  #-----------------------------------------------------------------------
+  def flush( self ):
+    if self._fd is not None:
+      self._fd.flush()
+
+  #-----------------------------------------------------------------------
+  # close
+  #-----------------------------------------------------------------------
+  # Stop recording and close the log.
+  def close( self ):
+    if self._fd is not None:
+      self._fd.close()
+      self._fd = None
+
+  def __del__( self ):
+    self.close()
+
+#-------------------------------------------------------------------------
+# Transaction
+#-------------------------------------------------------------------------
+Transaction = collections.namedtuple( 'Transaction', 'cycle interface msg' )
+
+#-------------------------------------------------------------------------
+# ValRdyLog
+#-------------------------------------------------------------------------
+class ValRdyLog( collections.Sequence ):
+  '''Reader for transaction logs written by ValRdyRecorder.
+
+  The log is mapped into memory and only the record headers are read
+  when it is opened, messages are decoded into new dtype instances when
+  they are accessed. dtypes maps interface paths to message types (Bits
+  or BitStruct instances, or bitwidths), messages of other interfaces
+  are decoded as Bits.
+  '''
+
+  def __init__( self, filename, dtypes=None ):
+
+    with open( filename, 'rb' ) as fd:
+
+      header = fd.read( _header_size )
+      if len( header ) < _header_size or not header.startswith( _header_magic ):
+        raise ValueError( '{} is not a transaction log!'.format( filename ) )
+
+      magic, version, ninterfaces = struct.unpack( _header_fmt, header )
+      if version != _version:
+        raise ValueError( 'Unsupported transaction log version {} in {}!'
+                          .format( version, filename ) )
+
+      buf = mmap.mmap( fd.fileno(), 0, access=mmap.ACCESS_READ )
+
+    # Interface table
+
+    self.interfaces = []
+    self.nbits      = []
+    offset = _header_size
+    for i in range( ninterfaces ):
+      nbits, size = struct.unpack_from( _ifc_fmt, buf, offset )
+      offset += _ifc_size
+      self.interfaces.append( str( buf[ offset:offset+size ] ) )
+      self.nbits.append( nbits )
+      offset += size
+
+    dtypes = dtypes or {}
+    for name in dtypes:
+      if name not in self.interfaces:
+        raise KeyError( 'No interface named "{}" in {}!'.format( name,
+                                                                 filename ) )
+
+    self.dtypes = []
+    for name, nbits in zip( self.interfaces, self.nbits ):
+      dtype = dtypes.get( name, nbits )
+      if isinstance( dtype, (int, long) ):
+        dtype = Bits( dtype )
+      if dtype.nbits != nbits:
+        raise ValueError( '{} carries {}-bit messages, not {}-bit messages!'
+                          .format( name, nbits, dtype.nbits ) )
+      self.dtypes.append( dtype )
+
+    # Index the records, an incomplete last record is ignored
+
+    nbytes = [ ( x + 7 ) // 8 for x in self.nbits ]
+
+    self._buf     = buf
+    self._cycles  = array.array( 'L' )
+    self._ids     = array.array( 'H' )
+    self._offsets = array.array( 'L' )
+
+    size   = len( buf )
+    unpack = _record_struct.unpack_from
+    while offset + _record_size <= size:
+      cycle, ifc = unpack( buf, offset )
+      offset += _record_size
+      if ifc >= ninterfaces or offset + nbytes[ ifc ] > size:
+        break
+      self._cycles .append( cycle  )
+      self._ids    .append( ifc    )
+      self._offsets.append( offset )
+      offset += nbytes[ ifc ]
+
+  #-----------------------------------------------------------------------
+  # Sequence Methods
+  #-----------------------------------------------------------------------
+
+  def __len__( self ):
+    return len( self._cycles )
+
+  def __getitem__( self, idx ):
+
+    if isinstance( idx, slice ):
+      return [ self[i] for i in xrange( *idx.indices( len( self ) ) ) ]
+
+    return Transaction( self._cycles[ idx ],
+                        self.interfaces[ self._ids[ idx ] ],
+                        self.msg( idx ) )
+
+  #-----------------------------------------------------------------------
+  # msg
+  #-----------------------------------------------------------------------
+  # Decode the message of a single record.
+  def msg( self, idx ):
+    dtype = self.dtypes[ self._ids[ idx ] ]
+    return PackedBits( self._buf, dtype, self._offsets[ idx ], 1 )[0]
+
+  #-----------------------------------------------------------------------
+  # select
+  #-----------------------------------------------------------------------
+  def select( self, interfaces=None, start=None, stop=None ):
+    '''Return the records of some interfaces (paths or fnmatch patterns)
+    in the cycle range [start, stop) as a lazy ValRdyLogView.'''
+
+    ids = range( len( self.interfaces ) )
+    if interfaces is not None:
+      names = set( _match_paths( self.interfaces, interfaces ) )
+      ids   = [ i for i in ids if self.interfaces[i] in names ]
+    ids = set( ids )
+
+    cycles = self._cycles
+    idxs   = [ i for i, ifc in enumerate( self._ids )
+               if ifc in ids and ( start is None or cycles[i] >= start )
+                             and ( stop  is None or cycles[i] <  stop  ) ]
+
+    return ValRdyLogView( self, idxs )
+
+  def __repr__( self ):
+    return 'ValRdyLog( {} interfaces, {} transactions )'.format(
+           len( self.interfaces ), len( self ) )
+
+#-------------------------------------------------------------------------
+# ValRdyLogView
+#-------------------------------------------------------------------------
+class ValRdyLogView( collections.Sequence ):
+  'Lazy sequence of a subset of the records of a ValRdyLog.'
+
+  def __init__( self, log, idxs ):
+    self.log   = log
+    self._idxs = idxs
+
+  def __len__( self ):
+    return len( self._idxs )
+
+  def __getitem__( self, idx ):
+    if isinstance( idx, slice ):
+      return ValRdyLogView( self.log, self._idxs[ idx ] )
+    return self.log[ self._idxs[ idx ] ]
+
+  def cycles( self ):
+    return [ self.log._cycles[i] for i in self._idxs ]
+
+  def msgs( self ):
+    'Return the messages as a lazy sequence, e.g., to feed a TestSource.'
+    return _MsgView( self.log, self._idxs )
+
+class _MsgView( collections.Sequence ):
+
+  def __init__( self, log, idxs ):
+    self.log   = log
+    self._idxs = idxs
+
+  def __len__( self ):
+    return len( self._idxs )
+
+  def __getitem__( self, idx ):
+    if isinstance( idx, slice ):
+      return [ self.log.msg( i ) for i in self._idxs[ idx ] ]
+    return self.log.msg( self._idxs[ idx ] )
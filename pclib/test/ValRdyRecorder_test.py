@@ -0,0 +1,156 @@
+#=========================================================================
+# ValRdyRecorder_test.py
+#=========================================================================
+
+from __future__ import print_function
+
+import pytest
+
+from pymtl      import *
+from pclib.test import TestSource, TestSink
+from pclib.ifcs import MemReqMsg4B, MemRespMsg4B
+
+from ValRdyRecorder      import ValRdyRecorder, ValRdyLog
+from ValRdyProfiler_test import SrcSinkHarness, MemHarness
+from TestMemory_test     import req, resp
+
+def run_recorded( model, filename, interfaces=None ):
+
+  model.elaborate()
+  sim      = SimulationTool( model )
+  recorder = ValRdyRecorder( sim, filename, interfaces )
+
+  sim.reset()
+  while not model.done() and sim.ncycles < 1000:
+    sim.cycle()
+
+  assert model.done()
+  recorder.close()
+  return recorder
+
+def mem_msgs( n ):
+  src_msgs  = [ req ( 'wr', i, 0x1000+4*i, 0, i ) for i in range( n ) ]
+  sink_msgs = [ resp( 'wr', i, 0, 0 )             for i in range( n ) ]
+  return src_msgs, sink_msgs
+
+#-------------------------------------------------------------------------
+# test_record
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits', [ 8, 16, 45 ] )
+def test_record( tmpdir, nbits ):
+
+  msgs     = [ Bits( nbits, 3*i+1 ) for i in range( 20 ) ]
+  filename = str( tmpdir.join( 'txns.bin' ) )
+  recorder = run_recorded( SrcSinkHarness( msgs, 3, 3, nbits ), filename,
+                           [ 'top.sink.in_' ] )
+
+  # The interface is recorded under the first path of its channel
+
+  assert recorder.interfaces == [ 'top.src.out' ]
+  assert recorder.count == len( msgs )
+
+  log = ValRdyLog( filename )
+  assert log.interfaces == [ 'top.src.out' ]
+  assert log.nbits == [ nbits ]
+  assert len( log ) == len( msgs )
+  assert [ x.msg for x in log ] == msgs
+  assert all( x.interface == 'top.src.out' for x in log )
+
+  cycles = [ x.cycle for x in log ]
+  assert cycles == sorted( cycles )
+  assert len( set( cycles ) ) == len( cycles )
+
+#-------------------------------------------------------------------------
+# test_select
+#-------------------------------------------------------------------------
+
+def test_select( tmpdir ):
+
+  src_msgs, sink_msgs = mem_msgs( 10 )
+
+  filename = str( tmpdir.join( 'txns.bin' ) )
+  recorder = run_recorded( MemHarness( src_msgs, sink_msgs, 2 ), filename,
+                           [ 'top.mem.*' ] )
+
+  assert recorder.interfaces == [ 'top.src.out', 'top.mem.resps[0]' ]
+
+  log = ValRdyLog( filename, { 'top.src.out'      : MemReqMsg4B(),
+                               'top.mem.resps[0]' : MemRespMsg4B() } )
+  assert len( log ) == 20
+
+  # BitStructs are reconstructed with their fields
+
+  reqs = log.select( 'top.src.out' )
+  assert len( reqs ) == 10
+  assert [ int( x.opaque ) for x in reqs.msgs() ] == range( 10 )
+  assert reqs[3].msg.addr == 0x1000+4*3
+
+  resps = log.select( 'top.mem.resps*' )
+  assert list( resps.msgs() ) == sink_msgs
+
+  # Responses leave the memory three cycles after the requests
+
+  assert [ x + 3 for x in reqs.cycles() ] == resps.cycles()
+
+  # Cycle ranges
+
+  start  = reqs.cycles()[2]
+  window = log.select( start=start, stop=start+3 )
+  assert list( window ) == [ x for x in log if start <= x.cycle < start+3 ]
+  assert len( window ) == 5
+  assert len( window[2:] ) == 3
+
+  window = log.select( 'top.mem.resps[0]', stop=start+3 )
+  assert window.cycles() == resps.cycles()[:2]
+
+  with pytest.raises( ValueError ):
+    ValRdyLog( filename, { 'top.src.out' : MemRespMsg4B() } )
+  with pytest.raises( KeyError ):
+    ValRdyLog( filename, { 'top.nothing' : 8 } )
+
+#-------------------------------------------------------------------------
+# test_replay
+#-------------------------------------------------------------------------
+
+def test_replay( tmpdir ):
+
+  src_msgs, sink_msgs = mem_msgs( 10 )
+
+  filename = str( tmpdir.join( 'txns.bin' ) )
+  run_recorded( MemHarness( src_msgs, sink_msgs, 0 ), filename )
+
+  # Replay the recorded requests through a new memory
+
+  log  = ValRdyLog( filename, { 'top.src.out' : MemReqMsg4B() } )
+  msgs = log.select( 'top.src.out' ).msgs()
+
+  model = MemHarness( msgs, sink_msgs, 1 )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  while not model.done() and sim.ncycles < 1000:
+    sim.cycle()
+  assert model.done()
+
+#-------------------------------------------------------------------------
+# test_truncated
+#-------------------------------------------------------------------------
+
+def test_truncated( tmpdir ):
+
+  msgs     = [ Bits( 16, i ) for i in range( 10 ) ]
+  filename = str( tmpdir.join( 'txns.bin' ) )
+  run_recorded( SrcSinkHarness( msgs, 0, 0 ), filename, 'top.src.out' )
+
+  # A partially written last record is ignored
+
+  data = open( filename, 'rb' ).read()
+  open( filename, 'wb' ).write( data[:-1] )
+
+  log = ValRdyLog( filename )
+  assert [ x.msg for x in log ] == msgs[:-1]
+
+  open( filename, 'wb' ).write( b'garbage' )
+  with pytest.raises( ValueError ):
+    ValRdyLog( filename )
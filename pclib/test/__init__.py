@@ -13,6 +13,9 @@ from TestSrcSinkSim      import TestSrcSinkSim
 from TestMemory          import TestMemory
 from SparseMemoryImage   import SparseMemoryImage
 
+from ValRdyProfiler      import ValRdyProfiler
+from ValRdyRecorder      import ValRdyRecorder, ValRdyLog
+
 from test_utils import mk_test_case_table
 from test_utils import run_test_vector_sim
 from test_utils import run_sim
@@ -75,11 +75,57 @@ def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
   sim.cycle()
   sim.cycle()
 
+#-------------------------------------------------------------------------
+# get_test_vector_port
+#-------------------------------------------------------------------------
+# Return the port of a model named in the header of a test vector table.
+
+def get_test_vector_port( model, port_name ):
+
+  # Special case for lists of ports
+  if '[' in port_name:
+    m = re.match( r'(\w+)\[(\d+)\]', port_name )
+    if not m:
+      raise Exception("Could not parse port name: {}".format(port_name))
+    return getattr( model, m.group(1) )[int(m.group(2))]
+  else:
+    return getattr( model, port_name )
+
+#-------------------------------------------------------------------------
+# check_test_vector_output
+#-------------------------------------------------------------------------
+
+def check_test_vector_output( row_num, port_name, ref_value, out_value ):
+
+  if ( ref_value != '?' ) and ( out_value != ref_value ):
+
+    error_msg = """
+ run_test_vector_sim received an incorrect value!
+  - row number     : {row_number}
+  - port name      : {port_name}
+  - expected value : {expected_msg}
+  - actual value   : {actual_msg}
+"""
+    raise RunTestVectorSimError( error_msg.format(
+      row_number   = row_num,
+      port_name    = port_name,
+      expected_msg = ref_value,
+      actual_msg   = out_value
+    ))
+
 #-------------------------------------------------------------------------
 # run_test_vector_sim
 #-------------------------------------------------------------------------
+# Models which can simulate several cycles in a single call (i.e.,
+# models translated with TranslationTool which provide run_cycles) run
+# all of the test vectors at once, since the whole testbench is known
+# ahead of time. By default this is only done if nothing needs to see
+# every cycle, i.e., there is no VCD dumping and the line trace is off
+# (see SimulationTool.can_skip_cycles). Setting batch to True or False
+# forces batched or cycle by cycle simulation.
 
-def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False ):
+def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False,
+                         batch=None ):
 
   # First row in test vectors contains port names
 
@@ -110,6 +156,29 @@ def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False
 
   # Run the simulation
 
+  if batch is None:
+    batch = hasattr( model, 'run_cycles' ) and sim.can_skip_cycles()
+
+  if batch:
+    assert hasattr( model, 'run_cycles' ), \
+      "Batched simulation requires a model with run_cycles!"
+    run_test_vector_batch( sim, model, port_names, test_vectors )
+  else:
+    run_test_vector_cycles( sim, model, port_names, test_vectors )
+
+  # Extra ticks to make VCD easier to read
+
+  sim.cycle()
+  sim.cycle()
+  sim.cycle()
+
+#-------------------------------------------------------------------------
+# run_test_vector_cycles
+#-------------------------------------------------------------------------
+# Apply the test vectors and check the outputs one cycle at a time.
+
+def run_test_vector_cycles( sim, model, port_names, test_vectors ):
+
   row_num = 0
   for row in test_vectors:
     row_num += 1
@@ -118,15 +187,7 @@ def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False
 
     for port_name, in_value in zip( port_names, row ):
       if port_name[-1] != "*":
-
-        # Special case for lists of ports
-        if '[' in port_name:
-          m = re.match( r'(\w+)\[(\d+)\]', port_name )
-          if not m:
-            raise Exception("Could not parse port name: {}".format(port_name))
-          getattr( model, m.group(1) )[int(m.group(2))].value = in_value
-        else:
-          getattr( model, port_name ).value = in_value
+        get_test_vector_port( model, port_name ).value = in_value
 
     # Evaluate combinational concurrent blocks
 
@@ -140,39 +201,59 @@ def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False
 
     for port_name, ref_value in zip( port_names, row ):
       if port_name[-1] == "*":
-
-        # Special case for lists of ports
-        if '[' in port_name:
-          m = re.match( r'(\w+)\[(\d+)\]', port_name[0:-1] )
-          if not m:
-            raise Exception("Could not parse port name: {}".format(port_name))
-          out_value = getattr( model, m.group(1) )[int(m.group(2))]
-        else:
-          out_value = getattr( model, port_name[0:-1] )
-
-        if ( ref_value != '?' ) and ( out_value != ref_value ):
-
-          error_msg = """
- run_test_vector_sim received an incorrect value!
-  - row number     : {row_number}
-  - port name      : {port_name}
-  - expected value : {expected_msg}
-  - actual value   : {actual_msg}
-"""
-          raise RunTestVectorSimError( error_msg.format(
-            row_number   = row_num,
-            port_name    = port_name,
-            expected_msg = ref_value,
-            actual_msg   = out_value
-          ))
+        out_value = get_test_vector_port( model, port_name[0:-1] )
+        check_test_vector_output( row_num, port_name, ref_value, out_value )
 
     # Tick the simulation
 
     sim.cycle()
 
-  # Extra ticks to make VCD easier to read
+#-------------------------------------------------------------------------
+# run_test_vector_batch
+#-------------------------------------------------------------------------
+# Pack the inputs of every cycle, simulate all of the cycles with
+# run_cycles, and then check the outputs of every cycle. Inputs which are
+# not in the test vectors keep their current value.
+
+def run_test_vector_batch( sim, model, port_names, test_vectors ):
+
+  inports  = model.run_inports()
+  outports = model.run_outports()
+
+  def port_index( ports, port_name ):
+    port = get_test_vector_port( model, port_name )
+    for i, x in enumerate( ports ):
+      if x is port:
+        return i
+    raise Exception("Could not find port: {}".format(port_name))
+
+  in_columns  = []
+  out_columns = []
+  for col, port_name in enumerate( port_names ):
+    if port_name[-1] != "*":
+      in_columns.append( ( col, port_index( inports, port_name ) ) )
+    else:
+      out_columns.append( ( col, port_index( outports, port_name[0:-1] ) ) )
+
+  # Pack the inputs of every cycle
+
+  values     = [ int( x ) for x in inports ]
+  in_vectors = []
+  for row in test_vectors:
+    for col, idx in in_columns:
+      values[idx] = row[col]
+    in_vectors.append( list( values ) )
 
-  sim.cycle()
-  sim.cycle()
-  sim.cycle()
+  # Simulate all of the cycles in one call
+
+  out_vectors = model.run_cycles( in_vectors )
+  sim.skip_cycles( len( in_vectors ) )
 
+  # Check test outputs
+
+  row_num = 0
+  for row, out_values in zip( test_vectors, out_vectors ):
+    row_num += 1
+    for col, idx in out_columns:
+      check_test_vector_output( row_num, port_names[col], row[col],
+                                out_values[idx] )
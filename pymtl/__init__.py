@@ -20,9 +20,12 @@ from datatypes.Bits        import Bits
 from datatypes.BitStruct   import BitStruct, BitStructDefinition, BitField
 from datatypes.helpers     import (
     get_nbits, clog2, zext, sext, concat,
-    reduce_and, reduce_or, reduce_xor
+    reduce_and, reduce_or, reduce_xor,
+    make_concat, make_zext, make_sext
 )
 from datatypes.SignalValue import CreateWrappedClass
+from datatypes.FrozenBits  import freeze, thaw
+from datatypes.serialize   import pack_many, unpack_many, save_many, load_many
 
 #-----------------------------------------------------------------------
 # tools
@@ -30,6 +33,8 @@ from datatypes.SignalValue import CreateWrappedClass
 
 from tools.simulation.SimulationTool import SimulationTool
 from tools.translation.verilator_sim import TranslationTool
+from tools.translation.verilator_pool import VerilatorPool
+from tools.translation.fuse           import fuse_translated
 from tools.translation.cpp_sim       import get_cpp
 from tools.integration.verilog       import VerilogModel
 from tools.integration.systemc       import SystemCModel
@@ -79,9 +84,17 @@ __all__ = [ # Model Construction
             # Tools
             'SimulationTool',
             'TranslationTool',
+            'VerilatorPool',
+            'fuse_translated',
             # TEMPORARY
             'get_cpp',
             'CreateWrappedClass',
+            'freeze',
+            'thaw',
+            'pack_many',
+            'unpack_many',
+            'save_many',
+            'load_many',
             # Helper Functions
             'get_nbits',
             'clog2',
@@ -91,6 +104,9 @@ __all__ = [ # Model Construction
             'reduce_and',
             'reduce_or',
             'reduce_xor',
+            'make_concat',
+            'make_zext',
+            'make_sext',
             # py.test decorators
             'requires_xcc',
             'requires_vmh',
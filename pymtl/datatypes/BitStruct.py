@@ -6,6 +6,8 @@ from __future__ import print_function
 
 from Bits import Bits
 
+import serialize
+
 #=======================================================================
 # MetaBitStruct
 #=======================================================================
@@ -72,6 +74,7 @@ class MetaBitStruct( type ):
     name_sufx       = '_'.join(str(x) for x in args)
     class_name      = "{}_{}".format( name_prfx, name_sufx )
     bitstruct_class = type( class_name, ( BitStruct, ), self._classdict )
+    bitstruct_class._definition = self
 
     # Keep track of bit positions for each bitfield
     start_pos = 0
@@ -133,6 +136,35 @@ class MetaBitStruct( type ):
 class BitStructDefinition( object ):
   __metaclass__ = MetaBitStruct
 
+  # Bulk serialization of message streams, see serialize.py. This allows
+  # MemReqMsg.pack_many( msgs ) without instantiating the message type.
+  # The dtype defaults to the type of the first message, which must be
+  # a message of this definition, or otherwise to the message type
+  # created by instantiating the definition without arguments.
+
+  @classmethod
+  def pack_many( cls, values, dtype = None ):
+    'Pack a sequence of messages into bytes, see serialize.pack_many().'
+    if dtype is None:
+      dtype = cls._get_dtype( values[0] if len( values ) else None )
+    return serialize.pack_many( values, dtype )
+
+  @classmethod
+  def unpack_many( cls, buf, dtype = None, count = None ):
+    'Return a lazy sequence of messages, see serialize.unpack_many().'
+    if dtype is None:
+      dtype = cls._get_dtype()
+    return serialize.unpack_many( buf, dtype, count )
+
+  @classmethod
+  def _get_dtype( cls, msg = None ):
+    if isinstance( msg, BitStruct ):
+      if getattr( msg, '_definition', None ) is not cls:
+        raise TypeError( 'Cannot serialize {} messages as {} messages!'
+                         .format( type( msg ).__name__, cls.__name__ ) )
+      return msg
+    return cls()
+
 #=======================================================================
 # BitField
 #=======================================================================
@@ -6,6 +6,7 @@
 from SignalValue import SignalValue
 
 import copy
+import functools
 
 #-----------------------------------------------------------------------
 # _get_nbits
@@ -15,6 +16,21 @@ def _get_nbits( N ):
   if N > 0: return N.bit_length()
   else:     return N.bit_length() + 1
 
+#-----------------------------------------------------------------------
+# _dtypemethod
+#-----------------------------------------------------------------------
+# Decorator for methods which can be called both on a Bits value used as
+# a type and on the class itself. The method receives the value, or None
+# when it is called on the class.
+class _dtypemethod( object ):
+
+  def __init__( self, func ):
+    self.func    = func
+    self.__doc__ = func.__doc__
+
+  def __get__( self, obj, cls ):
+    return functools.partial( self.func, obj )
+
 #-----------------------------------------------------------------------
 # Bits
 #-----------------------------------------------------------------------
@@ -462,7 +478,36 @@ class Bits( SignalValue ):
     return Bits( new_width, self._uint )
 
   def _sext( self, new_width ):
-    return Bits( new_width, self.int() )
+    uint = self._uint
+    if uint >> ( self.nbits - 1 ):
+      uint |= ( (1 << int( new_width )) - 1 ) ^ self._mask
+    return Bits( new_width, uint )
+
+  #----------------------------------------------------------------------
+  # Serialization
+  #----------------------------------------------------------------------
+  # Delegate to the functions in serialize.py, which is imported lazily
+  # because it imports Bits. When called on a Bits value used as a type,
+  # e.g. Bits( 8 ).pack_many( values ) or dtype.unpack_many( buf ), the
+  # dtype defaults to that value.
+
+  @_dtypemethod
+  def pack_many( self, values, dtype = None ):
+    'Pack a sequence of values into bytes, see serialize.pack_many().'
+    import serialize
+    if dtype is None:
+      dtype = self
+    return serialize.pack_many( values, dtype )
+
+  @_dtypemethod
+  def unpack_many( self, buf, dtype = None, count = None ):
+    'Return a lazy sequence of messages, see serialize.unpack_many().'
+    import serialize
+    if dtype is None:
+      dtype = self
+    if dtype is None:
+      raise TypeError( 'A dtype must be provided to unpack messages!' )
+    return serialize.unpack_many( buf, dtype, count )
 
 
 #-----------------------------------------------------------------------
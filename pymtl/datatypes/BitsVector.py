@@ -0,0 +1,504 @@
+#=======================================================================
+# BitsVector.py
+#=======================================================================
+# Module containing the BitsVector class.
+#
+# A BitsVector holds an entire array of fixed-bitwidth values and
+# supports the Bits operators (arithmetic, bitwise, shifts, slicing,
+# extension, concatenation and BitStruct field access) on the whole
+# array at once. This is intended for generating and checking large
+# stimulus sets in test harnesses, where building Python lists of Bits
+# objects one element at a time is prohibitively slow.
+#
+# Values of 64 bits or less are stored in a NumPy uint64 array, wider
+# values are stored in a NumPy object array of Python integers.
+#
+# NOTE: NumPy is an optional dependency of PyMTL, so this module is not
+# imported by the top-level pymtl package.
+
+import numpy
+
+from Bits import Bits, _get_nbits
+
+#-----------------------------------------------------------------------
+# _storage_type
+#-----------------------------------------------------------------------
+# Return the NumPy dtype used to store values of the given bitwidth.
+def _storage_type( nbits ):
+  return numpy.uint64 if nbits <= 64 else object
+
+#-----------------------------------------------------------------------
+# _to_storage
+#-----------------------------------------------------------------------
+# Mask the values in a NumPy array to nbits and convert the array to
+# the storage type for that bitwidth. Masking happens before the
+# conversion so that object arrays of wide values can be narrowed.
+def _to_storage( data, nbits ):
+
+  mask = (1 << nbits) - 1
+
+  if data.dtype == object or nbits > 64:
+    data = data.astype( object, copy=False ) & mask
+    if nbits <= 64:
+      data = data.astype( numpy.uint64 )
+    return data
+
+  data = data.astype( numpy.uint64, copy=False )
+  if nbits < 64:
+    data = data & numpy.uint64( mask )
+  return data
+
+#-----------------------------------------------------------------------
+# _scalar
+#-----------------------------------------------------------------------
+# Convert a Python integer into a scalar compatible with the storage
+# domain of data. Scalars are wrapped modulo 2**64 for uint64 storage,
+# which gives the correct result once the output is masked to nbits.
+def _scalar( value, data ):
+  if data.dtype == object:
+    return value
+  return numpy.uint64( value & 0xffffffffffffffff )
+
+#-----------------------------------------------------------------------
+# BitsVector
+#-----------------------------------------------------------------------
+class BitsVector( object ):
+  'Array of fixed bitwidth values supporting whole-array Bits operations.'
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  # The dtype parameter follows the same convention as Signal: either an
+  # integer bitwidth, or a Bits/BitStruct instance acting as a type.
+  def __init__( self, dtype, values = (), trunc = False ):
+
+    if isinstance( dtype, (int, long) ):
+      dtype = Bits( dtype )
+
+    self.dtype = dtype
+    self.nbits = dtype.nbits
+    self._mask = (1 << self.nbits) - 1
+    self._max  = self._mask
+    self._min  = -2**(self.nbits - 1) if self.nbits > 1 else 0
+
+    # Convert sequences (possibly containing Bits) into a NumPy array,
+    # checking that every value can be represented with nbits.
+
+    if isinstance( values, BitsVector ):
+      values = values._data
+
+    # Only integer arrays are accepted, NumPy would otherwise silently
+    # truncate floating point values when converting them to storage.
+
+    if isinstance( values, numpy.ndarray ) and values.dtype.kind not in 'biuO':
+      raise TypeError( 'BitsVector values must be integers, got a NumPy '
+                       'array of dtype {}!'.format( values.dtype ) )
+
+    if not isinstance( values, numpy.ndarray ):
+      values = [ int( x ) for x in values ]
+      low    = min( values ) if values else 0
+      high   = max( values ) if values else 0
+      values = numpy.array( values, dtype=object )
+    elif values.size:
+      low    = int( values.min() )
+      high   = int( values.max() )
+    else:
+      low = high = 0
+
+    if not trunc and not (self._min <= low and high <= self._max):
+      value = low if low < self._min else high
+      raise ValueError(
+        'Value is too big to be represented with Bits({})!\n'
+        '({} bits are needed to represent value = {} in two\'s complement.)'
+        .format( self.nbits, _get_nbits(value), value )
+      )
+
+    self._data = _to_storage( values, self.nbits )
+
+  #---------------------------------------------------------------------
+  # zeros
+  #---------------------------------------------------------------------
+  @classmethod
+  def zeros( cls, dtype, size ):
+    'Return a BitsVector of size elements, all set to zero.'
+    nbits = dtype if isinstance( dtype, (int, long) ) else dtype.nbits
+    return cls( dtype, numpy.zeros( size, dtype=_storage_type( nbits ) ) )
+
+  #---------------------------------------------------------------------
+  # from_bits
+  #---------------------------------------------------------------------
+  @classmethod
+  def from_bits( cls, values, dtype = None ):
+    'Create a BitsVector from a sequence of Bits or BitStruct objects.'
+    if dtype is None:
+      dtype = values[0]
+    return cls( dtype, values )
+
+  #---------------------------------------------------------------------
+  # from_fields
+  #---------------------------------------------------------------------
+  @classmethod
+  def from_fields( cls, dtype, **fields ):
+    '''Pack per-field arrays into a BitsVector of BitStruct messages.
+
+    All fields must have the same number of elements. Fields which are
+    not provided are set to zero. For example:
+
+    >>> BitsVector.from_fields( MemReqMsg(8,32,32), addr=addrs, data=data )
+    '''
+
+    size = None
+    for name, values in fields.items():
+      if size is None:
+        size = len( values )
+      elif len( values ) != size:
+        raise ValueError( 'Field "{}" has {} elements, expected {}!'
+                          .format( name, len( values ), size ) )
+
+    vec = cls.zeros( dtype, size or 0 )
+    for name, values in fields.items():
+      vec.set_field( name, values )
+    return vec
+
+  #---------------------------------------------------------------------
+  # _new
+  #---------------------------------------------------------------------
+  # Create a new BitsVector from an already computed NumPy array without
+  # range checking, truncating the values to nbits.
+  def _new( self, nbits, data, dtype = None ):
+    vec       = BitsVector.__new__( BitsVector )
+    vec.dtype = dtype if dtype is not None else Bits( nbits )
+    vec.nbits = nbits
+    vec._mask = (1 << nbits) - 1
+    vec._max  = vec._mask
+    vec._min  = -2**(nbits - 1) if nbits > 1 else 0
+    vec._data = _to_storage( data, nbits )
+    return vec
+
+  #---------------------------------------------------------------------
+  # _operand
+  #---------------------------------------------------------------------
+  # Return the other operand of a binary operator as either a NumPy
+  # array or a Python integer, along with its bitwidth (None for plain
+  # integers, which like Bits adopt the width of self).
+  def _operand( self, other ):
+    if isinstance( other, BitsVector ):
+      return other._data, other.nbits
+    if isinstance( other, Bits ):
+      return other._uint, other.nbits
+    if isinstance( other, (list, tuple, numpy.ndarray) ):
+      return BitsVector( self.nbits, other, trunc=True )._data, self.nbits
+    return int( other ), None
+
+  #---------------------------------------------------------------------
+  # _binop
+  #---------------------------------------------------------------------
+  # Apply op element-wise, producing a result of width nbits. Operations
+  # are carried out in uint64 when both the operands and the result fit
+  # in 64 bits, otherwise they are carried out on Python integers.
+  def _binop( self, other, op, nbits ):
+
+    a        = self._data
+    b, _     = self._operand( other )
+    b_is_arr = isinstance( b, numpy.ndarray )
+
+    native = ( nbits <= 64 and a.dtype != object and
+               not ( b_is_arr and b.dtype == object ) )
+
+    if not native:
+      a = a.astype( object )
+      if b_is_arr: b = b.astype( object )
+    elif not b_is_arr:
+      b = _scalar( b, a )
+
+    return self._new( nbits, op( a, b ) )
+
+  #---------------------------------------------------------------------
+  # _divop
+  #---------------------------------------------------------------------
+  # Division and modulo raise like Bits on a zero divisor instead of
+  # returning zero with a NumPy RuntimeWarning.
+  def _divop( self, other, op ):
+    b, _ = self._operand( other )
+    if numpy.any( b == 0 ):
+      raise ZeroDivisionError( 'integer division or modulo by zero' )
+    return self._binop( other, op, 2*self._width( other ) )
+
+  #---------------------------------------------------------------------
+  # _width
+  #---------------------------------------------------------------------
+  # Result width of a binary operator following the Bits semantics.
+  def _width( self, other ):
+    _, nbits = self._operand( other )
+    return max( self.nbits, nbits ) if nbits else self.nbits
+
+  #---------------------------------------------------------------------
+  # Conversion
+  #---------------------------------------------------------------------
+
+  def uint( self ):
+    'Return the unsigned values as a NumPy array.'
+    return self._data
+
+  def int( self ):
+    'Return the two\'s complement signed values as a NumPy array.'
+    data = self._data.astype( object )
+    sign = (data >> (self.nbits - 1)) & 1
+    ints = data - ( sign << self.nbits )
+    if self.nbits <= 64:
+      return ints.astype( numpy.int64 )
+    return ints
+
+  def uints( self ):
+    'Return the unsigned values as a list of Python integers.'
+    return [ int( x ) for x in self._data.tolist() ]
+
+  def to_bits( self ):
+    'Return a list of Bits (or BitStruct) objects, one per element.'
+    return [ self._make( x ) for x in self._data.tolist() ]
+
+  def _make( self, value ):
+    bits = self.dtype()
+    bits._uint = int( value )
+    return bits
+
+  #---------------------------------------------------------------------
+  # Container Methods
+  #---------------------------------------------------------------------
+
+  def __len__( self ):
+    return len( self._data )
+
+  def __iter__( self ):
+    for x in self._data.tolist():
+      yield self._make( x )
+
+  def __getitem__( self, idx ):
+    if isinstance( idx, (int, long, numpy.integer) ):
+      return self._make( self._data[ idx ] )
+    return self._new( self.nbits, self._data[ idx ], self.dtype )
+
+  def __setitem__( self, idx, value ):
+    b, _ = self._operand( value )
+    if isinstance( b, numpy.ndarray ):
+      self._data[ idx ] = b
+    else:
+      self._data[ idx ] = _scalar( b & self._mask, self._data )
+
+  def __getattr__( self, name ):
+    # Proxy attribute accesses to BitStruct fields of the dtype
+    if name in self.__dict__.get( 'dtype', Bits( 1 ) ).bitfields:
+      return self.get_field( name )
+    raise AttributeError( "'{}' object has no attribute '{}'"
+                          .format( self.__class__.__name__, name ) )
+
+  #---------------------------------------------------------------------
+  # Bit Fields
+  #---------------------------------------------------------------------
+
+  def _field_range( self, field ):
+    if isinstance( field, basestring ):
+      field = self.dtype.bitfields[ field ]
+    if not isinstance( field, slice ):
+      field = slice( field, field + 1 )
+    start = 0          if field.start is None else int( field.start )
+    stop  = self.nbits if field.stop  is None else int( field.stop  )
+    if not (0 <= start < stop <= self.nbits):
+      raise IndexError('Bits slice indices [{}:{}] out of range [0 - {}]'
+                       .format(start, stop, self.nbits) )
+    return start, stop
+
+  def get_field( self, field ):
+    '''Return a BitsVector containing a bit range of every element.
+
+    field may be a BitStruct field name, a slice or a bit index.
+    '''
+    start, stop = self._field_range( field )
+    data        = self._data
+    shamt       = _scalar( start, data )
+    return self._new( stop - start, data >> shamt )
+
+  def set_field( self, field, values ):
+    '''Write a bit range of every element.
+
+    field may be a BitStruct field name, a slice or a bit index. values
+    may be a BitsVector, a sequence or a single value for all elements.
+    '''
+    start, stop = self._field_range( field )
+    nbits       = stop - start
+    ones        = (1 << nbits) - 1
+    data        = self._data
+
+    if not isinstance( values, BitsVector ):
+      if isinstance( values, (list, tuple, numpy.ndarray) ):
+        values = BitsVector( nbits, values )
+      else:
+        values = self._new( nbits, numpy.full( len( data ), int( values ),
+                                               dtype=object ) )
+    elif values.nbits > nbits:
+      raise ValueError( 'Provided values are too big to fit in slice '
+                        '[{}:{}] ({} bits)!'.format( start, stop, nbits ) )
+
+    new = values._data
+    if data.dtype == object:
+      new = new.astype( object )
+    else:
+      new = new.astype( numpy.uint64 )
+
+    clear      = _scalar( self._mask & ~(ones << start), data )
+    shamt      = _scalar( start, data )
+    self._data = ( data & clear ) | ( new << shamt )
+
+  #---------------------------------------------------------------------
+  # Print Methods
+  #---------------------------------------------------------------------
+
+  def __repr__( self ):
+    num_chars = (((self.nbits-1)/4)+1)
+    values = self._data.tolist()
+    elems  = [ '0x' + '{:x}'.format( x ).zfill( num_chars )
+               for x in values[:8] ]
+    if len( values ) > 8:
+      elems.append( '...' )
+    return 'BitsVector( {}, [{}] )'.format( self.nbits, ', '.join( elems ) )
+
+  #----------------------------------------------------------------------
+  # Arithmetic Operators
+  #----------------------------------------------------------------------
+  # Result widths match the Bits operators, see Bits.py.
+
+  def __invert__( self ):
+    return self._new( self.nbits, ~self._data )
+
+  def __add__( self, other ):
+    return self._binop( other, numpy.add, self._width( other ) )
+
+  def __sub__( self, other ):
+    return self._binop( other, numpy.subtract, self._width( other ) )
+
+  def __mul__( self, other ):
+    return self._binop( other, numpy.multiply, 2*self._width( other ) )
+
+  def __radd__( self, other ):
+    return self.__add__( other )
+
+  def __rmul__( self, other ):
+    return self.__mul__( other )
+
+  def __div__( self, other ):
+    return self._divop( other, numpy.floor_divide )
+
+  def __floordiv__( self, other ):
+    return self._divop( other, numpy.floor_divide )
+
+  def __mod__( self, other ):
+    return self._divop( other, numpy.remainder )
+
+  #----------------------------------------------------------------------
+  # Shift Operators
+  #----------------------------------------------------------------------
+
+  def __lshift__( self, other ):
+    shamt = int( other )
+    if shamt >= self.nbits:
+      return self._new( self.nbits, numpy.zeros_like( self._data ) )
+    return self._binop( shamt, numpy.left_shift, self.nbits )
+
+  def __rshift__( self, other ):
+    shamt = int( other )
+    if shamt >= self.nbits:
+      return self._new( self.nbits, numpy.zeros_like( self._data ) )
+    return self._binop( shamt, numpy.right_shift, self.nbits )
+
+  #----------------------------------------------------------------------
+  # Bitwise Operators
+  #----------------------------------------------------------------------
+
+  def __and__( self, other ):
+    return self._binop( other, numpy.bitwise_and, self._width( other ) )
+
+  def __xor__( self, other ):
+    return self._binop( other, numpy.bitwise_xor, self._width( other ) )
+
+  def __or__( self, other ):
+    return self._binop( other, numpy.bitwise_or, self._width( other ) )
+
+  def __rand__( self, other ):
+    return self.__and__( other )
+
+  def __rxor__( self, other ):
+    return self.__xor__( other )
+
+  def __ror__( self, other ):
+    return self.__or__( other )
+
+  #----------------------------------------------------------------------
+  # Comparison Operators
+  #----------------------------------------------------------------------
+  # Comparisons are element-wise and return NumPy boolean arrays, use
+  # .all() to check an entire vector against a golden reference.
+
+  def _compare( self, other, op ):
+    a    = self._data
+    b, _ = self._operand( other )
+    if isinstance( b, numpy.ndarray ):
+      if a.dtype != b.dtype:
+        a, b = a.astype( object ), b.astype( object )
+    elif a.dtype != object:
+      if b < 0 or b > 0xffffffffffffffff:
+        a = a.astype( object )
+      else:
+        b = numpy.uint64( b )
+    return numpy.asarray( op( a, b ), dtype=bool )
+
+  __hash__ = None
+
+  def __eq__( self, other ):
+    return self._compare( other, numpy.equal )
+
+  def __ne__( self, other ):
+    return self._compare( other, numpy.not_equal )
+
+  def __lt__( self, other ):
+    return self._compare( other, numpy.less )
+
+  def __le__( self, other ):
+    return self._compare( other, numpy.less_equal )
+
+  def __gt__( self, other ):
+    return self._compare( other, numpy.greater )
+
+  def __ge__( self, other ):
+    return self._compare( other, numpy.greater_equal )
+
+  #----------------------------------------------------------------------
+  # Extension
+  #----------------------------------------------------------------------
+  # Used by the zext(), sext() and concat() helpers.
+
+  def _zext( self, new_width ):
+    return self._new( new_width, self._data )
+
+  def _sext( self, new_width ):
+    data = self._data
+    if new_width > 64:
+      data = data.astype( object )
+    ext  = ((1 << new_width) - 1) ^ self._mask
+    sign = ( data >> _scalar( self.nbits - 1, data ) ) & _scalar( 1, data )
+    return self._new( new_width, data | ( sign * _scalar( ext, data ) ) )
+
+  def _concat( self, *args ):
+    nbits = sum( x.nbits for x in args )
+    wide  = nbits > 64
+    data  = None
+    for x in args:
+      if isinstance( x, BitsVector ):
+        value = x._data.astype( object ) if wide else x._data
+      else:
+        value = x._uint if wide else numpy.uint64( x._uint )
+      if data is None:
+        data = value
+      else:
+        shamt = x.nbits if wide else numpy.uint64( x.nbits )
+        data  = ( data << shamt ) | value
+    return self._new( nbits, numpy.asarray( data ) )
@@ -0,0 +1,282 @@
+#=======================================================================
+# BitsVector_test.py
+#=======================================================================
+# Tests for the BitsVector class. Results are checked against the
+# scalar Bits implementation element by element.
+
+import random
+import operator
+
+import pytest
+
+numpy = pytest.importorskip( 'numpy' )
+
+from Bits       import Bits
+from BitStruct  import BitStructDefinition, BitField
+from helpers    import zext, sext, concat
+from BitsVector import BitsVector
+
+#-----------------------------------------------------------------------
+# Utility Functions
+#-----------------------------------------------------------------------
+
+def rand_values( nbits, size=64, seed=0xdeadbeef ):
+  rgen = random.Random( seed + nbits )
+  return [ rgen.randint( 0, 2**nbits - 1 ) for _ in range( size ) ]
+
+def check( vec, bits_list ):
+  assert len( vec ) == len( bits_list )
+  for x, y in zip( vec, bits_list ):
+    assert x.nbits == y.nbits
+    assert x.uint() == y.uint()
+
+class SimpleMsg( BitStructDefinition ):
+
+  def __init__( s, addr_nbits, data_nbits ):
+    s.type_ = BitField( 1          )
+    s.addr  = BitField( addr_nbits )
+    s.data  = BitField( data_nbits )
+
+widths = [ 1, 8, 31, 32, 33, 64, 100 ]
+
+#-----------------------------------------------------------------------
+# test_construct
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits', widths )
+def test_construct( nbits ):
+
+  values = rand_values( nbits )
+  vec    = BitsVector( nbits, values )
+
+  assert vec.nbits == nbits
+  assert vec.uints() == values
+  check( vec, [ Bits( nbits, x ) for x in values ] )
+
+  # Construct from Bits, round trip through to_bits
+
+  bits = [ Bits( nbits, x ) for x in values ]
+  assert BitsVector.from_bits( bits ).uints() == values
+  check( BitsVector( nbits, bits ), bits )
+
+def test_construct_bounds_checking():
+
+  BitsVector( 4, [ 15, 0, -8 ] )
+  with pytest.raises( ValueError ): BitsVector( 4, [ 0, 16 ] )
+  with pytest.raises( ValueError ): BitsVector( 4, [ -9 ] )
+  with pytest.raises( ValueError ): BitsVector( 4, numpy.array([ 3, 16 ]) )
+
+  assert BitsVector( 4, [ -1, -2 ] ).uints() == [ 15, 14 ]
+  assert BitsVector( 4, [ 17 ], trunc=True ).uints() == [ 1 ]
+
+  # Non-integer arrays are rejected instead of being truncated
+
+  with pytest.raises( TypeError ): BitsVector( 8, numpy.array([ 1.5 ]) )
+  with pytest.raises( TypeError ): BitsVector( 8, numpy.array([ 'a' ]) )
+  BitsVector( 8, numpy.array([ True, False ]) )
+
+#-----------------------------------------------------------------------
+# test_operators
+#-----------------------------------------------------------------------
+
+ops = [ operator.add, operator.sub, operator.mul, operator.and_,
+        operator.or_, operator.xor ]
+
+@pytest.mark.parametrize( 'nbits', widths )
+@pytest.mark.parametrize( 'op', ops )
+def test_binary_operators( nbits, op ):
+
+  a = rand_values( nbits, seed=1 )
+  b = rand_values( nbits, seed=2 )
+
+  va = BitsVector( nbits, a )
+  vb = BitsVector( nbits, b )
+
+  ref = [ op( Bits( nbits, x ), Bits( nbits, y ) ) for x, y in zip( a, b ) ]
+  check( op( va, vb ), ref )
+
+  # Vector with Bits scalar, vector with int scalar
+
+  ref = [ op( Bits( nbits, x ), Bits( nbits, b[0] ) ) for x in a ]
+  check( op( va, Bits( nbits, b[0] ) ), ref )
+
+  ref = [ op( Bits( nbits, x ), b[0] ) for x in a ]
+  check( op( va, b[0] ), ref )
+
+@pytest.mark.parametrize( 'nbits', widths )
+def test_div_mod( nbits ):
+
+  a = rand_values( nbits, seed=3 )
+  b = [ max( x, 1 ) for x in rand_values( nbits, seed=4 ) ]
+
+  va = BitsVector( nbits, a )
+  vb = BitsVector( nbits, b )
+
+  check( va // vb, [ Bits(nbits,x) // Bits(nbits,y) for x,y in zip(a,b) ] )
+  check( va %  vb, [ Bits(nbits,x) %  Bits(nbits,y) for x,y in zip(a,b) ] )
+
+  # Zero divisors raise like Bits
+
+  with pytest.raises( ZeroDivisionError ): va // 0
+  with pytest.raises( ZeroDivisionError ): va %  Bits( nbits, 0 )
+  with pytest.raises( ZeroDivisionError ): va // ( b[:-1] + [ 0 ] )
+
+def test_mixed_widths():
+
+  a = rand_values( 16 )
+  b = rand_values( 64 )
+
+  ref = [ Bits( 16, x ) + Bits( 64, y ) for x, y in zip( a, b ) ]
+  check( BitsVector( 16, a ) + BitsVector( 64, b ), ref )
+
+  ref = [ Bits( 16, x ) * Bits( 64, y ) for x, y in zip( a, b ) ]
+  check( BitsVector( 16, a ) * BitsVector( 64, b ), ref )
+
+@pytest.mark.parametrize( 'nbits', widths )
+def test_invert_and_shifts( nbits ):
+
+  a  = rand_values( nbits )
+  va = BitsVector( nbits, a )
+
+  check( ~va, [ ~Bits( nbits, x ) for x in a ] )
+
+  for shamt in [ 0, 1, nbits/2, nbits-1, nbits, nbits+3 ]:
+    check( va << shamt, [ Bits( nbits, x ) << shamt for x in a ] )
+    check( va >> shamt, [ Bits( nbits, x ) >> shamt for x in a ] )
+
+@pytest.mark.parametrize( 'nbits', widths )
+def test_comparisons( nbits ):
+
+  a = rand_values( nbits, seed=5 )
+  b = list( a[:32] ) + rand_values( nbits, size=32, seed=6 )
+
+  va = BitsVector( nbits, a )
+  vb = BitsVector( nbits, b )
+
+  assert ( va == va ).all()
+  assert list( va == vb ) == [ x == y for x, y in zip( a, b ) ]
+  assert list( va != vb ) == [ x != y for x, y in zip( a, b ) ]
+  assert list( va <  vb ) == [ x <  y for x, y in zip( a, b ) ]
+  assert list( va >= vb ) == [ x >= y for x, y in zip( a, b ) ]
+  assert list( va == a[0] ) == [ x == a[0] for x in a ]
+  assert list( va == b  ) == [ x == y for x, y in zip( a, b ) ]
+
+#-----------------------------------------------------------------------
+# test_signed
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits', widths )
+def test_int( nbits ):
+
+  a = rand_values( nbits )
+  assert list( BitsVector( nbits, a ).int() ) == \
+         [ Bits( nbits, x ).int() for x in a ]
+
+#-----------------------------------------------------------------------
+# test_extension
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits,new_width', [
+  ( 1, 8 ), ( 4, 8 ), ( 8, 64 ), ( 32, 64 ), ( 33, 100 ), ( 64, 128 ),
+])
+def test_zext_sext( nbits, new_width ):
+
+  a  = rand_values( nbits )
+  va = BitsVector( nbits, a )
+
+  check( zext( va, new_width ), [ zext( Bits(nbits,x), new_width ) for x in a ] )
+  check( sext( va, new_width ), [ sext( Bits(nbits,x), new_width ) for x in a ] )
+
+def test_concat():
+
+  a = rand_values( 8,  seed=7 )
+  b = rand_values( 32, seed=8 )
+  c = rand_values( 60, seed=9 )
+
+  va = BitsVector( 8,  a )
+  vb = BitsVector( 32, b )
+  vc = BitsVector( 60, c )
+
+  ref = [ concat( Bits(8,x), Bits(32,y) ) for x, y in zip( a, b ) ]
+  check( concat( va, vb ), ref )
+
+  ref = [ concat( Bits(8,x), Bits(32,y), Bits(60,z) )
+          for x, y, z in zip( a, b, c ) ]
+  check( concat( va, vb, vc ), ref )
+
+  # Mix scalar Bits with vectors
+
+  ref = [ concat( Bits(4,0xa), Bits(8,x) ) for x in a ]
+  check( concat( Bits(4,0xa), va ), ref )
+
+#-----------------------------------------------------------------------
+# test_indexing
+#-----------------------------------------------------------------------
+
+def test_indexing():
+
+  a   = rand_values( 16 )
+  vec = BitsVector( 16, a )
+
+  assert vec[3] == a[3]
+  assert isinstance( vec[3], Bits )
+  assert vec[2:6].uints() == a[2:6]
+
+  vec[0]   = 0x1234
+  vec[1:3] = [ 1, 2 ]
+  assert vec.uints()[:3] == [ 0x1234, 1, 2 ]
+
+@pytest.mark.parametrize( 'nbits', widths[1:] )
+def test_bit_fields( nbits ):
+
+  a   = rand_values( nbits )
+  vec = BitsVector( nbits, a )
+
+  for start, stop in [ (0, 1), (0, nbits), (nbits/2, nbits), (1, nbits-1) ]:
+    ref = [ Bits( nbits, x )[start:stop] for x in a ]
+    check( vec.get_field( slice( start, stop ) ), ref )
+
+  # Write a field and compare against Bits slice assignment
+
+  start, stop = 1, max( 2, nbits/2 )
+  new_values  = rand_values( stop - start, seed=11 )
+  ref         = [ Bits( nbits, x ) for x in a ]
+  for bits, value in zip( ref, new_values ):
+    bits[start:stop] = value
+  vec.set_field( slice( start, stop ), new_values )
+  check( vec, ref )
+
+#-----------------------------------------------------------------------
+# test_bitstruct
+#-----------------------------------------------------------------------
+
+def test_bitstruct_pack_unpack():
+
+  dtype = SimpleMsg( 16, 32 )
+  addrs = rand_values( 16, seed=12 )
+  data  = rand_values( 32, seed=13 )
+
+  vec = BitsVector.from_fields( dtype, type_=[ 1 ]*64, addr=addrs, data=data )
+
+  assert vec.nbits == dtype.nbits
+  assert vec.addr.uints() == addrs
+  assert vec.get_field( 'data' ).uints() == data
+
+  # Convert back into BitStruct objects
+
+  msgs = vec.to_bits()
+  for msg, addr, value in zip( msgs, addrs, data ):
+    assert isinstance( msg, type( dtype ) )
+    assert msg.type_ == 1
+    assert msg.addr  == addr
+    assert msg.data  == value
+
+  # Convert BitStruct objects back into a vector
+
+  assert ( BitsVector.from_bits( msgs ) == vec ).all()
+
+  # Update a single field in all messages
+
+  vec.set_field( 'type_', 0 )
+  assert not vec.type_.uint().any()
+  assert vec.addr.uints() == addrs
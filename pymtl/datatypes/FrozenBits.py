@@ -0,0 +1,184 @@
+#=======================================================================
+# FrozenBits.py
+#=======================================================================
+# Module containing immutable, interned versions of Bits and BitStruct.
+#
+# Test harnesses and CL models frequently copy messages defensively
+# when buffering them (e.g. msg[:] or copy.deepcopy(msg)) since Bits
+# objects are mutable. freeze() instead returns an immutable value which
+# is shared between all holders of the same message: freezing a value
+# equal to an existing frozen value returns the existing object.
+#
+# Frozen values are instances of a subclass of the original type, so
+# they behave exactly like the original Bits/BitStruct when read (field
+# access, slicing, arithmetic, printing). Frozen values are read-only:
+# any attempt to mutate one raises a TypeError, and msg[:] or thaw()
+# returns a new mutable copy to modify. Only freeze values which are
+# never handed out to code which may modify them in place, e.g. FL/CL
+# queues still copy messages since their users may mutate the dequeued
+# messages.
+
+import copy
+import weakref
+
+from Bits      import Bits, BitSlice
+from BitStruct import BitStruct
+
+# Frozen subclass for each Bits/BitStruct class, and the table of
+# interned frozen values keyed by (frozen class, nbits, uint). The
+# intern table only holds weak references, and at most _intern_limit
+# values are interned (further values are frozen without interning).
+
+_frozen_classes = {}
+_interned       = weakref.WeakValueDictionary()
+_intern_limit   = 1 << 16
+
+# Instance attributes set on BitStruct instances by MetaBitStruct which
+# need to be preserved on frozen copies, see BitStruct.py
+
+_extra_attrs = ( '_module', '_classname', '_instantiate' )
+
+#-----------------------------------------------------------------------
+# FrozenBits
+#-----------------------------------------------------------------------
+# Mixin class for frozen values. This is always combined with the
+# mutable class being frozen, see _get_frozen_class().
+class FrozenBits( object ):
+
+  #---------------------------------------------------------------------
+  # Mutators
+  #---------------------------------------------------------------------
+
+  def _read_only( self, *args ):
+    raise TypeError( 'Frozen {} values are read-only, use msg[:] to get '
+                     'a mutable copy!'.format( self.__class__.__name__ ) )
+
+  write_value = _read_only
+  write_next  = _read_only
+  __setitem__ = _read_only
+
+  #---------------------------------------------------------------------
+  # __getitem__
+  #---------------------------------------------------------------------
+  # An open-ended slice ( [:] ) is the idiom used to copy Bits, so it
+  # returns a mutable copy. All other slices are read-only views.
+  def __getitem__( self, addr ):
+    if isinstance( addr, slice ) and addr.start is None and addr.stop is None:
+      return thaw( self )
+    return super( FrozenBits, self ).__getitem__( addr )
+
+  #---------------------------------------------------------------------
+  # __call__
+  #---------------------------------------------------------------------
+  # Instantiating a frozen value used as a type returns a mutable value.
+  def __call__( self ):
+    return self._mutable_class( self.nbits )
+
+  #---------------------------------------------------------------------
+  # Copying
+  #---------------------------------------------------------------------
+  # Frozen values can be shared, so copies return the same object.
+
+  def __copy__( self ):
+    return self
+
+  def __deepcopy__( self, memo ):
+    return self
+
+  #---------------------------------------------------------------------
+  # __hash__
+  #---------------------------------------------------------------------
+  def __hash__( self ):
+    return self._hash
+
+#-----------------------------------------------------------------------
+# _get_frozen_class
+#-----------------------------------------------------------------------
+# Return the frozen subclass for a Bits/BitStruct class, creating it the
+# first time. The subclass keeps the original class name so that frozen
+# values print identically to mutable ones.
+#
+# MetaBitStruct creates a new class every time a BitStruct type is
+# instantiated (e.g. each MemReqMsg(8,32,32) call), so BitStruct classes
+# are keyed by the generated class name (which includes the arguments)
+# and the layout of the fields. Equal messages from different call sites
+# then share a frozen class, and the table only grows with the number of
+# distinct message types.
+def _get_frozen_class( cls ):
+
+  if issubclass( cls, BitStruct ):
+    fields = getattr( cls, '_bitfields', {} ).items()
+    key    = ( cls.__name__, tuple( sorted( ( name, addr.start, addr.stop )
+                                            for name, addr in fields ) ) )
+  else:
+    key    = cls
+
+  try:
+    return _frozen_classes[ key ]
+  except KeyError:
+    frozen_cls = type( cls.__name__, ( FrozenBits, cls ),
+                       { '_mutable_class': cls } )
+    _frozen_classes[ key ] = frozen_cls
+    return frozen_cls
+
+#-----------------------------------------------------------------------
+# freeze
+#-----------------------------------------------------------------------
+def freeze( value ):
+  '''Return an immutable, interned version of a Bits or BitStruct value.
+
+  Frozen values can be buffered and shared without copying. Values which
+  are not Bits are deep copied instead.
+  '''
+
+  if isinstance( value, FrozenBits ):
+    return value
+
+  if not isinstance( value, Bits ):
+    return copy.deepcopy( value )
+
+  # Slices are frozen as plain Bits, they no longer refer to the target
+
+  cls = Bits if isinstance( value, BitSlice ) else type( value )
+
+  frozen_cls = _get_frozen_class( cls )
+  key        = ( frozen_cls, value.nbits, value._uint )
+
+  frozen = _interned.get( key )
+  if frozen is not None:
+    return frozen
+
+  # Construct the frozen value with the Bits constructor, which sets the
+  # attributes directly instead of calling write_value.
+
+  frozen = frozen_cls.__new__( frozen_cls )
+  Bits.__init__( frozen, value.nbits, value._uint )
+  for name in _extra_attrs:
+    if name in value.__dict__:
+      frozen.__dict__[ name ] = value.__dict__[ name ]
+
+  # Frozen values compare equal to ints with the same value, so they
+  # hash like ints (BitStructs included) to be interchangeable as keys.
+
+  frozen._hash = hash( frozen._uint )
+
+  if len( _interned ) < _intern_limit:
+    _interned[ key ] = frozen
+  return frozen
+
+#-----------------------------------------------------------------------
+# thaw
+#-----------------------------------------------------------------------
+def thaw( value ):
+  'Return a new mutable copy of a (possibly frozen) Bits value.'
+
+  if not isinstance( value, FrozenBits ):
+    return copy.copy( value )
+
+  cls     = value._mutable_class
+  mutable = cls.__new__( cls )
+  Bits.__init__( mutable, value.nbits, value._uint )
+  for name in _extra_attrs:
+    if name in value.__dict__:
+      mutable.__dict__[ name ] = value.__dict__[ name ]
+  return mutable
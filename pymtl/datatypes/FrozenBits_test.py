@@ -0,0 +1,157 @@
+#=======================================================================
+# FrozenBits_test.py
+#=======================================================================
+
+import copy
+import pytest
+import FrozenBits as frozen_bits
+
+from Bits       import Bits
+from BitStruct  import BitStructDefinition, BitField
+from FrozenBits import freeze, thaw, FrozenBits
+
+class SimpleMsg( BitStructDefinition ):
+
+  def __init__( s ):
+    s.dest = BitField( 4 )
+    s.data = BitField( 8 )
+
+def test_freeze_bits():
+
+  a = Bits( 8, 0x2a )
+  b = freeze( a )
+
+  assert b == a
+  assert b == 0x2a
+  assert b.nbits == 8
+  assert isinstance( b, Bits )
+  assert isinstance( b, FrozenBits )
+  assert str( b ) == str( a )
+
+  # Further changes to the original are not visible in the frozen value
+
+  a.value = 3
+  assert b == 0x2a
+
+def test_freeze_interning():
+
+  a = freeze( Bits( 8, 0x2a ) )
+  assert freeze( Bits( 8, 0x2a ) ) is a
+  assert freeze( a ) is a
+  assert copy.copy( a ) is a
+  assert copy.deepcopy( [ a ] )[0] is a
+
+  # Same value with a different bitwidth is a different value
+
+  assert freeze( Bits( 16, 0x2a ) ) is not a
+  assert freeze( Bits( 16, 0x2a ) ).nbits == 16
+
+def test_freeze_hash():
+
+  a = freeze( Bits( 8, 0x2a ) )
+  assert hash( a ) == hash( 0x2a )
+  assert { a : 1 }[ freeze( Bits( 8, 0x2a ) ) ] == 1
+
+  # Frozen values and ints are interchangeable as keys
+
+  assert { a : 1 }[ 0x2a ] == 1
+  assert { 0x2a : 1 }[ a ] == 1
+  assert len( { a, 0x2a, freeze( Bits( 16, 0x2a ) ) } ) == 1
+
+def test_freeze_read_only():
+
+  a = freeze( Bits( 8, 0x2a ) )
+
+  with pytest.raises( TypeError ):
+    a.value = 3
+  with pytest.raises( TypeError ):
+    a[0] = 0
+  with pytest.raises( TypeError ):
+    a[0:4] = 0
+  with pytest.raises( TypeError ):
+    a[0:4].value = 0
+
+  assert a == 0x2a
+
+def test_freeze_copy_on_write():
+
+  a = freeze( Bits( 8, 0x2a ) )
+
+  for b in [ a[:], thaw( a ) ]:
+    assert b == 0x2a
+    assert not isinstance( b, FrozenBits )
+    b[0:4] = 0xf
+    assert b == 0x2f
+
+  assert a == 0x2a
+  assert not isinstance( a(), FrozenBits )
+
+def test_freeze_slices():
+
+  a = Bits( 8, 0x2a )
+  assert freeze( a[4:8] ) == 0x2
+  assert freeze( a[4:8] ).nbits == 4
+  assert freeze( a )[4:8] == 0x2
+
+def test_freeze_bitstruct():
+
+  dtype = SimpleMsg()
+  msg   = dtype()
+  msg.dest = 3
+  msg.data = 0x42
+
+  frozen = freeze( msg )
+
+  assert isinstance( frozen, type( msg ) )
+  assert frozen.dest == 3
+  assert frozen.data == 0x42
+  assert frozen == msg
+  assert frozen == msg._uint
+  assert hash( frozen ) == hash( msg._uint )
+  assert { msg._uint : 1 }[ frozen ] == 1
+  assert frozen.__class__.__name__ == msg.__class__.__name__
+  assert freeze( msg ) is frozen
+
+  with pytest.raises( TypeError ):
+    frozen.dest = 2
+
+  mutable = frozen[:]
+  mutable.dest = 2
+  assert mutable.dest == 2
+  assert frozen.dest  == 3
+  assert isinstance( mutable, type( msg ) )
+
+def test_freeze_other_types():
+
+  values = [ 1, Bits( 4, 2 ) ]
+  frozen = freeze( values )
+  assert frozen == values
+  assert frozen is not values
+
+def test_freeze_bitstruct_call_sites():
+
+  # Each instantiation of a BitStruct type creates a new class, equal
+  # messages are still interned together and share a frozen class
+
+  a = SimpleMsg()
+  b = SimpleMsg()
+  a.dest = b.dest = 3
+  a.data = b.data = 0x42
+
+  assert type( a ) is not type( b )
+  assert freeze( a ) is freeze( b )
+
+  n = len( frozen_bits._frozen_classes )
+  for i in range( 10 ):
+    freeze( SimpleMsg() )
+  assert len( frozen_bits._frozen_classes ) == n
+
+def test_freeze_intern_limit( monkeypatch ):
+
+  monkeypatch.setattr( frozen_bits, '_interned', {} )
+  monkeypatch.setattr( frozen_bits, '_intern_limit', 0 )
+
+  a = freeze( Bits( 8, 0x13 ) )
+  assert a == 0x13
+  assert isinstance( a, FrozenBits )
+  assert freeze( Bits( 8, 0x13 ) ) is not a
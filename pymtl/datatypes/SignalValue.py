@@ -4,6 +4,7 @@
 # Module containing the SignalValue class.
 
 import copy
+import inspect
 
 #-----------------------------------------------------------------------
 # SignalValue
@@ -254,14 +255,87 @@ class SignalValueWrapper( SignalValue ):
           setattr( cls, name, property( getter, setter ) )
 
 
+#-----------------------------------------------------------------------
+# WrappedSignalValue
+#-----------------------------------------------------------------------
+# Base class for the concrete classes generated by CreateWrappedClass.
+# Unlike SignalValueWrapper, generated classes subclass the wrapped
+# class directly: fields are stored in slots of the generated class, and
+# methods (including __eq__ and __hash__) are inherited rather than
+# proxied, so attribute accesses cost the same as on the original class.
+class WrappedSignalValue( SignalValue ):
+
+  __fields__ = ()
+
+  nbits      = None
+
+  # Wrapped values are never slices of another value, see Bits.py
+  @property
+  def _target_bits( self ):
+    return self
+
+  #---------------------------------------------------------------------
+  # write_value
+  #---------------------------------------------------------------------
+  # Provide implementation for required SignalValue abstract method.
+  def write_value( self, value ):
+    for name in self.__fields__:
+      setattr( self, name, getattr( value, name ) )
+
+  #---------------------------------------------------------------------
+  # write_next
+  #---------------------------------------------------------------------
+  # Provide implementation for required SignalValue abstract method.
+  def write_next( self, value ):
+    self._next.write_value( value )
+
+  #---------------------------------------------------------------------
+  # __copy__
+  #---------------------------------------------------------------------
+  # Copy only the fields, bypassing the constructor of the wrapped class
+  # and leaving behind any simulator state attached to the value.
+  def __copy__( self ):
+    new = self.__class__.__new__( self.__class__ )
+    new.write_value( self )
+    return new
+
+  #---------------------------------------------------------------------
+  # __getitem__
+  #---------------------------------------------------------------------
+  # Add support for performing copy using the slice operator (signal[:]).
+  def __getitem__( self, idx ):
+    assert idx.start is None and idx.stop is None
+    return self.__copy__()
+
 #-----------------------------------------------------------------------
 # CreateWrappedClass
 #-----------------------------------------------------------------------
 # Takes a class and returns a wrapped version of the class that can
-# behave as a SignalValue (can be passed on Ports and Wires).
+# behave as a SignalValue (can be passed on Ports and Wires). The class
+# must list the attributes which make up its value in __fields__, and
+# its constructor must be callable without arguments.
 def CreateWrappedClass( cls ):
 
-  class Wrapper( SignalValueWrapper ):
-    __wraps__ = cls
-
-  return Wrapper
+  if not getattr( cls, '__fields__', None ):
+    raise TypeError( "Class {} must list its attributes in __fields__ "
+                     "to be wrapped!".format( cls.__name__ ) )
+
+  dct = { '__fields__' : tuple( cls.__fields__ ),
+          '__module__' : cls.__module__ }
+
+  # Python 2 does not derive != from ==, which SignalValue uses to check
+  # whether a write actually changes the value.
+  defined = set( name for c in inspect.getmro( cls ) if c is not object
+                      for name in vars( c ) )
+  if '__eq__' in defined and '__ne__' not in defined:
+    dct['__ne__'] = lambda self, other: not self == other
+
+  # Fields get a slot unless the wrapped class already defines them (as
+  # a class-level default, a property or a slot of its own). The wrapped
+  # class still provides a __dict__ for any other attribute, but it is
+  # only allocated once something is stored in it, which values created
+  # by test sources and sinks never do.
+  dct['__slots__'] = tuple( name for name in cls.__fields__
+                                 if name not in defined )
+
+  return type( cls.__name__, ( cls, WrappedSignalValue ), dct )
@@ -0,0 +1,169 @@
+#=======================================================================
+# SignalValue_test.py
+#=======================================================================
+
+import copy
+
+from pymtl       import *
+from SignalValue import CreateWrappedClass, WrappedSignalValue
+
+#-----------------------------------------------------------------------
+# Transaction classes
+#-----------------------------------------------------------------------
+
+class Txn( object ):
+  __fields__ = [ 'opcode', 'addr', 'tags' ]
+
+  def __init__( s, opcode = 0, addr = 0 ):
+    s.opcode = opcode
+    s.addr   = addr
+    s.tags   = []
+
+  def __eq__( s, other ):
+    return s.opcode == other.opcode and s.addr == other.addr
+
+  def __hash__( s ):
+    return hash( (s.opcode, s.addr) )
+
+  def is_read( s ):
+    return s.opcode == 0
+
+WrappedTxn = CreateWrappedClass( Txn )
+
+#-----------------------------------------------------------------------
+# test_wrapped_class
+#-----------------------------------------------------------------------
+
+def test_wrapped_class():
+
+  txn = WrappedTxn( 1, 0x1000 )
+
+  assert isinstance( txn, Txn )
+  assert isinstance( txn, WrappedSignalValue )
+  assert WrappedTxn.__name__ == 'Txn'
+  assert WrappedTxn.nbits is None
+
+  # Fields and methods are those of the wrapped class
+
+  assert WrappedTxn.__slots__ == ( 'opcode', 'addr', 'tags' )
+  assert txn.__dict__ == {}
+  assert txn.opcode == 1
+  assert not txn.is_read()
+  txn.addr = 0x2000
+  assert txn.addr == 0x2000
+
+def test_wrapped_eq_hash():
+
+  a = WrappedTxn( 1, 0x1000 )
+  b = WrappedTxn( 1, 0x1000 )
+  c = WrappedTxn( 0, 0x1000 )
+
+  assert a == b
+  assert not a != b
+  assert a != c
+  assert hash( a ) == hash( b ) == hash( Txn( 1, 0x1000 ) )
+  assert { a : 1 }[ b ] == 1
+
+def test_wrapped_copy():
+
+  a = WrappedTxn( 1, 0x1000 )
+
+  for b in [ a[:], copy.copy( a ) ]:
+    assert b is not a
+    assert type( b ) is WrappedTxn
+    assert b == a
+    b.addr = 0
+    assert a.addr == 0x1000
+
+def test_wrapped_deepcopy():
+
+  a = WrappedTxn( 1, 0x1000 )
+  a.tags.append( 'x' )
+
+  b = copy.deepcopy( a )
+  assert type( b ) is WrappedTxn
+  assert b == a and b.tags == [ 'x' ]
+  assert b.tags is not a.tags
+
+def test_wrapped_class_defaults():
+
+  # Fields defined by the wrapped class itself are not given a slot
+
+  class Defaults( object ):
+    __fields__ = [ 'opcode', 'addr' ]
+    opcode     = 0
+
+    @property
+    def addr( s ):
+      return s._addr
+    @addr.setter
+    def addr( s, value ):
+      s._addr = value
+
+  WrappedDefaults = CreateWrappedClass( Defaults )
+  assert WrappedDefaults.__slots__ == ()
+
+  a = WrappedDefaults()
+  assert a.opcode == 0
+  a.addr = 0x10
+  b = a[:]
+  assert b.opcode == 0 and b.addr == 0x10
+
+def test_wrapped_write_value():
+
+  a = WrappedTxn()
+  a._next = WrappedTxn()
+
+  a.write_value( Txn( 2, 0x10 ) )
+  assert a.opcode == 2 and a.addr == 0x10
+
+  a.write_next( WrappedTxn( 3, 0x20 ) )
+  assert a.opcode == 2
+  assert a.next.opcode == 3
+
+def test_wrapped_requires_fields():
+
+  class NoFields( object ):
+    pass
+
+  try:
+    CreateWrappedClass( NoFields )
+  except TypeError:
+    pass
+  else:
+    assert False
+
+#-----------------------------------------------------------------------
+# test_wrapped_ports
+#-----------------------------------------------------------------------
+
+def test_wrapped_ports():
+
+  class PassThrough( Model ):
+    def __init__( s ):
+      s.in_ = InPort ( WrappedTxn )
+      s.out = OutPort( WrappedTxn )
+      s.reg = Wire   ( WrappedTxn )
+
+      @s.tick
+      def seq():
+        s.reg.next = s.in_
+
+      @s.combinational
+      def comb():
+        s.out.value = s.reg
+
+  model = PassThrough()
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+
+  model.in_.value = Txn( 1, 0x1000 )
+  sim.cycle()
+  assert model.out == Txn( 1, 0x1000 )
+
+  model.in_.value = Txn( 0, 0x2000 )
+  assert model.out == Txn( 1, 0x1000 )
+  sim.cycle()
+  assert model.out == Txn( 0, 0x2000 )
+  assert model.out.is_read()
@@ -4,7 +4,6 @@
 'Collection of built-in helpers functions for the PyMTL framework.'
 
 import math
-import operator
 
 # NOTE: circular imports between Bits and helpers, using 'import'
 #       instead of 'from Bits import' ensures pydoc still works
@@ -48,38 +47,182 @@ def sext( value, new_width ):
 def concat( *args ):
   'Return a Bits which is the concatenation of the Bits in bits_list.'
 
-  assert isinstance( args[0], Bits.Bits )
+  if not args:
+    raise TypeError( 'concat() requires at least one argument!' )
 
-  # Calculate total new bitwidth
-  nbits = sum( [ x.nbits for x in args ] )
-
-  # Create new Bits and add each bits from bits_list to it
-  concat_bits = Bits.Bits( nbits )
-
-  begin = 0
-  for bits in reversed( args ):
-    concat_bits[ begin : begin+bits.nbits ] = bits
-    begin += bits.nbits
+  # Concatenate the unsigned integer values directly using shift/or,
+  # the first argument ends up in the most significant bits.
+  nbits = 0
+  value = 0
+  for x in args:
+    if not isinstance( x, Bits.Bits ):
+      break
+    value  = ( value << x.nbits ) | x._uint
+    nbits += x.nbits
+  else:
+    return Bits.Bits( nbits, value, trunc=True )
 
-  return concat_bits
+  # Concatenations involving a BitsVector are performed element-wise by
+  # the BitsVector, see BitsVector.py
+  if not hasattr( x, '_concat' ):
+    raise TypeError( 'concat() arguments must be Bits or BitsVector, '
+                     'got {!r}'.format( x ) )
+  return x._concat( *args )
 
 #-----------------------------------------------------------------------
 # reduce_and
 #-----------------------------------------------------------------------
 def reduce_and( signal ):
-  return reduce( operator.and_, (signal[x] for x in xrange( signal.nbits )) )
+  return Bits.Bits( 1, signal._uint == signal._mask )
 
 #-----------------------------------------------------------------------
 # reduce_or
 #-----------------------------------------------------------------------
 def reduce_or( signal ):
-  return reduce( operator.or_,  (signal[x] for x in xrange( signal.nbits )) )
+  return Bits.Bits( 1, signal._uint != 0 )
 
 #-----------------------------------------------------------------------
 # reduce_xor
 #-----------------------------------------------------------------------
-# Verilog iterates through MSB to LSB, so we must reverse iteration.
+# The xor reduction of a value is the parity of its population count.
 def reduce_xor( signal ):
-  return reduce( operator.xor,
-                 (signal[x] for x in reversed( xrange( signal.nbits ) ))
-               )
+  return Bits.Bits( 1, bin( signal._uint ).count( '1' ) & 1 )
+
+#-----------------------------------------------------------------------
+# Precompiled Helpers
+#-----------------------------------------------------------------------
+# The make_* functions below return versions of concat, zext and sext
+# specialized for a fixed set of argument bitwidths. All bitwidth and
+# mask calculations are performed once when the helper is created, so
+# comb blocks in the inner loop of a datapath can create the helper at
+# elaboration time and reuse it every cycle:
+#
+#   concat_16_16 = make_concat( 16, 16 )
+#
+#   @s.combinational
+#   def comb():
+#     s.out.value = concat_16_16( s.in0, s.in1 )
+#
+# Helpers are memoized, so models with the same bitwidths share them.
+# The widths of the arguments are checked on every call, and a
+# ValueError is raised instead of silently truncating an argument.
+#
+# NOTE: the translator only recognizes concat, zext and sext by name, so
+# the precompiled helpers are for simulation only. Blocks which need to
+# be translated to Verilog must use the generic helpers instead.
+
+_precompiled = {}
+
+def _width_error( args, nbits_list ):
+  return ValueError( 'Expected arguments of bitwidths {}, got {}!'.format(
+    list( nbits_list ), [ x.nbits for x in args ] ) )
+
+#-----------------------------------------------------------------------
+# make_concat
+#-----------------------------------------------------------------------
+def make_concat( *nbits_list ):
+  'Return a concat function specialized for the provided bitwidths.'
+
+  key = ( 'concat', ) + nbits_list
+  if key in _precompiled:
+    return _precompiled[ key ]
+
+  if not nbits_list:
+    raise ValueError( 'make_concat() requires at least one bitwidth!' )
+  nbits = sum( nbits_list )
+
+  # Shift amount to apply to each argument, first argument is the MSB
+  shamts = []
+  offset = nbits
+  for n in nbits_list:
+    offset -= n
+    shamts.append( offset )
+
+  # Common cases of two and three arguments avoid iteration entirely
+
+  if len( nbits_list ) == 1:
+    n0, = nbits_list
+    def concat_fixed( a ):
+      if a.nbits != n0:
+        raise _width_error( ( a, ), nbits_list )
+      return Bits.Bits( nbits, a._uint, trunc=True )
+
+  elif len( nbits_list ) == 2:
+    sa     = shamts[0]
+    n0, n1 = nbits_list
+    def concat_fixed( a, b ):
+      if a.nbits != n0 or b.nbits != n1:
+        raise _width_error( ( a, b ), nbits_list )
+      return Bits.Bits( nbits, (a._uint << sa) | b._uint, trunc=True )
+
+  elif len( nbits_list ) == 3:
+    sa, sb     = shamts[0], shamts[1]
+    n0, n1, n2 = nbits_list
+    def concat_fixed( a, b, c ):
+      if a.nbits != n0 or b.nbits != n1 or c.nbits != n2:
+        raise _width_error( ( a, b, c ), nbits_list )
+      return Bits.Bits( nbits, (a._uint << sa) | (b._uint << sb) | c._uint,
+                        trunc=True )
+
+  else:
+    pairs = zip( range( len( shamts ) ), shamts )
+    def concat_fixed( *args ):
+      if tuple( x.nbits for x in args ) != nbits_list:
+        raise _width_error( args, nbits_list )
+      value = 0
+      for i, shamt in pairs:
+        value |= args[i]._uint << shamt
+      return Bits.Bits( nbits, value, trunc=True )
+
+  _precompiled[ key ] = concat_fixed
+  return concat_fixed
+
+#-----------------------------------------------------------------------
+# make_zext
+#-----------------------------------------------------------------------
+def make_zext( nbits, new_width ):
+  'Return a zext function specialized for the provided bitwidths.'
+
+  key = ( 'zext', nbits, new_width )
+  if key in _precompiled:
+    return _precompiled[ key ]
+
+  if new_width < nbits:
+    raise ValueError( 'Cannot extend {} bits to {} bits!'.format(
+      nbits, new_width ) )
+
+  def zext_fixed( value ):
+    if value.nbits != nbits:
+      raise _width_error( ( value, ), ( nbits, ) )
+    return Bits.Bits( new_width, value._uint, trunc=True )
+
+  _precompiled[ key ] = zext_fixed
+  return zext_fixed
+
+#-----------------------------------------------------------------------
+# make_sext
+#-----------------------------------------------------------------------
+def make_sext( nbits, new_width ):
+  'Return a sext function specialized for the provided bitwidths.'
+
+  key = ( 'sext', nbits, new_width )
+  if key in _precompiled:
+    return _precompiled[ key ]
+
+  if new_width < nbits:
+    raise ValueError( 'Cannot extend {} bits to {} bits!'.format(
+      nbits, new_width ) )
+
+  sign_bit = 1 << ( nbits - 1 )
+  ext_bits = ( (1 << new_width) - 1 ) ^ ( (1 << nbits) - 1 )
+
+  def sext_fixed( value ):
+    if value.nbits != nbits:
+      raise _width_error( ( value, ), ( nbits, ) )
+    uint = value._uint
+    if uint & sign_bit:
+      uint |= ext_bits
+    return Bits.Bits( new_width, uint, trunc=True )
+
+  _precompiled[ key ] = sext_fixed
+  return sext_fixed
@@ -147,3 +147,77 @@ def test_reduce_xor():
   assert reduce_xor( Bits(3,0b101) ) == 0
   assert reduce_xor( Bits(3,0b110) ) == 0
   assert reduce_xor( Bits(3,0b000) ) == 0
+
+def test_concat_wide():
+
+  a = Bits( 100, 0x123456789abcdef0123456789 )
+  b = Bits(  28, 0xfedcba9 )
+  assert concat( a, b ) == Bits( 128, 0x123456789abcdef0123456789fedcba9 )
+  assert concat( a, b ).nbits == 128
+
+def test_concat_type_check():
+
+  # Plain integers have no bitwidth, so they cannot be concatenated
+
+  with pytest.raises( TypeError ): concat( 1, Bits( 4 ) )
+  with pytest.raises( TypeError ): concat( Bits( 4 ), 1 )
+  with pytest.raises( TypeError ): concat()
+
+def test_reduce_wide():
+
+  assert reduce_and( Bits( 100, 2**100-1 ) ) == 1
+  assert reduce_and( Bits( 100, 2**100-2 ) ) == 0
+  assert reduce_or ( Bits( 100, 2**99    ) ) == 1
+  assert reduce_or ( Bits( 100, 0       ) ) == 0
+  assert reduce_xor( Bits( 100, 2**99+1  ) ) == 0
+  assert reduce_xor( Bits( 100, 2**99+3  ) ) == 1
+  assert reduce_xor( Bits( 100, 2**99+3  ) ).nbits == 1
+
+@pytest.mark.parametrize( 'nbits_list', [
+  (8,), (4,4), (2,4,4), (1,31,32), (3,5,7,9), (64,64,1,1,2),
+])
+def test_make_concat( nbits_list ):
+
+  args = [ Bits( n, (0x5a5a5a5a5a5a5a5a5 + i) & ((1 << n) - 1) )
+           for i, n in enumerate( nbits_list ) ]
+
+  concat_fixed = make_concat( *nbits_list )
+  assert concat_fixed( *args ) == concat( *args )
+  assert concat_fixed( *args ).nbits == sum( nbits_list )
+  assert make_concat( *nbits_list ) is concat_fixed
+
+@pytest.mark.parametrize( 'nbits,new_width', [
+  (1,1), (1,8), (4,8), (8,64), (32,100),
+])
+def test_make_zext_sext( nbits, new_width ):
+
+  zext_fixed = make_zext( nbits, new_width )
+  sext_fixed = make_sext( nbits, new_width )
+
+  for value in [ 0, 1, 2**nbits-1, 2**(nbits-1) ]:
+    value = Bits( nbits, value )
+    assert zext_fixed( value ) == zext( value, new_width )
+    assert sext_fixed( value ) == sext( value, new_width )
+    assert zext_fixed( value ).nbits == new_width
+    assert sext_fixed( value ).nbits == new_width
+
+def test_make_helpers_widths():
+
+  # Arguments with the wrong bitwidth are not silently truncated
+
+  with pytest.raises( ValueError ):
+    make_concat( 4, 4 )( Bits( 4, 1 ), Bits( 8, 0x10 ) )
+  with pytest.raises( ValueError ):
+    make_concat( 1, 2, 3, 4 )( Bits( 1 ), Bits( 2 ), Bits( 3 ), Bits( 5 ) )
+  with pytest.raises( ValueError ):
+    make_zext( 4, 8 )( Bits( 6, 0x20 ) )
+  with pytest.raises( ValueError ):
+    make_sext( 4, 8 )( Bits( 2, 0x2 ) )
+  with pytest.raises( ValueError ):
+    make_concat( 4 )( Bits( 5 ) )
+
+  # Bitwidths are checked when the helper is created
+
+  with pytest.raises( ValueError ): make_concat()
+  with pytest.raises( ValueError ): make_zext( 8, 4 )
+  with pytest.raises( ValueError ): make_sext( 8, 4 )
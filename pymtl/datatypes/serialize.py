@@ -0,0 +1,272 @@
+#=======================================================================
+# serialize.py
+#=======================================================================
+'''Bulk binary serialization of Bits and BitStruct message streams.
+
+Each message is stored in a fixed number of bytes (the message bitwidth
+rounded up to a whole number of bytes) in little-endian order, and the
+messages of a stream are stored back to back. For example, a stream of
+three 12-bit messages is packed into six bytes.
+
+>>> data = pack_many( msgs )
+>>> msgs = unpack_many( data, dtype )
+
+unpack_many() accepts any object supporting the buffer protocol,
+including memoryview and mmap objects, and returns a lazy sequence which
+only decodes the messages that are accessed. save_many() and load_many()
+add a small header and store streams in files, load_many() maps the file
+into memory so that large traces can be opened without parsing them.
+'''
+
+import mmap
+import struct
+import binascii
+import collections
+
+from Bits import Bits
+
+# struct formats for message sizes which map onto native integers
+
+_struct_fmts = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+
+# File header: magic, format version, message bitwidth, message count
+
+_header_fmt   = '<8sIIQ'
+_header_size  = struct.calcsize( _header_fmt )
+_header_magic = b'PYMTLBIT'
+_version      = 1
+
+#-----------------------------------------------------------------------
+# _get_dtype
+#-----------------------------------------------------------------------
+# Return the message type, using the first value if none is provided.
+def _get_dtype( values, dtype ):
+
+  if dtype is None:
+    if not len( values ) or not isinstance( values[0], Bits ):
+      raise TypeError( 'A dtype must be provided to pack values which '
+                       'are not Bits!' )
+    return values[0]
+
+  if isinstance( dtype, (int, long) ):
+    return Bits( dtype )
+
+  return dtype
+
+#-----------------------------------------------------------------------
+# _get_nbytes
+#-----------------------------------------------------------------------
+def _get_nbytes( nbits ):
+  return ( nbits + 7 ) // 8
+
+#-----------------------------------------------------------------------
+# _get_bytes
+#-----------------------------------------------------------------------
+# Return a byte string containing a range of an arbitrary buffer.
+def _get_bytes( buf, start, stop ):
+  chunk = buf[ start:stop ]
+  if isinstance( chunk, memoryview ):
+    return chunk.tobytes()
+  return bytes( chunk )
+
+#-----------------------------------------------------------------------
+# pack_many
+#-----------------------------------------------------------------------
+def pack_many( values, dtype = None ):
+  '''Pack a sequence of Bits/BitStructs (or integers) into bytes.
+
+  dtype defaults to the type of the first value, it is required when
+  packing plain integers.
+  '''
+
+  dtype  = _get_dtype( values, dtype )
+  nbits  = dtype.nbits
+  nbytes = _get_nbytes( nbits )
+
+  uints = []
+  for value in values:
+    if isinstance( value, Bits ):
+      if value.nbits != nbits:
+        raise ValueError( 'Cannot pack a {}-bit value as a {}-bit message!'
+                          .format( value.nbits, nbits ) )
+      uints.append( value._uint )
+    else:
+      uints.append( Bits( nbits, value )._uint )
+
+  # Widths that map onto native integers are packed in a single call
+
+  if nbytes in _struct_fmts:
+    return struct.pack( '<{}{}'.format( len( uints ), _struct_fmts[nbytes] ),
+                        *uints )
+
+  # Otherwise we format the values in big-endian hex in reverse order,
+  # so that reversing the entire byte string produces the little-endian
+  # bytes of each value in the original order.
+
+  fmt = '{{:0{}x}}'.format( 2*nbytes )
+  hexs = ''.join( [ fmt.format( x ) for x in reversed( uints ) ] )
+  return binascii.unhexlify( hexs )[::-1]
+
+#-----------------------------------------------------------------------
+# PackedBits
+#-----------------------------------------------------------------------
+class PackedBits( collections.Sequence ):
+  '''Lazy sequence of messages stored in a buffer by pack_many().
+
+  Messages are decoded into new dtype instances when they are accessed.
+  Use uints() to decode the entire sequence into integers at once.
+  '''
+
+  def __init__( self, buf, dtype, offset = 0, count = None ):
+
+    if isinstance( dtype, (int, long) ):
+      dtype = Bits( dtype )
+
+    self.dtype  = dtype
+    self.nbits  = dtype.nbits
+    self.nbytes = _get_nbytes( self.nbits )
+
+    size = len( buf ) - offset
+    if count is None:
+      count = size // self.nbytes
+    if count * self.nbytes > size:
+      raise ValueError( 'Buffer contains {} bytes, {} messages of {} bytes '
+                        'are needed!'.format( size, count, self.nbytes ) )
+
+    self._buf    = buf
+    self._offset = offset
+    self._count  = count
+    self._fmt    = _struct_fmts.get( self.nbytes )
+    if self._fmt:
+      self._fmt = '<' + self._fmt
+
+  #---------------------------------------------------------------------
+  # Sequence Methods
+  #---------------------------------------------------------------------
+
+  def __len__( self ):
+    return self._count
+
+  def __getitem__( self, idx ):
+
+    if isinstance( idx, slice ):
+      return [ self[i] for i in xrange( *idx.indices( self._count ) ) ]
+
+    if idx < 0:
+      idx += self._count
+    if not 0 <= idx < self._count:
+      raise IndexError( 'PackedBits index out of range' )
+
+    return self._make( self.uint( idx ) )
+
+  def __iter__( self ):
+    for x in self.uints():
+      yield self._make( x )
+
+  def _make( self, uint ):
+    value = self.dtype()
+    value._uint = uint & value._mask
+    return value
+
+  #---------------------------------------------------------------------
+  # uint
+  #---------------------------------------------------------------------
+  # Return the unsigned integer value of a single message.
+  def uint( self, idx ):
+
+    start = self._offset + idx * self.nbytes
+
+    if self._fmt:
+      return struct.unpack_from( self._fmt, self._buf, start )[0]
+
+    data = _get_bytes( self._buf, start, start + self.nbytes )
+    return int( binascii.hexlify( data[::-1] ), 16 )
+
+  #---------------------------------------------------------------------
+  # uints
+  #---------------------------------------------------------------------
+  def uints( self ):
+    'Return the unsigned integer values of all messages as a list.'
+
+    start = self._offset
+    stop  = self._offset + self._count * self.nbytes
+
+    if self._fmt:
+      fmt = '<{}{}'.format( self._count, self._fmt[1:] )
+      return list( struct.unpack_from( fmt, self._buf, start ) )
+
+    # Reverse of the approach used in pack_many()
+
+    width = 2*self.nbytes
+    hexs  = binascii.hexlify( _get_bytes( self._buf, start, stop )[::-1] )
+    uints = [ int( hexs[i:i+width], 16 )
+              for i in xrange( 0, len( hexs ), width ) ]
+    uints.reverse()
+    return uints
+
+  def __repr__( self ):
+    return 'PackedBits( {}, {} messages )'.format( self.nbits, self._count )
+
+#-----------------------------------------------------------------------
+# unpack_many
+#-----------------------------------------------------------------------
+def unpack_many( buf, dtype, count = None ):
+  '''Return a lazy sequence of dtype messages stored in buf.
+
+  buf can be bytes, bytearray, memoryview or mmap. By default all of the
+  complete messages in buf are returned.
+  '''
+  return PackedBits( buf, dtype, count=count )
+
+#-----------------------------------------------------------------------
+# save_many
+#-----------------------------------------------------------------------
+def save_many( filename, values, dtype = None ):
+  'Write a message stream to a file, see load_many().'
+
+  dtype = _get_dtype( values, dtype )
+  data  = pack_many( values, dtype )
+
+  with open( filename, 'wb' ) as fd:
+    fd.write( struct.pack( _header_fmt, _header_magic, _version,
+                           dtype.nbits, len( values ) ) )
+    fd.write( data )
+
+#-----------------------------------------------------------------------
+# load_many
+#-----------------------------------------------------------------------
+def load_many( filename, dtype = None ):
+  '''Map a message stream written by save_many() into memory.
+
+  Returns a lazy sequence of dtype messages, dtype defaults to Bits of
+  the bitwidth stored in the file.
+  '''
+
+  with open( filename, 'rb' ) as fd:
+
+    header = fd.read( _header_size )
+    if len( header ) < _header_size or not header.startswith( _header_magic ):
+      raise ValueError( '{} is not a message stream file!'.format( filename ) )
+
+    magic, version, nbits, count = struct.unpack( _header_fmt, header )
+    if version != _version:
+      raise ValueError( 'Unsupported message stream version {} in {}!'
+                        .format( version, filename ) )
+
+    if dtype is None:
+      dtype = Bits( nbits )
+    elif isinstance( dtype, (int, long) ):
+      dtype = Bits( dtype )
+
+    if dtype.nbits != nbits:
+      raise ValueError( '{} contains {}-bit messages, not {}-bit messages!'
+                        .format( filename, nbits, dtype.nbits ) )
+
+    # Empty files cannot be mapped
+
+    if not count:
+      return PackedBits( b'', dtype )
+
+    buf = mmap.mmap( fd.fileno(), 0, access=mmap.ACCESS_READ )
+
+  return PackedBits( buf, dtype, offset=_header_size, count=count )
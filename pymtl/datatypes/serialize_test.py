@@ -0,0 +1,182 @@
+#=======================================================================
+# serialize_test.py
+#=======================================================================
+
+import mmap
+import random
+import pytest
+
+from Bits      import Bits
+from BitStruct import BitStructDefinition, BitField
+from serialize import pack_many, unpack_many, save_many, load_many
+
+class SimpleMsg( BitStructDefinition ):
+
+  def __init__( s, addr_nbits, data_nbits ):
+    s.addr = BitField( addr_nbits )
+    s.data = BitField( data_nbits )
+
+class FixedMsg( BitStructDefinition ):
+
+  def __init__( s, addr_nbits=8, data_nbits=16 ):
+    s.addr = BitField( addr_nbits )
+    s.data = BitField( data_nbits )
+
+def rand_bits( nbits, size=32 ):
+  rgen = random.Random( nbits )
+  return [ Bits( nbits, rgen.randint( 0, 2**nbits-1 ) ) for _ in range( size ) ]
+
+#-----------------------------------------------------------------------
+# test_pack_many
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits', [ 1, 7, 8, 12, 16, 24, 32, 33, 64, 100 ] )
+def test_pack_unpack( nbits ):
+
+  values = rand_bits( nbits )
+  data   = pack_many( values )
+
+  assert len( data ) == len( values ) * ( (nbits+7) // 8 )
+
+  msgs = unpack_many( data, Bits( nbits ) )
+  assert len( msgs ) == len( values )
+  assert list( msgs ) == values
+  assert msgs.uints() == [ x.uint() for x in values ]
+  assert msgs[3] == values[3]
+  assert msgs[-1] == values[-1]
+  assert msgs[2:5] == values[2:5]
+  assert all( x.nbits == nbits for x in msgs )
+
+def test_pack_layout():
+
+  assert pack_many( [ Bits(12,0x123), Bits(12,0xabc) ] ) == b'\x23\x01\xbc\x0a'
+  assert pack_many( [ Bits(24,0x123456) ] ) == b'\x56\x34\x12'
+  assert pack_many( [ 1, 2 ], 16 ) == b'\x01\x00\x02\x00'
+  assert pack_many( [ -1 ], 8 ) == b'\xff'
+
+def test_pack_errors():
+
+  with pytest.raises( TypeError ):
+    pack_many( [ 1, 2 ] )
+  with pytest.raises( ValueError ):
+    pack_many( [ Bits( 8 ), Bits( 16 ) ] )
+  with pytest.raises( ValueError ):
+    pack_many( [ 256 ], 8 )
+  with pytest.raises( ValueError ):
+    unpack_many( b'\x00'*3, 16, count=2 )
+
+def test_unpack_buffers():
+
+  values = rand_bits( 24 )
+  data   = pack_many( values )
+
+  for buf in [ bytearray( data ), memoryview( data ),
+               memoryview( bytearray( data ) ) ]:
+    assert list( unpack_many( buf, 24 ) ) == values
+
+  # Partial messages at the end of a buffer are ignored
+
+  assert len( unpack_many( data + b'\x00', 24 ) ) == len( values )
+
+def test_unpack_mmap( tmpdir ):
+
+  values = rand_bits( 40 )
+  path   = tmpdir.join( 'trace.bin' )
+  path.write( pack_many( values ), 'wb' )
+
+  with open( str( path ), 'rb' ) as fd:
+    buf = mmap.mmap( fd.fileno(), 0, access=mmap.ACCESS_READ )
+    assert list( unpack_many( buf, 40 ) ) == values
+
+#-----------------------------------------------------------------------
+# test_bitstruct
+#-----------------------------------------------------------------------
+
+def test_pack_unpack_bitstruct():
+
+  dtype = SimpleMsg( 16, 32 )
+
+  values = []
+  for i in range( 10 ):
+    msg = dtype()
+    msg.addr = i
+    msg.data = 0xdead0000 + i
+    values.append( msg )
+
+  msgs = unpack_many( pack_many( values ), dtype )
+
+  for msg, ref in zip( msgs, values ):
+    assert isinstance( msg, type( dtype ) )
+    assert msg.addr == ref.addr
+    assert msg.data == ref.data
+
+def test_pack_unpack_classmethods():
+
+  dtype  = SimpleMsg( 16, 32 )
+  values = [ dtype() for _ in range( 4 ) ]
+  for i, msg in enumerate( values ):
+    msg.addr = i
+
+  data = SimpleMsg.pack_many( values )
+  assert data == pack_many( values )
+  assert [ x.addr for x in SimpleMsg.unpack_many( data, dtype ) ] == range( 4 )
+
+  bits = rand_bits( 12 )
+  data = Bits.pack_many( bits )
+  assert data == pack_many( bits )
+  assert list( Bits.unpack_many( data, 12 ) ) == bits
+  assert len( Bits.unpack_many( data, 12, count=2 ) ) == 2
+
+  with pytest.raises( TypeError ):
+    Bits.unpack_many( data )
+
+  # Values used as types are the default dtype
+
+  ints = [ x.uint() for x in bits ]
+  assert Bits( 12 ).pack_many( ints ) == data
+  assert list( Bits( 12 ).unpack_many( data ) ) == bits
+
+  data = dtype.pack_many( [ 0, 1, 2, 3 ] )
+  assert [ x.data for x in dtype.unpack_many( data ) ] == range( 4 )
+
+  # Definitions check the message type, and default to the type created
+  # without arguments
+
+  with pytest.raises( TypeError ):
+    FixedMsg.pack_many( values )
+
+  data = FixedMsg.pack_many( [ 0x1234 ] )
+  assert len( data ) == 3
+  assert FixedMsg.unpack_many( data )[0].data == 0x1234
+
+#-----------------------------------------------------------------------
+# test_save_load
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nbits', [ 8, 33 ] )
+def test_save_load( tmpdir, nbits ):
+
+  values = rand_bits( nbits, 100 )
+  path   = str( tmpdir.join( 'msgs.bin' ) )
+
+  save_many( path, values )
+  msgs = load_many( path )
+
+  assert msgs.nbits == nbits
+  assert list( msgs ) == values
+
+  with pytest.raises( ValueError ):
+    load_many( path, nbits+1 )
+
+def test_save_load_empty( tmpdir ):
+
+  path = str( tmpdir.join( 'msgs.bin' ) )
+  save_many( path, [], 8 )
+  assert len( load_many( path ) ) == 0
+
+def test_load_bad_file( tmpdir ):
+
+  path = tmpdir.join( 'msgs.bin' )
+  path.write( 'not a stream' )
+  with pytest.raises( ValueError ):
+    load_many( str( path ) )
@@ -49,11 +49,12 @@ class SomeMeta( MetaCollectArgs ):
     # >>> my_verilog_model = TranslationTool( MyVerilogModel( p1, p2 ) )
     #
 
-    # I think there is no way to turn on VCD dumping after the fact, so I
-    # think we have no choice but to always turn on VCD dumping for now
-    # if we are using Verilog import? -cbatten
+    # VCD dumping is configured after the fact by setting vcd_file on the
+    # new instance before it is elaborated. A vcd_file of None tells the
+    # TranslationTool to build the model without tracing and to switch to
+    # a traced build only if a VCD file is set.
 
-    inst.vcd_file = '__dummy__'
+    inst.vcd_file = None
 
     new_inst = TranslationTool( inst, lint=True )
 
@@ -16,6 +16,7 @@ import sim_utils as sim
 
 from sys               import flags
 from SimulationMetrics import SimulationMetrics, DummyMetrics
+from linetrace         import LineTraceBuffer, parse_line_trace_mode
 
 #-----------------------------------------------------------------------
 # SimulationTool
@@ -26,6 +27,9 @@ from SimulationMetrics import SimulationMetrics, DummyMetrics
 # execution in the Python interpreter.
 class SimulationTool( object ):
 
+  # Default line trace mode of new simulators, see linetrace.py
+  line_trace_mode = 'full'
+
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
@@ -44,7 +48,15 @@ class SimulationTool( object ):
     self._event_queue         = EventQueue()
     self._sequential_blocks   = []
     self._register_queue      = []
+    self._cycle_callbacks     = []
+    self._edge_callbacks      = []
+    self._trace_callbacks     = []
+    self._trace_resync        = []
+    self._trace_suspend       = []
+    self._tracing             = True
+    self._watchpoints         = []
     self._current_func        = None
+    self._line_trace          = None
 
     self._nets                = None # TODO: remove me
 
@@ -85,11 +97,58 @@ class SimulationTool( object ):
     self._nets              = nets
     self._sequential_blocks = sequential_blocks
 
-    # Setup vcd dumping if it's configured
+    # Select the line trace mode, tail mode captures the nets so this
+    # must be done after the nets have been created
+
+    self.set_line_trace_mode( self.line_trace_mode )
+
+    # Setup vcd dumping if it's configured, vcd files with the pwave
+    # extension are written in the compressed waveform format
 
     if hasattr( model, 'vcd_file' ) and model.vcd_file:
-      from vcd import VCDUtil
-      VCDUtil( self, model.vcd_file )
+      from waveform import WaveUtil, is_wave_file
+      if is_wave_file( model.vcd_file ):
+        WaveUtil( self, model.vcd_file )
+      else:
+        from vcd import VCDUtil
+        VCDUtil( self, model.vcd_file )
+
+    # Setup compressed waveform dumping if it's configured
+
+    if hasattr( model, 'wave_file' ) and model.wave_file:
+      from waveform import WaveUtil
+      WaveUtil( self, model.wave_file )
+
+    # Setup the flight recorder if it's configured, this keeps the value
+    # changes of the last history_cycles cycles, see history.py
+
+    if getattr( model, 'history_cycles', None ):
+      from history import HistoryRecorder
+      HistoryRecorder( self, model.history_cycles,
+                       getattr( model, 'history_file', None ) )
+
+    # Setup toggle coverage collection if it's configured, see toggle.py
+
+    if getattr( model, 'toggle_coverage', False ):
+      from toggle import ToggleCollector
+      ToggleCollector( self )
+
+    # Only trace the cycles in the window [trace_start, trace_stop) if
+    # a tracing window is configured
+
+    start = getattr( model, 'trace_start', None )
+    stop  = getattr( model, 'trace_stop',  None )
+
+    if self._trace_callbacks and ( start or stop is not None ):
+
+      if start:
+        self.trace_off()
+
+      def trace_window():
+        if self.ncycles == start: self.trace_on()
+        if self.ncycles == stop:  self.trace_off()
+
+      self._cycle_callbacks.append( trace_window )
 
   #---------------------------------------------------------------------
   # reset
@@ -101,13 +160,128 @@ class SimulationTool( object ):
     self.cycle()
     self.model.reset.v = 0
 
+  #---------------------------------------------------------------------
+  # trace_on
+  #---------------------------------------------------------------------
+  # Reattach the waveform tracing callbacks detached by trace_off().
+  def trace_on( self ):
+    if not self._tracing:
+      self._tracing = True
+      for net, func in self._trace_callbacks:
+        net.register_slice( func )
+      for func in self._trace_resync:
+        func()
+
+  #---------------------------------------------------------------------
+  # trace_off
+  #---------------------------------------------------------------------
+  # Detach the waveform tracing callbacks from all nets, so that the
+  # simulation runs at full speed until trace_on() is called. Pending
+  # changes of the current timestep are written out first.
+  def trace_off( self ):
+    if self._tracing:
+      for func in self._trace_suspend:
+        func()
+      self._tracing = False
+      for net, func in self._trace_callbacks:
+        net._slices.remove( func )
+
+  #---------------------------------------------------------------------
+  # _add_trace_callback
+  #---------------------------------------------------------------------
+  # Register a waveform tracing callback which is called immediately
+  # whenever the value of the net changes, see vcd.py.
+  def _add_trace_callback( self, net, func ):
+    self._trace_callbacks.append( ( net, func ) )
+    if self._tracing:
+      net.register_slice( func )
+
+  #---------------------------------------------------------------------
+  # _remove_trace_callbacks
+  #---------------------------------------------------------------------
+  # Remove the given waveform tracing callbacks for good, e.g., when the
+  # waveform is closed.
+  def _remove_trace_callbacks( self, funcs ):
+    funcs = set( funcs )
+    for net, func in self._trace_callbacks:
+      if func in funcs and self._tracing:
+        net._slices.remove( func )
+    self._trace_callbacks = [ x for x in self._trace_callbacks
+                              if x[1] not in funcs ]
+
+  #---------------------------------------------------------------------
+  # watch
+  #---------------------------------------------------------------------
+  # Run an action whenever a signal (given by its hierarchical name or
+  # its net) changes and the condition holds, see watch.py. Returns the
+  # Watchpoint, which can be removed with unwatch().
+  def watch( self, signal, condition = None, action = 'raise' ):
+    from watch import Watchpoint
+    watchpoint = Watchpoint( self, signal, condition, action )
+    self._watchpoints.append( watchpoint )
+    return watchpoint
+
+  #---------------------------------------------------------------------
+  # unwatch
+  #---------------------------------------------------------------------
+  # Remove a watchpoint, or all watchpoints if none is given.
+  def unwatch( self, watchpoint = None ):
+    watchpoints = [ watchpoint ] if watchpoint else self._watchpoints[:]
+    for x in watchpoints:
+      x.remove()
+      self._watchpoints.remove( x )
+
   #---------------------------------------------------------------------
   # print_line_trace
   #---------------------------------------------------------------------
   # Print cycle number and line trace of model.
+  #
+  # Note: see set_line_trace_mode for actual implementations.
   def print_line_trace( self ):
+    pass
+
+  #---------------------------------------------------------------------
+  # set_line_trace_mode
+  #---------------------------------------------------------------------
+  # Select what print_line_trace() does: 'full' prints the line trace
+  # every cycle, 'off' does nothing, and 'tail:N' captures the state of
+  # the model for the last N line traces, which are only formatted when
+  # they are printed with print_line_trace_tail().
+  def set_line_trace_mode( self, mode ):
+
+    mode, ncycles = parse_line_trace_mode( mode )
+
+    if mode == 'tail':
+      self._line_trace      = LineTraceBuffer( self, ncycles )
+      self.print_line_trace = self._line_trace.capture
+    else:
+      self._line_trace      = None
+      self.print_line_trace = self._full_line_trace if mode == 'full' \
+                         else self._no_line_trace
+
+  #---------------------------------------------------------------------
+  # _full_line_trace
+  #---------------------------------------------------------------------
+  # Implementation of print_line_trace() which prints every cycle.
+  def _full_line_trace( self ):
     print( "{:>3}:".format( self.ncycles ), self.model.line_trace() )
 
+  #---------------------------------------------------------------------
+  # _no_line_trace
+  #---------------------------------------------------------------------
+  # Implementation of print_line_trace() used when tracing is off.
+  def _no_line_trace( self ):
+    pass
+
+  #---------------------------------------------------------------------
+  # print_line_trace_tail
+  #---------------------------------------------------------------------
+  # Print the line traces captured in tail mode, optionally only those
+  # of the cycles in [start, stop).
+  def print_line_trace_tail( self, start = None, stop = None ):
+    if self._line_trace:
+      self._line_trace.dump( start, stop )
+
   #---------------------------------------------------------------------
   # cycle
   #---------------------------------------------------------------------
@@ -137,6 +311,10 @@ class SimulationTool( object ):
     # and events caused by clocked logic (below).
     self.metrics.start_tick()
 
+    # Call all callbacks sampling signals at the clock edge
+    for func in self._edge_callbacks:
+      func()
+
     # Call all rising edge triggered functions
     for func in self._sequential_blocks:
       func()
@@ -152,6 +330,10 @@ class SimulationTool( object ):
     # Increment the simulator cycle count
     self.ncycles += 1
 
+    # Call all end of cycle callbacks (e.g., vcd dumping)
+    for func in self._cycle_callbacks:
+      func()
+
     # Tell the metrics module to prepare for the next cycle
     self.metrics.incr_metrics_cycle()
 
@@ -164,6 +346,10 @@ class SimulationTool( object ):
     # Call all events generated by input changes
     self.eval_combinational()
 
+    # Call all callbacks sampling signals at the clock edge
+    for func in self._edge_callbacks:
+      func()
+
     # Call all rising edge triggered functions
     for func in self._sequential_blocks:
       func()
@@ -179,6 +365,47 @@ class SimulationTool( object ):
     # Increment the simulator cycle count
     self.ncycles += 1
 
+    # Call all end of cycle callbacks (e.g., vcd dumping)
+    for func in self._cycle_callbacks:
+      func()
+
+  #---------------------------------------------------------------------
+  # can_skip_cycles
+  #---------------------------------------------------------------------
+  # Returns True if nothing needs to observe the model every cycle,
+  # i.e., there are no edge, end of cycle or trace callbacks (vcd
+  # dumping, history, coverage, watchpoints) and the line trace is off.
+  def can_skip_cycles( self ):
+    return not self._has_cycle_callbacks() \
+           and self.print_line_trace == self._no_line_trace
+
+  def _has_cycle_callbacks( self ):
+    return bool( self._edge_callbacks or self._cycle_callbacks
+                 or self._trace_callbacks or self._watchpoints )
+
+  #---------------------------------------------------------------------
+  # skip_cycles
+  #---------------------------------------------------------------------
+  # Account for ncycles clock cycles which were simulated outside of the
+  # simulator, e.g., by the run_cycles method of models translated with
+  # TranslationTool. Not allowed if there are callbacks which would miss
+  # these cycles, and no line trace is printed for them.
+  def skip_cycles( self, ncycles ):
+
+    if self._has_cycle_callbacks():
+      raise Exception( "cannot skip cycles while the simulation is being "
+                       "traced or has cycle callbacks!" )
+
+    # Call all events generated by the outputs of the skipped cycles
+    self.eval_combinational()
+
+    # Increment the simulator cycle count
+    self.ncycles += ncycles
+
+    # Tell the metrics module about the skipped cycles
+    for i in xrange( ncycles ):
+      self.metrics.incr_metrics_cycle()
+
   #---------------------------------------------------------------------
   # eval_combinational
   #---------------------------------------------------------------------
@@ -0,0 +1,244 @@
+#=======================================================================
+# history.py
+#=======================================================================
+# Flight recorder which keeps the value changes of the last N cycles of
+# a simulation, so that a failure deep into a long simulation can be
+# debugged without rerunning it with full waveform tracing.
+#
+# Every recorded net has a preallocated ring buffer of time stamps and
+# values. Nets change at most twice per cycle once changes are coalesced
+# per timestep (see vcd.py), so rings of 2N+1 entries always contain the
+# value of the net at the start of the window: the memory cost only
+# depends on N and on the number of recorded nets.
+#
+# The recorder is enabled with the following attributes of the
+# top-level model:
+#
+#  - history_cycles  : number of cycles to keep
+#  - history_file    : dump file name, the .pwave extension selects the
+#                      compressed waveform format (default: VCD file
+#                      named after the model)
+#  - history_include, history_exclude, history_depth : select the
+#                      recorded signals, see get_trace_filter() in vcd.py
+#
+# The window is dumped automatically when cycling the simulator raises
+# an exception (e.g., a TestSinkError), or explicitly by calling
+# sim.history.dump().
+
+from __future__ import print_function
+
+import sys
+import time
+
+from vcd      import walk_signal_defs, get_vcd_timescale, mangle_name
+from waveform import WaveWriter, write_vcd, is_wave_file
+
+#-----------------------------------------------------------------------
+# HistoryRecorder
+#-----------------------------------------------------------------------
+class HistoryRecorder( object ):
+
+  def __init__( self, simulator, ncycles, filename = None ):
+
+    model = simulator.model
+
+    self.sim      = simulator
+    self.ncycles  = ncycles
+    self.filename = filename or '{}.history.vcd'.format( model.class_name )
+    self.capacity = capacity = 2*ncycles + 1
+    self.nets     = []
+    self.signals  = []
+
+    self._time    = 0
+    self._clk     = None
+
+    # Assign an id to every recorded net and allocate its ring buffer
+
+    scope = []
+    for item in walk_signal_defs( model, '_hist_id', 'history' ):
+
+      if item[0] == 'scope':
+        scope.append( item[1].name )
+
+      elif item[0] == 'upscope':
+        scope.pop()
+
+      else:
+        _, i, net, is_new = item
+        if is_new:
+          net._hist_id = len( self.nets )
+          self.nets.append( net )
+          if i.name == 'clk' and len( scope ) == 1:
+            self._clk = net
+          else:
+            net._hist_dirty  = False
+            net._hist_last   = net.uint()
+            net._hist_pos    = 1
+            net._hist_times  = [ 0 ] * capacity
+            net._hist_values = [ 0 ] * capacity
+            net._hist_values[0] = net._hist_last
+        self.signals.append( [ scope[:], mangle_name( i.name ),
+                               net._hist_id ] )
+
+    self._insert_callbacks()
+
+    simulator.history = self
+
+  #---------------------------------------------------------------------
+  # _insert_callbacks
+  #---------------------------------------------------------------------
+  # Record changes using the same approach as the vcd writer: callbacks
+  # mark nets as dirty, and dirty nets are recorded when the timestep
+  # ends. The callbacks are not detached by sim.trace_off().
+  def _insert_callbacks( self ):
+
+    sim      = self.sim
+    capacity = self.capacity
+    dirty    = []
+
+    def record():
+      now = self._time
+      for net in dirty:
+        net._hist_dirty = False
+        value = net.uint()
+        if value != net._hist_last:
+          net._hist_last = value
+          pos  = net._hist_pos
+          prev = ( pos-1 ) % capacity
+          if net._hist_times[ prev ] == now:
+            net._hist_values[ prev ] = value
+          else:
+            idx = pos % capacity
+            net._hist_times [ idx ] = now
+            net._hist_values[ idx ] = value
+            net._hist_pos = pos+1
+      del dirty[:]
+
+    def create_callback( net ):
+      def cb():
+        if not net._hist_dirty:
+          net._hist_dirty = True
+          dirty.append( net )
+      return cb
+
+    # The clock ends the current timestep
+
+    def clk_cb():
+      record()
+      self._time = 100*sim.ncycles + 50*self._clk.uint()
+
+    # Changes made by sequential logic are recorded under the rising
+    # edge, this also keeps time when the clock is not toggled (-O)
+
+    def end_of_cycle():
+      self._time = 100*sim.ncycles - 50
+      record()
+
+    for net in self.nets:
+      if net is self._clk: net.register_slice( clk_cb )
+      else:                net.register_slice( create_callback( net ) )
+
+    sim._cycle_callbacks.append( end_of_cycle )
+    self._record = record
+
+    # Dump the window when cycling the simulator fails, the original
+    # exception is reraised with its traceback
+
+    cycle = sim.cycle
+
+    def cycle_and_record():
+      try:
+        cycle()
+      except Exception:
+        exc_info = sys.exc_info()
+        try:
+          filename = self.dump()
+          print( 'Dumped the last {} cycles to {}'.format( self.ncycles,
+                 filename ), file=sys.stderr )
+        except Exception as e:
+          print( 'Failed to dump the last {} cycles: {}'.format(
+                 self.ncycles, e ), file=sys.stderr )
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+    sim.cycle = cycle_and_record
+
+  #---------------------------------------------------------------------
+  # window
+  #---------------------------------------------------------------------
+  # Return the recorded window as ( start time, initial values, changes )
+  # where changes is a list of ( time, [ ( net id, value ) ] ) tuples.
+  def window( self ):
+
+    # Record any changes made since the last timestep ended
+
+    self._record()
+
+    end   = max( self._time, 100*self.sim.ncycles - 50, 0 )
+    start = 100*max( self.sim.ncycles - self.ncycles, 0 )
+    start = min( start, end )
+
+    init    = []
+    changes = {}
+
+    for net in self.nets:
+
+      if net is self._clk:
+        init.append( ( start // 50 ) & 1 )
+        continue
+
+      # Entries in the ring from oldest to newest
+
+      pos   = net._hist_pos
+      count = min( pos, self.capacity )
+      idxs  = [ i % self.capacity for i in xrange( pos-count, pos ) ]
+
+      value = net._hist_values[ idxs[0] ]
+      for i in idxs:
+        t = net._hist_times[ i ]
+        if t <= start:
+          value = net._hist_values[ i ]
+        else:
+          changes.setdefault( t, [] ).append( ( net._hist_id,
+                                                net._hist_values[ i ] ) )
+      init.append( value )
+
+    # Recreate the clock edges
+
+    if self._clk is not None:
+      clk_id = self._clk._hist_id
+      for t in xrange( start + 50, end + 1, 50 ):
+        changes.setdefault( t, [] ).insert( 0, ( clk_id, ( t // 50 ) & 1 ) )
+
+    return start, init, sorted( changes.items() )
+
+  #---------------------------------------------------------------------
+  # dump
+  #---------------------------------------------------------------------
+  def dump( self, filename = None ):
+    '''Write the recorded window as VCD or pwave (selected by the file
+    extension) and return the file name.'''
+
+    filename = filename or self.filename
+    start, init, changes = self.window()
+
+    defs = {
+      'date'      : time.asctime(),
+      'timescale' : get_vcd_timescale( self.sim.model ),
+      'nbits'     : [ net.nbits for net in self.nets ],
+      'init'      : [ '{:x}'.format( x ) for x in init ],
+      'signals'   : self.signals,
+    }
+
+    if is_wave_file( filename ):
+      writer = WaveWriter( filename, defs )
+      writer.set_time( start )
+      for t, values in changes:
+        writer.set_time( t )
+        writer.write_changes( values )
+      writer.close()
+
+    else:
+      with open( filename, 'w' ) as o:
+        write_vcd( o, defs, init, [ ( start, [] ) ] + changes )
+
+    return filename
@@ -0,0 +1,116 @@
+#=======================================================================
+# history_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl         import *
+from waveform      import WaveReader
+from waveform_test import Counter, run_counter, replay_vcd
+
+#-----------------------------------------------------------------------
+# test_history_vcd
+#-----------------------------------------------------------------------
+# The dumped window should match the end of a full vcd trace.
+
+def test_history_vcd( tmpdir ):
+
+  vcd_file  = str( tmpdir.join( 'counter.vcd' ) )
+  hist_file = str( tmpdir.join( 'history.vcd' ) )
+
+  model, sim, counts = run_counter( tmpdir, 100, vcd_file=vcd_file,
+                                    history_cycles=10,
+                                    history_file=hist_file )
+  sim.vcd.flush()
+
+  assert sim.history.dump() == hist_file
+
+  defs, full = replay_vcd( vcd_file )
+  _,    hist = replay_vcd( hist_file )
+
+  # replay_vcd() inserts the initial values at time zero
+
+  start = 100*( sim.ncycles - 10 )
+  hist  = hist[1:]
+  assert hist[0][0] == start
+  assert hist == [ x for x in full if x[0] >= start ]
+
+#-----------------------------------------------------------------------
+# test_history_wave
+#-----------------------------------------------------------------------
+
+def test_history_wave( tmpdir ):
+
+  hist_file = str( tmpdir.join( 'history.pwave' ) )
+
+  model, sim, counts = run_counter( tmpdir, 200, history_cycles=25,
+                                    history_exclude='top.sub.*' )
+  sim.history.dump( hist_file )
+
+  wave = WaveReader( hist_file )
+
+  assert 'top.count' in wave.signals
+  assert not [ x for x in wave.signals if x.startswith( 'top.sub.' ) ]
+
+  for cycle, count in counts[-25:]:
+    values = wave.values_at( wave.cycle_time( cycle ) )
+    assert values['top.count'] == count
+    assert values['top.clk']   == 1
+
+#-----------------------------------------------------------------------
+# test_history_bounded
+#-----------------------------------------------------------------------
+# Ring buffers are allocated up front and never grow.
+
+def test_history_bounded( tmpdir ):
+
+  model, sim, counts = run_counter( tmpdir, 5, history_cycles=8 )
+
+  rings = [ ( net._hist_times, net._hist_values )
+            for net in sim.history.nets if net is not model.clk ]
+  assert rings
+  assert all( len( t ) == len( v ) == 17 for t, v in rings )
+
+  for i in range( 100 ):
+    sim.cycle()
+
+  assert rings == [ ( net._hist_times, net._hist_values )
+                    for net in sim.history.nets if net is not model.clk ]
+  assert all( len( t ) == len( v ) == 17 for t, v in rings )
+
+#-----------------------------------------------------------------------
+# test_history_exception
+#-----------------------------------------------------------------------
+# The window is dumped when cycling the simulator raises an exception.
+
+class Failing( Counter ):
+
+  def __init__( s ):
+    Counter.__init__( s )
+
+    @s.tick
+    def check():
+      if s.count == 20:
+        raise ValueError( 'count reached 20' )
+
+def test_history_exception( tmpdir ):
+
+  hist_file = str( tmpdir.join( 'history.pwave' ) )
+
+  model = Failing()
+  model.history_cycles = 10
+  model.history_file   = hist_file
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.reset()
+  model.en.value = 1
+
+  with pytest.raises( ValueError ):
+    for i in range( 100 ):
+      sim.cycle()
+
+  wave   = WaveReader( hist_file )
+  values = wave.values_at( wave.end_time )
+  assert values['top.count'] == 20
+  assert wave.values_at( wave.cycle_time( sim.ncycles-5 ) )['top.count'] == 16
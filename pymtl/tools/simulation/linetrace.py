@@ -0,0 +1,184 @@
+#=======================================================================
+# linetrace.py
+#=======================================================================
+# Deferred line tracing for SimulationTool.
+#
+# Formatting line traces every cycle (valrdy_to_str, message __str__,
+# etc. for every submodule) is often the largest cost of a passing test,
+# even though the traces of passing tests are never read. The line trace
+# mode of the simulator selects what print_line_trace() does:
+#
+#  - 'full'   : format and print the line trace every cycle
+#  - 'off'    : do nothing
+#  - 'tail:N' : capture the raw values of all nets in a ring buffer of
+#               the last N calls, without formatting anything
+#
+# Captured line traces are only formatted when they are printed: the
+# recorded net values are temporarily written back into the model (the
+# simulator is not notified) and model.line_trace() is called for every
+# captured cycle. Line traces should therefore depend on signal values,
+# models which also print Python state (e.g., the index of a test
+# source) can list the attributes to capture in line_trace_attrs.
+#
+# The mode defaults to SimulationTool.line_trace_mode, which the pytest
+# --line-trace option sets for the whole test session. Both default to
+# 'full', since the tail mode prints wrong traces for models which print
+# Python state without listing it in line_trace_attrs (e.g., TestSource,
+# TestMemory, the CL queues). With --line-trace=tail:N the tails of the
+# simulators of a failing test are printed in the test report.
+
+from __future__ import print_function
+
+import sys
+import copy
+import weakref
+
+from ...datatypes.Bits import Bits
+
+#-----------------------------------------------------------------------
+# parse_line_trace_mode
+#-----------------------------------------------------------------------
+# Returns a ( mode, ncycles ) tuple, ncycles is only used by tail mode.
+def parse_line_trace_mode( mode ):
+
+  if mode in ( 'full', 'off' ):
+    return mode, None
+
+  if mode.startswith( 'tail:' ):
+    try:
+      ncycles = int( mode[5:] )
+    except ValueError:
+      ncycles = 0
+    if ncycles > 0:
+      return 'tail', ncycles
+
+  raise ValueError( 'Invalid line trace mode "{}", use off, tail:N or full!'
+                    .format( mode ) )
+
+#-----------------------------------------------------------------------
+# LineTraceBuffer
+#-----------------------------------------------------------------------
+class LineTraceBuffer( object ):
+  '''Ring buffer of the net values of the last ncycles line traces.
+
+  >>> buf = LineTraceBuffer( sim, 100 )
+  >>> buf.capture()
+  >>> print( buf.format() )
+  '''
+
+  def __init__( self, simulator, ncycles ):
+
+    self.sim     = simulator
+    self.ncycles = ncycles
+
+    self._ring   = [ None ] * ncycles
+    self._pos    = 0
+
+    # Bits nets are captured as integers, other values (e.g., wrapped
+    # classes) are copied
+
+    self._bits   = []
+    self._others = []
+    self._models = []
+
+    seen = set()
+    def collect( model ):
+      for i in model.get_ports() + model.get_wires():
+        net = i._signalvalue
+        if id( net ) in seen or net.is_constant():
+          continue
+        seen.add( id( net ) )
+        if isinstance( net, Bits ): self._bits.append( net )
+        else:                       self._others.append( net )
+      if getattr( model, 'line_trace_attrs', None ):
+        self._models.append( model )
+      for submodel in model.get_submodules():
+        collect( submodel )
+
+    collect( simulator.model )
+
+    _buffers.add( self )
+
+  #---------------------------------------------------------------------
+  # capture
+  #---------------------------------------------------------------------
+  # Record the current state, called in place of print_line_trace().
+  def capture( self ):
+    self._ring[ self._pos % self.ncycles ] = self._snapshot()
+    self._pos += 1
+
+  def _snapshot( self ):
+    return ( self.sim.ncycles,
+             [ net._uint for net in self._bits ],
+             [ copy.copy( net ) for net in self._others ],
+             [ [ copy.copy( getattr( m, name ) )
+                 for name in m.line_trace_attrs ] for m in self._models ] )
+
+  def _restore( self, snapshot ):
+
+    ncycles, bits, others, attrs = snapshot
+
+    for net, value in zip( self._bits, bits ):
+      net._uint = value
+    for net, value in zip( self._others, others ):
+      net.write_value( value )
+    for m, values in zip( self._models, attrs ):
+      for name, value in zip( m.line_trace_attrs, values ):
+        setattr( m, name, value )
+
+  #---------------------------------------------------------------------
+  # lines
+  #---------------------------------------------------------------------
+  def lines( self, start = None, stop = None ):
+    '''Format the captured line traces of the cycles in [start, stop),
+    the model is restored to its current state afterwards.'''
+
+    count    = min( self._pos, self.ncycles )
+    entries  = [ self._ring[ i % self.ncycles ]
+                 for i in xrange( self._pos - count, self._pos ) ]
+    entries  = [ x for x in entries
+                 if ( start is None or x[0] >= start ) and
+                    ( stop  is None or x[0] <  stop  ) ]
+
+    current = self._snapshot()
+    lines   = []
+    try:
+      for snapshot in entries:
+        self._restore( snapshot )
+        lines.append( '{:>3}: {}'.format( snapshot[0],
+                                          self.sim.model.line_trace() ) )
+    finally:
+      self._restore( current )
+
+    return lines
+
+  #---------------------------------------------------------------------
+  # format
+  #---------------------------------------------------------------------
+  def format( self, start = None, stop = None ):
+    return '\n'.join( self.lines( start, stop ) )
+
+  #---------------------------------------------------------------------
+  # dump
+  #---------------------------------------------------------------------
+  def dump( self, start = None, stop = None, out = None ):
+    'Print the captured line traces of the cycles in [start, stop).'
+    for line in self.lines( start, stop ):
+      print( line, file=out or sys.stdout )
+
+  def __len__( self ):
+    return min( self._pos, self.ncycles )
+
+#-----------------------------------------------------------------------
+# Active buffers
+#-----------------------------------------------------------------------
+# Buffers of live simulators, used by the pytest plugin in conftest.py
+# to print the line traces of failing tests.
+
+_buffers = weakref.WeakSet()
+
+def active_line_traces():
+  return [ x for x in _buffers if len( x ) ]
+
+def clear_line_traces():
+  _buffers.clear()
@@ -0,0 +1,149 @@
+#=======================================================================
+# linetrace_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl     import *
+from linetrace import LineTraceBuffer, parse_line_trace_mode, \
+                      active_line_traces
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+# line_trace() prints signals and a Python counter listed in
+# line_trace_attrs.
+
+class Counter( Model ):
+
+  line_trace_attrs = [ 'nticks' ]
+
+  def __init__( s ):
+    s.en     = InPort ( 1  )
+    s.count  = OutPort( 16 )
+    s.nticks = 0
+    s.ntraces = 0
+
+    @s.tick
+    def seq():
+      s.nticks += 1
+      if   s.reset: s.count.next = 0
+      elif s.en:    s.count.next = s.count + 1
+
+  def line_trace( s ):
+    s.ntraces += 1
+    return format_trace( s )
+
+def format_trace( s ):
+  return '{} {} ({})'.format( s.en, s.count, s.nticks )
+
+def run_counter( mode, ncycles = 20 ):
+
+  model = Counter()
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.set_line_trace_mode( mode )
+  sim.reset()
+
+  lines = []
+  for i in range( ncycles ):
+    model.en.value = i % 3 != 0
+    sim.eval_combinational()
+    lines.append( '{:>3}: {}'.format( sim.ncycles, format_trace( model ) ) )
+    sim.print_line_trace()
+    sim.cycle()
+
+  return model, sim, lines
+
+#-----------------------------------------------------------------------
+# test_parse_line_trace_mode
+#-----------------------------------------------------------------------
+
+def test_parse_line_trace_mode():
+
+  assert parse_line_trace_mode( 'full'     ) == ( 'full', None )
+  assert parse_line_trace_mode( 'off'      ) == ( 'off',  None )
+  assert parse_line_trace_mode( 'tail:100' ) == ( 'tail', 100  )
+
+  for mode in [ 'tail', 'tail:0', 'tail:x', 'on' ]:
+    with pytest.raises( ValueError ):
+      parse_line_trace_mode( mode )
+
+#-----------------------------------------------------------------------
+# test_line_trace_tail
+#-----------------------------------------------------------------------
+
+def test_line_trace_tail():
+
+  model, sim, ref = run_counter( 'tail:8' )
+
+  # Nothing is formatted until the tail is printed
+
+  buf = sim._line_trace
+  assert isinstance( buf, LineTraceBuffer )
+  assert len( buf ) == 8
+  assert model.ntraces == 0
+  assert buf in active_line_traces()
+
+  assert buf.lines() == ref[-8:]
+  assert model.ntraces == 8
+
+  # Printing restores the current state of the model
+
+  count = int( model.count )
+  sim.cycle()
+  assert model.count == count + 1
+  assert model.nticks == sim.ncycles
+
+  # Windows are selected by cycle number
+
+  assert buf.lines( start=15, stop=18 ) == \
+         [ x for x in ref if 15 <= int( x.split( ':' )[0] ) < 18 ]
+
+def test_line_trace_off():
+
+  model, sim, ref = run_counter( 'off' )
+  assert sim._line_trace is None
+  assert model.ntraces == 0
+
+def test_line_trace_full():
+
+  model, sim, ref = run_counter( 'full', ncycles=3 )
+  assert sim._line_trace is None
+  assert model.ntraces == 3
+
+#-----------------------------------------------------------------------
+# test_skip_cycles
+#-----------------------------------------------------------------------
+# Cycles simulated outside of the simulator can be skipped if no
+# callbacks need to see every cycle, which is only done by default if
+# the line trace is off as well.
+
+def test_skip_cycles():
+
+  model, sim, ref = run_counter( 'off', ncycles=3 )
+  assert sim.can_skip_cycles()
+  sim.skip_cycles( 5 )
+  assert sim.ncycles == 3 + 2 + 5
+
+  # No line trace is printed for the skipped cycles
+
+  for mode in [ 'full', 'tail:8' ]:
+    model, sim, ref = run_counter( mode, ncycles=3 )
+    assert not sim.can_skip_cycles()
+    ntraces = model.ntraces
+    sim.skip_cycles( 5 )
+    assert model.ntraces == ntraces and sim.ncycles == 3 + 2 + 5
+
+  # Callbacks would miss the skipped cycles
+
+  model, sim, ref = run_counter( 'off', ncycles=3 )
+  wp = sim.watch( 'count' )
+  assert not sim.can_skip_cycles()
+  with pytest.raises( Exception ):
+    sim.skip_cycles( 5 )
+  assert sim.ncycles == 3 + 2
+
+  sim.unwatch( wp )
+  assert sim.can_skip_cycles()
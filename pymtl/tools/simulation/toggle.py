@@ -0,0 +1,325 @@
+#=======================================================================
+# toggle.py
+#=======================================================================
+# Toggle coverage and switching activity collection for SimulationTool.
+#
+# The collector counts, for every bit of every net, the number of cycles
+# in which the bit rose (0->1) and fell (1->0). Nets only mark themselves
+# dirty when they change, and the dirty nets are processed once at the
+# end of each cycle: the bits which changed are found with an XOR of the
+# old and new value, and are added to per-bit counters stored as
+# bit-planes (plane k holds bit k of the counter of every bit of the
+# net), so that a cycle costs a few integer operations per changed net
+# regardless of its bitwidth. Glitches which settle within a cycle are
+# not counted, and the clock is not collected.
+#
+# Collection is enabled with the following attributes of the top-level
+# model:
+#
+#  - toggle_coverage : enable toggle collection
+#  - toggle_include, toggle_exclude, toggle_depth : select the collected
+#                      signals, see get_trace_filter() in vcd.py
+#
+# sim.toggles.report() returns a ToggleReport which provides per-signal
+# and per-module (following the get_submodules() hierarchy) statistics,
+# and which can be exported to JSON or CSV. JSON reports of the same
+# design (e.g., written by parallel test workers) can be merged:
+#
+#   % python -m pymtl.tools.simulation.toggle --json merged.json a.json b.json
+#   % python -m pymtl.tools.simulation.toggle --csv merged.csv a.json b.json
+
+from __future__ import print_function
+
+import csv
+import json
+import argparse
+
+from vcd import walk_signal_defs, mangle_name
+
+from ...datatypes.Bits import Bits
+
+_version = 1
+
+#-----------------------------------------------------------------------
+# Bit-plane counters
+#-----------------------------------------------------------------------
+# A counter is a list of integers where bit i of plane k is bit k of the
+# count of bit i, adding a mask increments the count of each set bit.
+
+def _planes_add( planes, mask ):
+  k = 0
+  while mask:
+    if k == len( planes ):
+      planes.append( mask )
+      return
+    plane       = planes[k]
+    planes[k]   = plane ^ mask
+    mask        = plane & mask
+    k          += 1
+
+def _planes_counts( planes, nbits ):
+  return [ sum( ( ( plane >> i ) & 1 ) << k
+                for k, plane in enumerate( planes ) )
+           for i in range( nbits ) ]
+
+def _popcount( x ):
+  return bin( x ).count( '1' )
+
+#-----------------------------------------------------------------------
+# ToggleCollector
+#-----------------------------------------------------------------------
+class ToggleCollector( object ):
+
+  def __init__( self, simulator ):
+
+    self.sim     = simulator
+    self.nets    = []
+    self.signals = []
+    self.start   = simulator.ncycles
+
+    # Assign an id to every collected net
+
+    clk   = simulator.model.clk
+    scope = []
+    for item in walk_signal_defs( simulator.model, '_tgl_id', 'toggle' ):
+
+      if item[0] == 'scope':
+        scope.append( mangle_name( item[1].name ) )
+
+      elif item[0] == 'upscope':
+        scope.pop()
+
+      else:
+        _, i, net, is_new = item
+        if net is clk or not isinstance( net, Bits ):
+          continue
+        if is_new:
+          net._tgl_id    = len( self.nets )
+          net._tgl_dirty = False
+          net._tgl_last  = net.uint()
+          net._tgl_rise  = []
+          net._tgl_fall  = []
+          net._tgl_count = 0
+          self.nets.append( net )
+        self.signals.append( ( '.'.join( scope + [ mangle_name( i.name ) ] ),
+                               net._tgl_id ) )
+
+    self._insert_callbacks()
+
+    simulator.toggles = self
+
+  #---------------------------------------------------------------------
+  # _insert_callbacks
+  #---------------------------------------------------------------------
+  def _insert_callbacks( self ):
+
+    dirty = []
+
+    def create_callback( net ):
+      def cb():
+        if not net._tgl_dirty:
+          net._tgl_dirty = True
+          dirty.append( net )
+      return cb
+
+    # Count the bits which changed in the cycle
+
+    def end_of_cycle():
+      for net in dirty:
+        net._tgl_dirty = False
+        last    = net._tgl_last
+        value   = net.uint()
+        changed = last ^ value
+        if changed:
+          _planes_add( net._tgl_rise, changed & value )
+          _planes_add( net._tgl_fall, changed & last  )
+          net._tgl_count += _popcount( changed )
+          net._tgl_last   = value
+      del dirty[:]
+
+    for net in self.nets:
+      net.register_slice( create_callback( net ) )
+
+    self.sim._cycle_callbacks.append( end_of_cycle )
+
+  #---------------------------------------------------------------------
+  # activity
+  #---------------------------------------------------------------------
+  def activity( self ):
+    '''Return the total number of bit toggles of each signal so far,
+    without computing per-bit counts.'''
+    return { name : self.nets[ net_id ]._tgl_count
+             for name, net_id in self.signals }
+
+  #---------------------------------------------------------------------
+  # report
+  #---------------------------------------------------------------------
+  def report( self ):
+    'Return a ToggleReport of the counts collected so far.'
+
+    nets = [ { 'nbits' : net.nbits,
+               'rise'  : _planes_counts( net._tgl_rise, net.nbits ),
+               'fall'  : _planes_counts( net._tgl_fall, net.nbits ) }
+             for net in self.nets ]
+
+    return ToggleReport( self.sim.ncycles - self.start, nets,
+                         [ list( x ) for x in self.signals ] )
+
+#-----------------------------------------------------------------------
+# ToggleReport
+#-----------------------------------------------------------------------
+class ToggleReport( object ):
+  '''Per-bit rise and fall counts of the nets of a design.
+
+  >>> report = sim.toggles.report()
+  >>> report.signal( 'top.out' )['coverage']
+  >>> report.module( 'top.core' )['toggles']
+  >>> report.to_json( 'toggles.json' )
+  '''
+
+  def __init__( self, ncycles, nets, signals ):
+    self.ncycles = ncycles
+    self.nets    = nets
+    self.signals = signals
+
+    self._net_ids = { name : net_id for name, net_id in signals }
+
+  #---------------------------------------------------------------------
+  # Statistics
+  #---------------------------------------------------------------------
+
+  def _stats( self, net_ids ):
+
+    nbits = rises = falls = covered = 0
+    for net_id in net_ids:
+      net      = self.nets[ net_id ]
+      nbits   += net['nbits']
+      rises   += sum( net['rise'] )
+      falls   += sum( net['fall'] )
+      covered += sum( 1 for r, f in zip( net['rise'], net['fall'] )
+                        if r and f )
+
+    return { 'nbits'    : nbits,
+             'rises'    : rises,
+             'falls'    : falls,
+             'toggles'  : rises + falls,
+             'covered'  : covered,
+             'coverage' : float( covered ) / nbits if nbits else 1.0,
+             'activity' : float( rises + falls ) / ( nbits * self.ncycles )
+                          if nbits and self.ncycles else 0.0 }
+
+  def signal( self, name ):
+    'Statistics of a signal, a bit is covered if it rose and fell.'
+    return self._stats( [ self._net_ids[ name ] ] )
+
+  def module( self, path ):
+    '''Statistics of the nets of a module and of its submodules, each
+    net is counted once even if it is connected to several ports.'''
+    prefix  = path + '.'
+    net_ids = set( net_id for name, net_id in self.signals
+                   if name.startswith( prefix ) )
+    if not net_ids:
+      raise KeyError( path )
+    return self._stats( net_ids )
+
+  def modules( self ):
+    'Return the hierarchical names of all modules with collected signals.'
+    paths = set()
+    for name, _ in self.signals:
+      parts = name.split( '.' )
+      for i in range( 1, len( parts ) ):
+        paths.add( '.'.join( parts[:i] ) )
+    return sorted( paths )
+
+  def untoggled( self ):
+    'Return ( signal, bit ) tuples of the bits which did not rise and fall.'
+    return [ ( name, i ) for name, net_id in self.signals
+             for i, ( r, f ) in enumerate( zip( self.nets[ net_id ]['rise'],
+                                                self.nets[ net_id ]['fall'] ) )
+             if not ( r and f ) ]
+
+  #---------------------------------------------------------------------
+  # merge
+  #---------------------------------------------------------------------
+  def merge( self, other ):
+    'Add the counts of a report of the same design to this report.'
+
+    if other.signals != self.signals or \
+       [ x['nbits'] for x in other.nets ] != [ x['nbits'] for x in self.nets ]:
+      raise ValueError( 'Cannot merge toggle reports of different designs!' )
+
+    self.ncycles += other.ncycles
+    for net, other_net in zip( self.nets, other.nets ):
+      for key in ( 'rise', 'fall' ):
+        net[ key ] = [ x + y for x, y in zip( net[ key ], other_net[ key ] ) ]
+
+    return self
+
+  #---------------------------------------------------------------------
+  # JSON
+  #---------------------------------------------------------------------
+  def to_json( self, filename ):
+    with open( filename, 'w' ) as fd:
+      json.dump( { 'version' : _version,
+                   'ncycles' : self.ncycles,
+                   'nets'    : self.nets,
+                   'signals' : self.signals }, fd, separators=(',',':') )
+
+  @classmethod
+  def from_json( cls, filename ):
+    with open( filename ) as fd:
+      data = json.load( fd )
+    if data.get( 'version' ) != _version:
+      raise ValueError( '{} is not a toggle report!'.format( filename ) )
+    signals = [ [ str( name ), net_id ] for name, net_id in data['signals'] ]
+    return cls( data['ncycles'], data['nets'], signals )
+
+  #---------------------------------------------------------------------
+  # CSV
+  #---------------------------------------------------------------------
+  def to_csv( self, filename ):
+    'Write one row per signal followed by one row per module.'
+
+    fields = [ 'nbits', 'rises', 'falls', 'toggles', 'covered', 'coverage',
+               'activity' ]
+
+    with open( filename, 'wb' ) as fd:
+      writer = csv.writer( fd )
+      writer.writerow( [ 'kind', 'name' ] + fields )
+      for name, _ in self.signals:
+        stats = self.signal( name )
+        writer.writerow( [ 'signal', name ] + [ stats[x] for x in fields ] )
+      for path in self.modules():
+        stats = self.module( path )
+        writer.writerow( [ 'module', path ] + [ stats[x] for x in fields ] )
+
+#-----------------------------------------------------------------------
+# merge_toggle_reports
+#-----------------------------------------------------------------------
+def merge_toggle_reports( filenames ):
+  'Merge the JSON toggle reports of several simulations of a design.'
+
+  reports = [ ToggleReport.from_json( x ) for x in filenames ]
+  merged  = reports[0]
+  for report in reports[1:]:
+    merged.merge( report )
+  return merged
+
+#-----------------------------------------------------------------------
+# main
+#-----------------------------------------------------------------------
+if __name__ == '__main__':
+
+  p = argparse.ArgumentParser( description='Merge toggle reports' )
+  p.add_argument( 'reports', nargs='+', help='JSON toggle reports' )
+  p.add_argument( '--json', help='write the merged report as JSON' )
+  p.add_argument( '--csv',  help='write the merged report as CSV'  )
+  opts = p.parse_args()
+
+  merged = merge_toggle_reports( opts.reports )
+  if opts.json: merged.to_json( opts.json )
+  if opts.csv:  merged.to_csv ( opts.csv  )
+
+  top = merged.module( merged.modules()[0] )
+  print( '{} cycles, {}/{} bits covered ({:.1%})'.format(
+         merged.ncycles, top['covered'], top['nbits'], top['coverage'] ) )
@@ -0,0 +1,112 @@
+#=======================================================================
+# toggle_test.py
+#=======================================================================
+
+import csv
+import pytest
+
+from pymtl         import *
+from toggle        import ToggleReport, merge_toggle_reports
+from waveform_test import run_counter
+
+#-----------------------------------------------------------------------
+# Reference counts
+#-----------------------------------------------------------------------
+# Count per-bit toggles from the value of a signal at the end of every
+# cycle.
+
+def ref_counts( values, nbits ):
+  rise = [ 0 ] * nbits
+  fall = [ 0 ] * nbits
+  for last, value in zip( values, values[1:] ):
+    for i in range( nbits ):
+      a, b = ( last >> i ) & 1, ( value >> i ) & 1
+      rise[i] += not a and b
+      fall[i] += a and not b
+  return rise, fall
+
+def run_toggles( tmpdir, ncycles, **attrs ):
+
+  model, sim, counts = run_counter( tmpdir, ncycles, toggle_coverage=True,
+                                    **attrs )
+  return model, sim, counts, sim.toggles.report()
+
+#-----------------------------------------------------------------------
+# test_toggle_counts
+#-----------------------------------------------------------------------
+
+def test_toggle_counts( tmpdir ):
+
+  model, sim, counts, report = run_toggles( tmpdir, 200 )
+
+  assert report.ncycles == sim.ncycles
+  assert 'top.clk' not in dict( report.signals )
+
+  values     = [ 0 ] + [ count for cycle, count in counts ]
+  rise, fall = ref_counts( values, 16 )
+
+  net = report.nets[ dict( report.signals )[ 'top.count' ] ]
+  assert net['rise'] == rise
+  assert net['fall'] == fall
+
+  stats = report.signal( 'top.count' )
+  assert stats['toggles'] == sum( rise ) + sum( fall )
+  assert stats['toggles'] == sim.toggles.activity()[ 'top.count' ]
+  assert stats['covered'] == sum( 1 for r, f in zip( rise, fall ) if r and f )
+
+  # Connected signals share a net, which is only counted once per module
+
+  assert report.signal( 'top.sub.in_' ) == report.signal( 'top.count' )
+  top = report.module( 'top' )
+  sub = report.module( 'top.sub' )
+  assert top['nbits'] == 1 + 1 + 16 + 16
+  assert sub['nbits'] == 1 + 16 + 16
+  assert report.modules() == [ 'top', 'top.sub' ]
+
+  assert ( 'top.count', 15 ) in report.untoggled()
+
+def test_toggle_filter( tmpdir ):
+
+  model, sim, counts, report = run_toggles( tmpdir, 10,
+                                            toggle_exclude='top.sub.*' )
+
+  assert sorted( name for name, _ in report.signals ) == \
+         [ 'top.count', 'top.en', 'top.next_', 'top.reset' ]
+
+#-----------------------------------------------------------------------
+# test_toggle_export
+#-----------------------------------------------------------------------
+
+def test_toggle_merge( tmpdir ):
+
+  _, _, _, a = run_toggles( tmpdir, 100 )
+  _, _, _, b = run_toggles( tmpdir, 50 )
+
+  a.to_json( str( tmpdir.join( 'a.json' ) ) )
+  b.to_json( str( tmpdir.join( 'b.json' ) ) )
+
+  merged = merge_toggle_reports( [ str( tmpdir.join( 'a.json' ) ),
+                                   str( tmpdir.join( 'b.json' ) ) ] )
+
+  assert merged.ncycles == a.ncycles + b.ncycles
+  assert merged.signals == a.signals
+  for name in [ 'top.count', 'top.en' ]:
+    assert merged.signal( name )['toggles'] == \
+           a.signal( name )['toggles'] + b.signal( name )['toggles']
+
+  _, _, _, c = run_toggles( tmpdir, 10, toggle_depth=0 )
+  with pytest.raises( ValueError ):
+    merged.merge( c )
+
+def test_toggle_csv( tmpdir ):
+
+  _, _, _, report = run_toggles( tmpdir, 20 )
+  report.to_csv( str( tmpdir.join( 'toggles.csv' ) ) )
+
+  rows = list( csv.DictReader( open( str( tmpdir.join( 'toggles.csv' ) ) ) ) )
+  by_name = { row['name'] : row for row in rows }
+
+  assert by_name['top.count']['kind'] == 'signal'
+  assert by_name['top.sub']['kind']   == 'module'
+  assert int( by_name['top.count']['toggles'] ) == \
+         report.signal( 'top.count' )['toggles']
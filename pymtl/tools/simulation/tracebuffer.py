@@ -0,0 +1,263 @@
+#=======================================================================
+# tracebuffer.py
+#=======================================================================
+# Ring buffer which moves waveform formatting, compression and file I/O
+# out of the simulation thread.
+#
+# The waveform callbacks only append raw ( key, value ) integer records
+# to a preallocated chunk: key is the id of a net and value its new
+# value, or key is TRACE_TIME and value is a new time stamp. Full chunks
+# are handed to a writer thread (or child process) which replays them
+# into a sink, an object with the following methods:
+#
+#  - write_records( records ) : records is a flat list of key, value ints
+#  - flush()                  : write out any buffered data
+#  - close()                  : finish the waveform
+#
+# The sink is constructed by the writer from a class and its arguments,
+# so with the process backend it never exists in the simulator process.
+# The number of chunks in flight is bounded: when the writer falls
+# behind, the simulator blocks until a chunk has been drained.
+#
+# Asynchronous writing is enabled with the trace_async attribute of the
+# top-level model ('thread' or 'process'), and the number of records in
+# the ring can be set with the trace_buffer_size attribute.
+
+import atexit
+import weakref
+import itertools
+import threading
+import traceback
+import Queue
+import multiprocessing
+
+TRACE_TIME          = -1
+TRACE_BUFFER_SIZE   = 1 << 18
+TRACE_BUFFER_CHUNKS = 8
+
+_backends = ( 'thread', 'process' )
+
+# Control messages sent to the writer in place of a chunk
+
+_flush_msg = 'flush'
+_close_msg = 'close'
+
+#-----------------------------------------------------------------------
+# _drain
+#-----------------------------------------------------------------------
+# Writer loop shared by both backends. Chunks arrive as ( chunk, size )
+# tuples and are returned to the free queue once they have been written,
+# if there is one. Errors are reported once, after which the remaining
+# chunks are discarded so that the simulator never blocks on a failed
+# writer.
+def _drain( sink_cls, sink_args, full, free, errors ):
+
+  sink = None
+  try:
+    sink = sink_cls( *sink_args )
+  except Exception:
+    errors.put( traceback.format_exc() )
+
+  while True:
+
+    msg = full.get()
+
+    try:
+      if sink is not None:
+        if   msg == _flush_msg: sink.flush()
+        elif msg == _close_msg: sink.close()
+        else:                   sink.write_records( msg[0][:msg[1]] )
+    except Exception:
+      errors.put( traceback.format_exc() )
+      sink = None
+
+    if free is not None and msg not in ( _flush_msg, _close_msg ):
+      free.put( msg[0] )
+
+    full.task_done()
+
+    if msg == _close_msg:
+      return
+
+#-----------------------------------------------------------------------
+# TraceBuffer
+#-----------------------------------------------------------------------
+class TraceBuffer( object ):
+  '''Preallocated record buffer drained by a writer thread or process.
+
+  >>> buf = TraceBuffer( VCDRecordWriter, ( 'out.vcd', fmts ), 'thread' )
+  >>> buf.set_time( 150 )
+  >>> buf.put( net_id, value )
+  >>> buf.close()
+  '''
+
+  def __init__( self, sink_cls, sink_args, backend = 'thread',
+                size = TRACE_BUFFER_SIZE, nchunks = TRACE_BUFFER_CHUNKS ):
+
+    if backend not in _backends:
+      raise ValueError( 'Unsupported trace backend "{}", choose from: {}'
+                        .format( backend, ', '.join( _backends ) ) )
+
+    # Each record takes two slots of a chunk
+
+    self._chunk_size = max( 2 * ( size // nchunks ), 2 )
+    self._chunk      = [ 0 ] * self._chunk_size
+    self._pos        = 0
+    self._closed     = False
+    self.backend     = backend
+
+    # The thread backend recycles the preallocated chunks through the
+    # free queue, the simulator blocks on the free queue when all chunks
+    # are in flight. Chunks sent to a child process are copied, so the
+    # process backend reuses a single chunk and blocks on the bounded
+    # queue of full chunks instead.
+
+    if backend == 'thread':
+      self._full   = Queue.Queue()
+      self._free   = Queue.Queue()
+      self._errors = Queue.Queue()
+      for i in range( nchunks-1 ):
+        self._free.put( [ 0 ] * self._chunk_size )
+      self._writer = threading.Thread( target=_drain,
+        args=( sink_cls, sink_args, self._full, self._free, self._errors ) )
+
+    else:
+      self._full   = multiprocessing.JoinableQueue( nchunks )
+      self._free   = None
+      self._errors = multiprocessing.Queue()
+      self._writer = multiprocessing.Process( target=_drain,
+        args=( sink_cls, sink_args, self._full, None, self._errors ) )
+
+    self._writer.daemon = True
+    self._writer.start()
+
+    # Writers are daemons so they never keep the interpreter alive, make
+    # sure the waveform is finished before the interpreter exits.
+    register_waveform( self )
+
+  #---------------------------------------------------------------------
+  # put
+  #---------------------------------------------------------------------
+  # Append a record, this is the only work done in the simulation loop.
+  def put( self, key, value ):
+    chunk = self._chunk
+    pos   = self._pos
+    chunk[ pos   ] = key
+    chunk[ pos+1 ] = value
+    pos += 2
+    self._pos = pos
+    if pos == self._chunk_size:
+      self._submit()
+
+  #---------------------------------------------------------------------
+  # set_time
+  #---------------------------------------------------------------------
+  def set_time( self, time ):
+    self.put( TRACE_TIME, time )
+
+  #---------------------------------------------------------------------
+  # write_changes
+  #---------------------------------------------------------------------
+  # Append a list of ( net id, value ) tuples, see WaveWriter.
+  def write_changes( self, changes ):
+    put = self.put
+    for key, value in changes:
+      put( key, value )
+
+  #---------------------------------------------------------------------
+  # _submit
+  #---------------------------------------------------------------------
+  # Hand the current chunk to the writer and get an empty one.
+  def _submit( self ):
+
+    self._check_errors()
+
+    if not self._pos:
+      return
+
+    if self._free is not None:
+      self._full.put( ( self._chunk, self._pos ) )
+      self._chunk = self._free.get()
+    else:
+      self._full.put( ( self._chunk[:self._pos], self._pos ) )
+
+    self._pos = 0
+
+  #---------------------------------------------------------------------
+  # _check_errors
+  #---------------------------------------------------------------------
+  def _check_errors( self ):
+    if not self._errors.empty():
+      raise RuntimeError( 'Waveform writer failed:\n' + self._errors.get() )
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Wait until the writer has written out all records appended so far.
+  def flush( self ):
+    if self._closed:
+      return
+    self._submit()
+    self._full.put( _flush_msg )
+    self._full.join()
+    self._check_errors()
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Write out the remaining records, close the sink and stop the writer.
+  def close( self ):
+    if self._closed:
+      return
+    self._closed = True
+    self._submit()
+    self._full.put( _close_msg )
+    self._writer.join()
+    self._check_errors()
+
+  def __del__( self ):
+    self.close()
+
+#-----------------------------------------------------------------------
+# register_waveform
+#-----------------------------------------------------------------------
+# Waveform writers keep data in memory (value changes of the current
+# timestep, compressed blocks, chunks of records) until they are closed.
+# Open writers are registered so that close_waveforms() can finish them
+# at the end of each test (see conftest.py) and when the interpreter
+# exits. The registry only holds weak references, so it never keeps a
+# simulator alive.
+
+_waveforms = weakref.WeakValueDictionary()
+_order     = itertools.count()
+
+def register_waveform( writer ):
+  _waveforms[ next( _order ) ] = writer
+
+#-----------------------------------------------------------------------
+# close_waveforms
+#-----------------------------------------------------------------------
+# Close all open waveform writers. Writers are closed in the reverse
+# order of their creation, so the pending changes of a simulator are
+# written into its TraceBuffer before the buffer itself is closed.
+def close_waveforms():
+  for key in sorted( _waveforms.keys(), reverse=True ):
+    writer = _waveforms.pop( key, None )
+    if writer is not None:
+      writer.close()
+
+atexit.register( close_waveforms )
+
+#-----------------------------------------------------------------------
+# get_trace_backend
+#-----------------------------------------------------------------------
+# Return the asynchronous writer backend selected by the model (None if
+# waveforms are written synchronously) and the size of the ring buffer.
+def get_trace_backend( model ):
+
+  backend = getattr( model, 'trace_async', None )
+  if backend is True:
+    backend = 'thread'
+
+  return backend or None, getattr( model, 'trace_buffer_size',
+                                   TRACE_BUFFER_SIZE )
@@ -0,0 +1,102 @@
+#=======================================================================
+# tracebuffer_test.py
+#=======================================================================
+
+import os
+import time
+import pytest
+
+from tracebuffer import TraceBuffer, TRACE_TIME
+
+#-----------------------------------------------------------------------
+# Sinks
+#-----------------------------------------------------------------------
+# Sinks are created by the writer, so they record into a file which can
+# be checked from the test with both backends.
+
+class FileSink( object ):
+
+  def __init__( self, filename, delay = 0 ):
+    self._fd    = open( filename, 'w' )
+    self._delay = delay
+
+  def write_records( self, records ):
+    time.sleep( self._delay )
+    for i in range( 0, len( records ), 2 ):
+      self._fd.write( '{} {}\n'.format( records[i], records[i+1] ) )
+
+  def flush( self ):
+    self._fd.flush()
+
+  def close( self ):
+    self._fd.write( 'closed\n' )
+    self._fd.close()
+
+class FailingSink( FileSink ):
+
+  def write_records( self, records ):
+    raise ValueError( 'disk full' )
+
+def read_records( filename ):
+  return [ tuple( int( x ) for x in line.split() )
+           for line in open( filename ) if line != 'closed\n' ]
+
+#-----------------------------------------------------------------------
+# test_trace_buffer
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'backend', [ 'thread', 'process' ] )
+def test_trace_buffer( tmpdir, backend ):
+
+  filename = str( tmpdir.join( 'records.txt' ) )
+  buf = TraceBuffer( FileSink, ( filename, ), backend, size=16, nchunks=2 )
+
+  ref = []
+  for i in range( 100 ):
+    buf.set_time( 100*i )
+    buf.put( i % 3, 2**70 + i )
+    ref.extend( [ ( TRACE_TIME, 100*i ), ( i % 3, 2**70 + i ) ] )
+
+  # Flushing waits for the writer to drain all records
+
+  buf.flush()
+  assert read_records( filename ) == ref
+
+  buf.write_changes( [ ( 1, 2 ), ( 3, 4 ) ] )
+  buf.close()
+  buf.close()
+
+  assert read_records( filename ) == ref + [ ( 1, 2 ), ( 3, 4 ) ]
+  assert open( filename ).read().endswith( 'closed\n' )
+
+def test_trace_buffer_backpressure( tmpdir ):
+
+  filename = str( tmpdir.join( 'records.txt' ) )
+  buf = TraceBuffer( FileSink, ( filename, 0.01 ), size=8, nchunks=2 )
+
+  # The simulator blocks when all chunks are in flight, so it can never
+  # get more than a chunk ahead of the writer
+
+  for i in range( 40 ):
+    buf.put( i, i )
+    assert buf._full.qsize() <= 1
+
+  buf.close()
+  assert read_records( filename ) == [ ( i, i ) for i in range( 40 ) ]
+
+@pytest.mark.parametrize( 'backend', [ 'thread', 'process' ] )
+def test_trace_buffer_errors( tmpdir, backend ):
+
+  filename = str( tmpdir.join( 'records.txt' ) )
+  buf = TraceBuffer( FailingSink, ( filename, ), backend, size=4, nchunks=2 )
+
+  buf.put( 0, 1 )
+  with pytest.raises( RuntimeError ) as e:
+    buf.flush()
+  assert 'disk full' in str( e.value )
+
+  buf.close()
+
+def test_trace_buffer_bad_backend( tmpdir ):
+  with pytest.raises( ValueError ):
+    TraceBuffer( FileSink, ( str( tmpdir.join( 'x' ) ), ), 'fiber' )
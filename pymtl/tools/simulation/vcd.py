@@ -15,6 +15,10 @@ from __future__ import print_function
 
 import time
 import sys
+import fnmatch
+
+from tracebuffer import TraceBuffer, TRACE_TIME, get_trace_backend
+from tracebuffer import register_waveform
 
 #-----------------------------------------------------------------------
 # get_vcd_timescale
@@ -57,6 +61,95 @@ def write_vcd_header( o, model ):
 def mangle_name( name ):
   return name.replace('[','(').replace(']',')')
 
+#-----------------------------------------------------------------------
+# get_bin_fmt
+#-----------------------------------------------------------------------
+# Return a format string which prints an unsigned integer as a zero
+# padded binary value of the given width. Format strings are cached per
+# width since many nets share the same width.
+_bin_fmts = {}
+def get_bin_fmt( nbits ):
+  try:
+    return _bin_fmts[ nbits ]
+  except KeyError:
+    fmt = _bin_fmts[ nbits ] = '{{:0{}b}}'.format( nbits )
+    return fmt
+
+#-----------------------------------------------------------------------
+# get_trace_filter
+#-----------------------------------------------------------------------
+# Return a function which checks whether a signal should be traced given
+# its hierarchical name (e.g. top.core.alu.out, using the mangled names
+# shown in the waveform), along with the maximum traced model depth.
+# Tracing is configured with the following attributes of the top-level
+# model:
+#
+#  - trace_include : glob pattern(s) of signals to trace (default: all)
+#  - trace_exclude : glob pattern(s) of signals not to trace
+#  - trace_depth   : maximum depth of traced submodels (top is depth 0)
+#
+# For example, trace_include = 'top.core.*' and trace_exclude = '*.sram*'
+# trace the core excluding its SRAMs. Other tools select signals with
+# the same attributes using a different prefix (e.g. history_include).
+def get_trace_filter( model, prefix = 'trace' ):
+
+  def get_patterns( name, default ):
+    patterns = getattr( model, name, None ) or default
+    return [ patterns ] if isinstance( patterns, str ) else list( patterns )
+
+  include = get_patterns( prefix + '_include', [ '*' ] )
+  exclude = get_patterns( prefix + '_exclude', [] )
+  depth   = getattr( model, prefix + '_depth', None )
+
+  def is_traced( name ):
+    return any( fnmatch.fnmatchcase( name, x ) for x in include ) and \
+       not any( fnmatch.fnmatchcase( name, x ) for x in exclude )
+
+  return is_traced, depth
+
+#-----------------------------------------------------------------------
+# walk_signal_defs
+#-----------------------------------------------------------------------
+# Generator performing a recursive descent of the model which yields a
+# ( 'scope', model ) tuple when entering each model, a ( 'var', signal,
+# net, is_new ) tuple for each traced port and wire, and an ( 'upscope',
+# model ) tuple when leaving each model. Multiple signals may be
+# collapsed into a single net in the simulator if they are connected,
+# is_new is only True for the first signal of each net so that waveform
+# writers can store values per net, not per signal as an optimization.
+# Nets are tagged using the provided attribute name.
+#
+# Only signals selected by get_trace_filter() are visited, except for
+# the top-level clock which is always traced since it drives the time
+# stamps of the waveform.
+def walk_signal_defs( model, tag, prefix = 'trace' ):
+
+  is_traced, max_depth = get_trace_filter( model, prefix )
+
+  def recurse_models( model, level, prefix ):
+
+    yield 'scope', model
+
+    for i in model.get_ports() + model.get_wires():
+      if not ( is_traced( prefix + mangle_name( i.name ) ) or
+               ( level == 0 and i.name == 'clk' ) ):
+        continue
+      net    = i._signalvalue
+      is_new = not hasattr( net, tag )
+      if is_new:
+        setattr( net, tag, None )
+      yield 'var', i, net, is_new
+
+    if max_depth is None or level < max_depth:
+      for submodel in model.get_submodules():
+        subprefix = prefix + mangle_name( submodel.name ) + '.'
+        for x in recurse_models( submodel, level+1, subprefix ):
+          yield x
+
+    yield 'upscope', model
+
+  return recurse_models( model, 0, mangle_name( model.name ) + '.' )
+
 #-----------------------------------------------------------------------
 # write_vcd_signal_defs
 #-----------------------------------------------------------------------
@@ -65,71 +158,124 @@ def write_vcd_signal_defs( o, model ):
   vcd_symbol = _gen_vcd_symbol()
   all_nets   = []
 
-  # Inner utility function to perform recursive descent of the model.
-  def recurse_models( model, level ):
+  for item in walk_signal_defs( model, '_vcd_symbol' ):
 
-    # Create a new scope for this module
-    print( "$scope module {name} $end".format( name=model.name ), file=o )
+    # Create a new scope for each module
+    if item[0] == 'scope':
+      print( "$scope module {name} $end".format( name=item[1].name ), file=o )
 
-    # Define all signals for this model.
-    for i in model.get_ports() + model.get_wires():
+    elif item[0] == 'upscope':
+      print( "$upscope $end", file=o )
 
-      # Multiple signals may be collapsed into a single net in the
-      # simulator if they are connected. Generate new vcd symbols per
-      # net, not per signal as an optimization.
-      net = i._signalvalue
-      if not hasattr( net, '_vcd_symbol' ):
+    # Define all signals, generating a new vcd symbol per net
+    else:
+      _, i, net, is_new = item
+      if is_new:
         net._vcd_symbol = vcd_symbol.next()
         net._vcd_is_clk = i.name == 'clk'
         all_nets.append( net )
-      symbol = net._vcd_symbol
 
       print( "$var {type} {nbits} {symbol} {name} $end".format(
-          type='reg', nbits=i.nbits, symbol=symbol, name=mangle_name(i.name),
+          type='reg', nbits=i.nbits, symbol=net._vcd_symbol,
+          name=mangle_name(i.name),
       ), file=o )
 
-    # Recursively visit all submodels.
-    for submodel in model.get_submodules():
-      recurse_models( submodel, level+1 )
-
-    print( "$upscope $end", file=o )
-
-  # Begin recursive descent from the top-level model.
-  recurse_models( model, 0 )
+  # Create the format string used to write the value of each net, the
+  # symbol is escaped since it may contain braces.
+  for i, net in enumerate( all_nets ):
+    symbol = net._vcd_symbol.replace( '{', '{{' ).replace( '}', '}}' )
+    net._vcd_id   = i
+    net._vcd_fmt  = 'b' + get_bin_fmt( net.nbits ) + ' ' + symbol + '\n'
+    net._vcd_last = net.uint()
 
   # Once all models and their signals have been defined, end the
   # definition section of the vcd and print the initial values of all
   # nets in the design.
   print( "$enddefinitions $end\n", file=o )
-  for net in all_nets:
-    print( "b{value} {symbol}".format(
-        value=net.bin(), symbol=net._vcd_symbol,
-    ), file=o )
+  o.write( ''.join( [ net._vcd_fmt.format( net._vcd_last )
+                      for net in all_nets ] ) )
 
   return all_nets
 
 #-----------------------------------------------------------------------
 # insert_vcd_callbacks
 #-----------------------------------------------------------------------
-# Add callbacks which write the vcd file for each net in the design.
-def insert_vcd_callbacks( sim, nets ):
-
-  # A utility function which creates callbacks that write a nets current
-  # value to the vcd file. The returned callback function is a closure
-  # which is executed by the simulator whenever the net's value changes.
+# Add callbacks which write the vcd file for each net in the design to
+# out. Returns a function which writes out the pending changes, and a
+# function which removes all of the callbacks from the simulator.
+#
+# Rather than writing a value every time a net changes (nets may change
+# several times while combinational logic settles), the callbacks only
+# record which nets have changed. The final values of the changed nets
+# are written in a single write when the timestep ends, that is when the
+# clock toggles. Changes made after the last clock edge (e.g., by a
+# final eval_combinational() or by a block raising an exception) are
+# pending until the returned function is called, see VCDUtil.
+#
+# If out is a TraceBuffer (see tracebuffer.py) the changes are appended
+# to the buffer as ( net id, value ) records instead, and formatted by a
+# VCDRecordWriter outside of the simulation thread.
+def insert_vcd_callbacks( sim, nets, out ):
+
+  dirty    = []
+  buffered = hasattr( out, 'put' )
+
+  # Write the value of all nets which changed since the last flush. Nets
+  # which changed back to their previously written value are skipped.
+  def flush():
+    lines = []
+    for net in dirty:
+      net._vcd_dirty = False
+      value = net.uint()
+      if value != net._vcd_last:
+        net._vcd_last = value
+        lines.append( net._vcd_fmt.format( value ) )
+    del dirty[:]
+    if lines:
+      out.write( ''.join( lines ) )
+
+  def flush_buffered():
+    put = out.put
+    for net in dirty:
+      net._vcd_dirty = False
+      value = net.uint()
+      if value != net._vcd_last:
+        net._vcd_last = value
+        put( net._vcd_id, value )
+    del dirty[:]
+
+  if buffered:
+    flush = flush_buffered
+
+  # A utility function which creates callbacks that mark a net as dirty.
+  # The returned callback function is a closure which is executed by the
+  # simulator whenever the net's value changes.
   def create_vcd_callback( sim, net ):
 
-    # Each signal writes its binary value and unique identifier to the
-    # specified vcd file
+    net._vcd_dirty = False
+
+    # Each signal adds itself to the dirty list the first time it changes
     if not net._vcd_is_clk:
-      cb = lambda: print( 'b%s %s\n' % (net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
+      def cb():
+        if not net._vcd_dirty:
+          net._vcd_dirty = True
+          dirty.append( net )
+
+    # The clock signal ends the current timestep: it writes out pending
+    # changes and then updates the vcd time stamp
+    elif not buffered:
+      def cb():
+        flush()
+        value = net.uint()
+        out.write( '#{}\nb{} {}\n'.format( 100*sim.ncycles+50*value,
+                                           value, net._vcd_symbol ) )
 
-    # The clock signal additionally must update the vcd time stamp
     else:
-      cb = lambda: print( '#%s\nb%s %s\n' % (100*sim.ncycles+50*net.uint(),
-                          net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
+      def cb():
+        flush()
+        value = net.uint()
+        out.set_time( 100*sim.ncycles+50*value )
+        out.put( net._vcd_id, value )
 
     # Return the callback
     return cb
@@ -138,9 +284,75 @@ def insert_vcd_callbacks( sim, nets ):
   # the net to be fired whenever the value changes. We repurpose the
   # existing callback facilities designed for slices (these execute
   # immediately), rather than the default callback mechanism (these are
-  # put on the event queue to execute later).
-  for net in nets:
-    net.register_slice( create_vcd_callback( sim, net ) )
+  # put on the event queue to execute later). Callbacks are registered
+  # through the simulator so that they can be detached with trace_off().
+  callbacks = [ create_vcd_callback( sim, net ) for net in nets ]
+  for net, cb in zip( nets, callbacks ):
+    sim._add_trace_callback( net, cb )
+
+  # When tracing is turned back on, nets may have changed while their
+  # callbacks were detached. Tracing is resumed between cycles, so we
+  # write out the nets which changed under the time stamp of the last
+  # clock edge.
+  def resync():
+    for net in nets:
+      if not net._vcd_is_clk and not net._vcd_dirty:
+        net._vcd_dirty = True
+        dirty.append( net )
+    if sim.ncycles:
+      if buffered: out.set_time( 100*sim.ncycles-50 )
+      else:        out.write( '#{}\n'.format( 100*sim.ncycles-50 ) )
+    flush()
+
+  sim._trace_resync.append( resync )
+
+  # Write out pending changes before the callbacks are detached
+  sim._trace_suspend.append( flush )
+
+  def detach():
+    sim._remove_trace_callbacks( callbacks )
+    sim._trace_resync .remove( resync )
+    sim._trace_suspend.remove( flush  )
+
+  return flush, detach
+
+#-----------------------------------------------------------------------
+# VCDRecordWriter
+#-----------------------------------------------------------------------
+# Formats the ( net id, value ) records of a TraceBuffer into a vcd file
+# whose header and signal definitions have already been written. fmts
+# contains the format string of each net (see write_vcd_signal_defs).
+class VCDRecordWriter( object ):
+
+  def __init__( self, outfile, fmts ):
+
+    if isinstance( outfile, str ):
+      outfile = open( outfile, 'a', VCD_BUFFER_SIZE )
+
+    self._out  = outfile
+    self._fmts = fmts
+
+  def write_records( self, records ):
+
+    fmts  = self._fmts
+    lines = []
+
+    for i in xrange( 0, len( records ), 2 ):
+      key = records[i]
+      if key == TRACE_TIME:
+        lines.append( '#{}\n'.format( records[i+1] ) )
+      else:
+        lines.append( fmts[ key ].format( records[i+1] ) )
+
+    self._out.write( ''.join( lines ) )
+
+  def flush( self ):
+    self._out.flush()
+
+  def close( self ):
+    self._out.flush()
+    if self._out not in ( sys.stdout, sys.stderr ):
+      self._out.close()
 
 #-----------------------------------------------------------------------
 # _gen_vcd_symbol
@@ -174,17 +386,23 @@ def _gen_vcd_symbol():
 #-----------------------------------------------------------------------
 # Hidden class used by the simulator tool for generating VCD output.
 # This class takes a SimulationTool instance and augments it to generate
-# VCD output.
-class VCDUtil():
+# VCD output. The simulator's vcd attribute is set to the VCDUtil, whose
+# flush() and close() also write out the changes of the current
+# timestep. Open VCDUtils are closed at the end of each test and when
+# the interpreter exits, see register_waveform().
+VCD_BUFFER_SIZE = 1 << 20
+class VCDUtil( object ):
 
   def __init__(self, simulator, outfile=None):
 
+    filename = outfile if isinstance(outfile, str) else None
+
     # Select the output for VCD
 
     if not outfile:
       outfile = sys.stdout
     elif isinstance(outfile, str):
-      outfile = open( outfile, 'w' )
+      outfile = open( outfile, 'w', VCD_BUFFER_SIZE )
     else:
       outfile = outfile
 
@@ -193,7 +411,63 @@ class VCDUtil():
     write_vcd_header( outfile, simulator.model )
     nets = write_vcd_signal_defs( outfile, simulator.model )
 
-    # Enable vcd mode on the simulator, set simulator output file name
-
-    simulator.vcd = outfile
-    insert_vcd_callbacks( simulator, nets )
+    # Value changes are formatted by a writer thread or process if
+    # asynchronous tracing is enabled. A child process cannot share our
+    # file object, so it appends to the file by name instead.
+
+    backend, size = get_trace_backend( simulator.model )
+
+    if backend:
+      if backend == 'process':
+        if not filename:
+          raise ValueError( 'The process trace backend requires a vcd file '
+                            'name!' )
+        outfile.close()
+        outfile = filename
+      else:
+        outfile.flush()
+      fmts    = [ net._vcd_fmt for net in nets ]
+      outfile = TraceBuffer( VCDRecordWriter, ( outfile, fmts ), backend,
+                             size )
+
+    # Enable vcd mode on the simulator
+
+    self._out     = outfile
+    self._closed  = False
+    self._pending, self._detach = \
+      insert_vcd_callbacks( simulator, nets, outfile )
+
+    simulator.vcd = self
+    register_waveform( self )
+
+  #---------------------------------------------------------------------
+  # write
+  #---------------------------------------------------------------------
+  def write( self, data ):
+    self._out.write( data )
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Write out the changes of the current timestep and flush the file.
+  def flush( self ):
+    if not self._closed:
+      self._pending()
+      self._out.flush()
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Write out the changes of the current timestep and close the file,
+  # the simulator is not traced anymore after this.
+  def close( self ):
+
+    if self._closed:
+      return
+
+    self.flush()
+    self._closed = True
+    self._detach()
+
+    if self._out not in ( sys.stdout, sys.stderr ):
+      self._out.close()
@@ -3,6 +3,8 @@
 #=======================================================================
 
 import inspect
+import pytest
+import collections
 
 #=======================================================================
 # Tests
@@ -36,4 +38,358 @@ def local_setup_sim( model ):
     'pymtl.tools.simulation.vcd_test.{}.vcd'.format( model.class_name )
 
   sim = SimulationTool( model )
+  _eager_dumps.append( EagerDump( sim ) )
   return model, sim
+
+#-----------------------------------------------------------------------
+# EagerDump
+#-----------------------------------------------------------------------
+# Every simulator created by the tests above is also traced the way the
+# original VCD writer did it: each value change is recorded as soon as
+# it happens, and the clock writes the time stamps. After each test, the
+# vcd file must match the eager trace byte for byte, once the trace is
+# reduced to the last value of each changed net per timestep.
+
+_eager_dumps = []
+
+class EagerDump( object ):
+
+  def __init__( self, sim ):
+
+    self.sim     = sim
+    self.records = []
+
+    nets = { id( x._signalvalue ) : x._signalvalue
+             for group in sim._nets for x in group }.values()
+    nets = [ x for x in nets if hasattr( x, '_vcd_symbol' ) ]
+    self.init = collections.OrderedDict(
+                  ( x._vcd_symbol, x.uint() ) for x in nets )
+
+    for net in nets:
+      net.register_slice( self.create_callback( net ) )
+
+  def create_callback( self, net ):
+
+    records, sim = self.records, self.sim
+
+    if net._vcd_is_clk:
+      def cb():
+        records.append( ( None, 100*sim.ncycles + 50*net.uint() ) )
+        records.append( ( net._vcd_symbol, net.uint(), net.nbits ) )
+    else:
+      def cb():
+        records.append( ( net._vcd_symbol, net.uint(), net.nbits ) )
+
+    return cb
+
+  def reduce( self ):
+
+    # Split the records into timesteps, the clock value is written with
+    # the time stamp
+
+    steps = [ ( '', collections.OrderedDict() ) ]
+    for record in self.records:
+      if record[0] is None:
+        steps.append( ( '#{}\n'.format( record[1] ), collections.OrderedDict() ) )
+      else:
+        steps[-1][1][ record[0] ] = record[1:]
+
+    last  = dict( self.init )
+    lines = []
+    for stamp, changes in steps:
+      lines.append( stamp )
+      for i, ( symbol, ( value, nbits ) ) in enumerate( changes.items() ):
+        if value != last[ symbol ] or ( stamp and i == 0 ):
+          last[ symbol ] = value
+          lines.append( 'b{:0{}b} {}\n'.format( value, nbits, symbol ) )
+
+    return ''.join( lines )
+
+  def check( self ):
+
+    self.sim.vcd.close()
+
+    dump = open( self.sim.model.vcd_file ).read()
+    dump = dump[ dump.index( '$enddefinitions $end\n\n' ): ].split( '\n' )
+    dump = '\n'.join( dump[ 2 + len( self.init ): ] )
+
+    assert dump == self.reduce()
+
+# Tests which write to nets without notifying the simulator on purpose,
+# the vcd file has the actual value of these nets at the end of each
+# timestep while the eager trace misses the change.
+
+_silent_writes = [ 'test_SliceWriteCheck' ]
+
+@pytest.fixture( autouse=True )
+def check_eager_dumps( request ):
+  del _eager_dumps[:]
+  yield
+  if request.node.name not in _silent_writes:
+    for dump in _eager_dumps:
+      dump.check()
+
+#-----------------------------------------------------------------------
+# test_vcd_coalesced
+#-----------------------------------------------------------------------
+# Nets which change several times while combinational logic settles
+# should only be written once per timestep.
+def test_vcd_coalesced( tmpdir ):
+
+  from pymtl import Model, InPort, OutPort, Wire
+
+  class Glitchy( Model ):
+    def __init__( s ):
+      s.in_ = InPort ( 8 )
+      s.out = OutPort( 8 )
+      s.tmp = Wire   ( 8 )
+
+      @s.combinational
+      def comb():
+        s.tmp.value = 0xff
+        s.tmp.value = s.in_ + 1
+        s.out.value = s.tmp
+
+  model = Glitchy()
+  model.elaborate()
+  model.vcd_file = str( tmpdir.join( 'glitchy.vcd' ) )
+  sim = SimulationTool( model )
+
+  for i in range( 4 ):
+    model.in_.value = i
+    sim.cycle()
+
+  model.in_.value = 8
+  sim.cycle()
+  sim.vcd.flush()
+
+  lines = open( model.vcd_file ).read().split( '\n' )
+  lines = lines[ lines.index( '$enddefinitions $end' ): ]
+
+  symbols = {}
+  for line in open( model.vcd_file ):
+    if line.startswith( '$var' ):
+      _, _, nbits, symbol, name, _ = line.split()
+      symbols[ name ] = symbol
+
+  # Values are written without a prefix and padded to the net width
+
+  assert 'b00000000 {}'.format( symbols['in_'] ) in lines
+
+  # Each timestep contains at most one value per net, and the glitch
+  # on tmp never shows up in the trace
+
+  lines    = lines[ [ x.startswith( '#' ) for x in lines ].index( True ): ]
+  timestep = []
+  for line in lines:
+    if line.startswith( '#' ):
+      assert len( timestep ) == len( set( timestep ) )
+      timestep = []
+    elif line.startswith( 'b' ):
+      timestep.append( line.split()[1] )
+      assert line.split()[0] != 'b11111111'
+
+  assert 'b00001001 {}'.format( symbols['tmp'] ) in lines
+  assert 'b00001001 {}'.format( symbols['out'] ) in lines
+
+#-----------------------------------------------------------------------
+# test_vcd_close
+#-----------------------------------------------------------------------
+# Changes made after the last clock edge are written under the last
+# time stamp when the vcd file is closed.
+def test_vcd_close( tmpdir ):
+
+  from pymtl import Model, InPort, OutPort
+
+  class Incr( Model ):
+    def __init__( s ):
+      s.in_ = InPort ( 8 )
+      s.out = OutPort( 8 )
+
+      @s.combinational
+      def comb():
+        s.out.value = s.in_ + 1
+
+  model = Incr()
+  model.elaborate()
+  model.vcd_file = str( tmpdir.join( 'incr.vcd' ) )
+  sim = SimulationTool( model )
+
+  sim.cycle()
+  model.in_.value = 4
+  sim.eval_combinational()
+  sim.vcd.close()
+
+  dump    = open( model.vcd_file ).read()
+  symbols = dict( line.split()[4:2:-1] for line in dump.split( '\n' )
+                  if line.startswith( '$var' ) )
+
+  assert dump.endswith( '#50\nb1 {clk}\nb00000100 {in_}\nb00000101 {out}\n'
+                        .format( **symbols ) )
+
+  # The simulator is not traced anymore once the file is closed
+
+  sim.cycle()
+  sim.vcd.close()
+  assert not sim._trace_callbacks
+  assert open( model.vcd_file ).read() == dump
+
+#-----------------------------------------------------------------------
+# Scoped and windowed tracing
+#-----------------------------------------------------------------------
+
+def make_traced_model( tmpdir, **attrs ):
+
+  from pymtl import Model, InPort, OutPort
+
+  class Incr( Model ):
+    def __init__( s ):
+      s.in_ = InPort ( 8 )
+      s.out = OutPort( 8 )
+
+      @s.combinational
+      def comb():
+        s.out.value = s.in_ + 1
+
+  class Pair( Model ):
+    def __init__( s ):
+      s.in_  = InPort ( 8 )
+      s.out  = OutPort( 8 )
+      s.alu  = Incr()
+      s.sram = Incr()
+      s.connect( s.in_,      s.alu.in_  )
+      s.connect( s.alu.out,  s.sram.in_ )
+      s.connect( s.sram.out, s.out      )
+
+  class Top( Model ):
+    def __init__( s ):
+      s.in_  = InPort ( 8 )
+      s.out  = OutPort( 8 )
+      s.core = Pair()
+      s.connect( s.in_,      s.core.in_ )
+      s.connect( s.core.out, s.out      )
+
+  model = Top()
+  model.vcd_file = str( tmpdir.join( 'top.vcd' ) )
+  for name, value in attrs.items():
+    setattr( model, name, value )
+  model.elaborate()
+
+  return model, SimulationTool( model )
+
+def read_vcd( sim ):
+
+  sim.vcd.flush()
+
+  names   = []
+  scope   = []
+  symbols = {}
+  lines   = open( sim.model.vcd_file ).read().split( '\n' )
+
+  for line in lines:
+    fields = line.split()
+    if line.startswith( '$scope' ):
+      scope.append( fields[2] )
+    elif line.startswith( '$upscope' ):
+      scope.pop()
+    elif line.startswith( '$var' ):
+      name = '.'.join( scope + [ fields[4] ] )
+      names.append( name )
+      symbols.setdefault( fields[3], name )
+
+  # Map each timestamp to the names of the nets which changed
+
+  changes = {}
+  time    = None
+  for line in lines[ lines.index( '$enddefinitions $end' ): ]:
+    if line.startswith( '#' ):
+      time = int( line[1:] )
+    elif line.startswith( 'b' ) and time is not None:
+      changes.setdefault( time, [] ).append( symbols[ line.split()[1] ] )
+
+  return names, changes
+
+def test_trace_include_exclude( tmpdir ):
+
+  model, sim = make_traced_model( tmpdir, trace_include='top.core.*',
+                                  trace_exclude='*.sram*' )
+  names, changes = read_vcd( sim )
+
+  assert 'top.clk' in names
+  assert 'top.in_' not in names
+  assert 'top.core.in_' in names
+  assert 'top.core.alu.out' in names
+  assert not [ x for x in names if 'sram' in x ]
+
+def test_trace_depth( tmpdir ):
+
+  model, sim = make_traced_model( tmpdir, trace_depth=1 )
+  names, changes = read_vcd( sim )
+
+  assert 'top.in_' in names
+  assert 'top.core.out' in names
+  assert not [ x for x in names if 'alu' in x ]
+
+def test_trace_window( tmpdir ):
+
+  model, sim = make_traced_model( tmpdir, trace_start=3, trace_stop=6 )
+
+  for i in range( 10 ):
+    model.in_.value = i
+    sim.cycle()
+
+  names, changes = read_vcd( sim )
+
+  # Only the clock edges of cycles 3, 4 and 5 are traced, the values
+  # at the start of the window are written under the previous timestep
+
+  assert sorted( changes ) == [ 250, 300, 350, 400, 450, 500, 550 ]
+  assert 'top.in_' in changes[ 250 ]
+  assert 'top.in_' in changes[ 450 ]
+  assert 'top.in_' not in changes[ 550 ]
+
+def test_trace_on_off( tmpdir ):
+
+  model, sim = make_traced_model( tmpdir )
+
+  sim.trace_off()
+  assert all( f not in net._slices for net, f in sim._trace_callbacks )
+
+  for i in range( 5 ):
+    model.in_.value = i
+    sim.cycle()
+
+  sim.trace_on()
+  sim.cycle()
+
+  names, changes = read_vcd( sim )
+
+  # The values changed while tracing was off are written when tracing
+  # is turned back on
+
+  assert sorted( changes ) == [ 450, 500, 550 ]
+  assert 'top.in_' in changes[ 450 ]
+  assert 'top.out' in changes[ 450 ]
+
+#-----------------------------------------------------------------------
+# Asynchronous tracing
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'backend', [ 'thread', 'process' ] )
+def test_trace_async( tmpdir, backend ):
+
+  # Run the same simulation with and without a writer backend
+
+  def run( **attrs ):
+    model, sim = make_traced_model( tmpdir.mkdir( str( len( attrs ) ) ),
+                                    trace_buffer_size=16, **attrs )
+    for i in range( 30 ):
+      model.in_.value = i / 2
+      sim.cycle()
+    return read_vcd( sim )
+
+  names,       changes       = run()
+  async_names, async_changes = run( trace_async=backend )
+
+  assert async_names   == names
+  assert async_changes == changes
@@ -0,0 +1,196 @@
+#=======================================================================
+# watch.py
+#=======================================================================
+# Signal watchpoints for SimulationTool.
+#
+# A watchpoint attaches a callback to the slice hook of a single net
+# (the same hook used by vcd.py), so the callback runs immediately every
+# time the value of the net changes and nets which are not watched pay
+# nothing. Conditions are compiled into integer comparisons against the
+# new value when the watchpoint is created:
+#
+#  - None or 'changed' : any change of the value
+#  - an int or Bits    : the value equals this value
+#  - '<op> <int>'      : comparison with op in ==, !=, <, <=, >, >=
+#                        (e.g., '>= 0x100')
+#  - a function        : called with the net, returns True to fire
+#
+# Conditions are checked on every change, including values which only
+# exist while combinational logic settles within a cycle. The action
+# runs when the condition holds:
+#
+#  - 'raise' : raise a WatchpointError out of the simulator (the default,
+#              use pytest --pdb to debug the failure)
+#  - 'pdb'   : break into the debugger in the watchpoint callback
+#  - 'print' : print the cycle, signal and value
+#  - a function called with the watchpoint
+#
+#   wp = sim.watch( 'top.core.pc', '== 0x200' )
+#   wp = sim.watch( 'top.mem.resps[0].val', action=lambda wp: ... )
+#   sim.unwatch( wp )
+
+from __future__ import print_function
+
+import re
+import operator
+
+from ...datatypes.Bits        import Bits
+from ...datatypes.SignalValue import SignalValue
+
+_operators = {
+  '==' : operator.eq,
+  '!=' : operator.ne,
+  '<'  : operator.lt,
+  '<=' : operator.le,
+  '>'  : operator.gt,
+  '>=' : operator.ge,
+}
+
+_condition_re = re.compile( r'^\s*(==|!=|<=|>=|<|>)\s*(\S+)\s*$' )
+_index_re     = re.compile( r'^(\w+)((?:\[\d+\])*)$' )
+
+#-----------------------------------------------------------------------
+# WatchpointError
+#-----------------------------------------------------------------------
+class WatchpointError( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# resolve_signal
+#-----------------------------------------------------------------------
+# Return the net of a signal given its hierarchical name in a simulated
+# model (e.g., 'top.src.out.val' or 'src.reqs[0].msg').
+def resolve_signal( model, path ):
+
+  names = path.split( '.' )
+  if names[0] == 'top':
+    names = names[1:]
+
+  obj = model
+  try:
+    for name in names:
+      match = _index_re.match( name )
+      if not match:
+        raise AttributeError( name )
+      obj = getattr( obj, match.group( 1 ) )
+      for idx in re.findall( r'\[(\d+)\]', match.group( 2 ) ):
+        obj = obj[ int( idx ) ]
+  except ( AttributeError, IndexError ):
+    raise ValueError( 'No signal named "{}" in {}!'.format( path,
+                      model.class_name ) )
+
+  if not isinstance( obj, SignalValue ):
+    raise ValueError( '"{}" is not a signal of {}!'.format( path,
+                      model.class_name ) )
+
+  return obj
+
+#-----------------------------------------------------------------------
+# compile_condition
+#-----------------------------------------------------------------------
+# Return a function of the net evaluating the condition, or None if the
+# watchpoint fires on every change.
+def compile_condition( net, condition ):
+
+  if condition is None or \
+     isinstance( condition, basestring ) and condition == 'changed':
+    return None
+
+  # Bits instances are callable, so values are checked first
+
+  if isinstance( condition, ( int, long, Bits ) ):
+    op     = operator.eq
+    target = int( condition )
+
+  elif isinstance( condition, basestring ):
+    match = _condition_re.match( condition )
+    if not match:
+      raise ValueError( 'Invalid watchpoint condition "{}"!'
+                        .format( condition ) )
+    op     = _operators[ match.group( 1 ) ]
+    target = int( match.group( 2 ), 0 )
+
+  elif callable( condition ):
+    return condition
+
+  else:
+    raise ValueError( 'Invalid watchpoint condition {!r}!'.format( condition ) )
+
+  # Compare the unsigned value of Bits nets, negative values are
+  # converted to their two's complement
+
+  if isinstance( net, Bits ):
+    target = Bits( net.nbits, target )._uint
+    if op is operator.eq:
+      return lambda net: net._uint == target
+    return lambda net: op( net._uint, target )
+
+  return lambda net: op( net, target )
+
+#-----------------------------------------------------------------------
+# Watchpoint
+#-----------------------------------------------------------------------
+class Watchpoint( object ):
+
+  def __init__( self, simulator, signal, condition = None,
+                action = 'raise' ):
+
+    if isinstance( signal, SignalValue ):
+      net, path = signal, repr( signal )
+    else:
+      net, path = resolve_signal( simulator.model, signal ), signal
+
+    if not callable( action ) and action not in ( 'raise', 'pdb', 'print' ):
+      raise ValueError( 'Invalid watchpoint action "{}"!'.format( action ) )
+
+    self.sim       = simulator
+    self.net       = net
+    self.path      = path
+    self.condition = condition
+    self.action    = action
+    self.hits      = 0
+    self.cycle     = None
+
+    check = compile_condition( net, condition )
+    fire  = self._fire
+
+    if check is None:
+      self._callback = fire
+    else:
+      def callback():
+        if check( net ):
+          fire()
+      self._callback = callback
+
+    net.register_slice( self._callback )
+
+  #---------------------------------------------------------------------
+  # _fire
+  #---------------------------------------------------------------------
+  def _fire( self ):
+
+    self.hits  += 1
+    self.cycle  = self.sim.ncycles
+
+    action = self.action
+    if callable( action ):
+      action( self )
+    elif action == 'print':
+      print( self )
+    elif action == 'pdb':
+      import pdb
+      pdb.set_trace()
+    else:
+      raise WatchpointError( str( self ) )
+
+  #---------------------------------------------------------------------
+  # remove
+  #---------------------------------------------------------------------
+  def remove( self ):
+    if self._callback in self.net._slices:
+      self.net._slices.remove( self._callback )
+
+  def __str__( self ):
+    return 'Watchpoint {} {}hit in cycle {}: value = {}'.format(
+           self.path, '({}) '.format( self.condition ) if self.condition
+           is not None else '', self.sim.ncycles, self.net )
@@ -0,0 +1,117 @@
+#=======================================================================
+# watch_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl         import *
+from watch         import WatchpointError
+from waveform_test import Counter
+
+def make_counter():
+  model = Counter()
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  return model, sim
+
+def run( model, sim, ncycles ):
+  for i in range( ncycles ):
+    model.en.value = 1
+    sim.cycle()
+
+#-----------------------------------------------------------------------
+# test_watch_changed
+#-----------------------------------------------------------------------
+
+def test_watch_changed():
+
+  model, sim = make_counter()
+
+  values = []
+  wp = sim.watch( 'top.count', action=lambda wp: values.append(
+                  ( wp.cycle, int( wp.net ) ) ) )
+
+  run( model, sim, 5 )
+  assert [ v for c, v in values ] == [ 1, 2, 3, 4, 5 ]
+  assert [ c for c, v in values ] == range( 2, 7 )
+  assert wp.hits == 5
+
+  # Values which only exist within a cycle are seen too
+
+  glitches = []
+  sim.watch( 'sub.out', 0, lambda wp: glitches.append( wp.cycle ) )
+  run( model, sim, 3 )
+  assert len( glitches ) == 3
+
+  # Removed watchpoints are detached from the net
+
+  sim.unwatch( wp )
+  run( model, sim, 3 )
+  assert len( values ) == 5 + 3
+  assert len( model.count._slices ) == 0
+
+  sim.unwatch()
+  run( model, sim, 3 )
+  assert len( glitches ) == 6
+  assert sim._watchpoints == []
+
+#-----------------------------------------------------------------------
+# test_watch_conditions
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'condition, expected', [
+  ( 4,                  [ 4 ]             ),
+  ( Bits( 16, 6 ),       [ 6 ]             ),
+  ( '== 0x3',            [ 3 ]             ),
+  ( '!= 3',              [ 1, 2, 4, 5, 6 ] ),
+  ( '<  3',              [ 1, 2 ]          ),
+  ( '<= 3',              [ 1, 2, 3 ]       ),
+  ( '>  4',              [ 5, 6 ]          ),
+  ( '>= 4',              [ 4, 5, 6 ]       ),
+  ( lambda net: net[0],  [ 1, 3, 5 ]       ),
+])
+def test_watch_conditions( condition, expected ):
+
+  model, sim = make_counter()
+
+  values = []
+  sim.watch( 'count', condition, lambda wp: values.append( int( wp.net ) ) )
+  run( model, sim, 6 )
+
+  assert values == expected
+
+def test_watch_negative():
+
+  model, sim = make_counter()
+  wp = sim.watch( model.count, -1, lambda wp: None )
+  model.count.value = 0xffff
+  assert wp.hits == 1
+
+#-----------------------------------------------------------------------
+# test_watch_raise
+#-----------------------------------------------------------------------
+
+def test_watch_raise():
+
+  model, sim = make_counter()
+  sim.watch( 'top.count', '== 3' )
+
+  with pytest.raises( WatchpointError ) as excinfo:
+    run( model, sim, 10 )
+
+  assert 'top.count' in str( excinfo.value )
+  assert sim.ncycles == 4
+
+def test_watch_errors():
+
+  model, sim = make_counter()
+
+  with pytest.raises( ValueError ):
+    sim.watch( 'top.nothing' )
+  with pytest.raises( ValueError ):
+    sim.watch( 'top.sub' )
+  with pytest.raises( ValueError ):
+    sim.watch( 'top.count', '=> 3' )
+  with pytest.raises( ValueError ):
+    sim.watch( 'top.count', action='nothing' )
@@ -0,0 +1,676 @@
+#=======================================================================
+# waveform.py
+#=======================================================================
+# Compressed, indexed binary waveform support for SimulationTool.
+#
+# VCD files from long simulations quickly grow to several gigabytes,
+# which makes them slow to write and to open. The pwave format stores
+# the signal definitions once, and stores value changes in independently
+# compressed blocks. Each block starts with a snapshot of the value of
+# every net, and an index of the time range covered by each block is
+# stored at the end of the file, so a reader can jump to any time by
+# decompressing a single block.
+#
+# File layout (all integers are little-endian):
+#
+#   header : magic, version, compression, length of definitions
+#   defs   : zlib compressed JSON with the timescale, the nets (with
+#            their initial values) and the signals of each net
+#   blocks : block header (start time, end time, compressed and raw
+#            lengths) followed by the compressed block data
+#   index  : start time, end time and file offset of each block
+#   footer : offset of the index, number of blocks, magic
+#
+# The block data is text: the snapshot contains a "<net> <value>" line
+# per net, followed by a "#<time>" line for each timestep and a
+# "<net> <value>" line for every net which changed, all in hex. Like the
+# VCD writer, changes are coalesced so each net is written at most once
+# per timestep, and times use the same convention (each cycle is 100
+# time units, with the rising clock edge at 50).
+#
+# Waveforms are written when the model has a wave_file attribute, or
+# when the vcd_file attribute ends with the .pwave extension. Use
+# WaveReader to read waveforms, or wave_to_vcd() (also available from
+# the command line) to convert them to VCD:
+#
+#   % python -m pymtl.tools.simulation.waveform waves.pwave waves.vcd
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import zlib
+import bz2
+import struct
+import bisect
+import collections
+
+from vcd         import walk_signal_defs, get_vcd_timescale, mangle_name, \
+                        _gen_vcd_symbol, get_bin_fmt
+from tracebuffer import TraceBuffer, TRACE_TIME, get_trace_backend, \
+                        register_waveform
+
+try:
+  import lzma
+except ImportError:
+  lzma = None
+
+#-----------------------------------------------------------------------
+# Constants
+#-----------------------------------------------------------------------
+
+WAVE_EXTENSION  = '.pwave'
+WAVE_BLOCK_SIZE = 1 << 20
+
+_magic          = b'PYMTLWAV'
+_index_magic    = b'PWAVEIDX'
+_version        = 1
+
+_header_fmt     = '<8sI8sI'
+_block_fmt      = '<QQII'
+_index_fmt      = '<QQQ'
+_footer_fmt     = '<QI8s'
+
+_header_size    = struct.calcsize( _header_fmt )
+_block_size     = struct.calcsize( _block_fmt  )
+_index_size     = struct.calcsize( _index_fmt  )
+_footer_size    = struct.calcsize( _footer_fmt )
+
+#-----------------------------------------------------------------------
+# Compression
+#-----------------------------------------------------------------------
+# Map from compression name to ( compress, decompress ) functions.
+
+_compressors = {
+  'none' : ( lambda x: x, lambda x: x ),
+  'zlib' : ( zlib.compress, zlib.decompress ),
+  'bz2'  : ( bz2.compress,  bz2.decompress  ),
+}
+
+if lzma:
+  _compressors['lzma'] = ( lzma.compress, lzma.decompress )
+
+def _get_compressor( name ):
+  try:
+    return _compressors[ name ]
+  except KeyError:
+    raise ValueError( 'Unsupported waveform compression "{}", choose from: '
+                      '{}'.format( name, ', '.join( sorted( _compressors ) ) ) )
+
+#-----------------------------------------------------------------------
+# is_wave_file
+#-----------------------------------------------------------------------
+def is_wave_file( filename ):
+  'Return True if filename should be written in the pwave format.'
+  return isinstance( filename, str ) and filename.endswith( WAVE_EXTENSION )
+
+#-----------------------------------------------------------------------
+# WaveWriter
+#-----------------------------------------------------------------------
+# Writes value changes into compressed blocks. Changes for a timestep
+# are provided by calling set_time() followed by write_changes().
+class WaveWriter( object ):
+
+  def __init__( self, filename, defs, compression = 'zlib',
+                block_size = WAVE_BLOCK_SIZE ):
+
+    self._compress, _ = _get_compressor( compression )
+
+    self._fd         = open( filename, 'wb' )
+    self._closed     = False
+    self._offset     = 0
+    self._block_size = block_size
+    self._index      = []
+
+    # Last written value of each net, used for block snapshots
+    self._values     = [ int( x, 16 ) for x in defs['init'] ]
+
+    # Current block and timestep
+    self._chunks     = []
+    self._raw_size   = 0
+    self._start_time = None
+    self._time       = 0
+    self._time_open  = False
+
+    defs = zlib.compress( json.dumps( defs, separators=(',',':') ) )
+    self._write( struct.pack( _header_fmt, _magic, _version, compression,
+                              len( defs ) ) + defs )
+
+  #---------------------------------------------------------------------
+  # _write
+  #---------------------------------------------------------------------
+  # The file stays open until close(). Each write is flushed, so that
+  # the complete blocks of a running simulation can already be read.
+  def _write( self, data ):
+    self._fd.write( data )
+    self._fd.flush()
+    self._offset += len( data )
+
+  #---------------------------------------------------------------------
+  # set_time
+  #---------------------------------------------------------------------
+  def set_time( self, time ):
+    if time != self._time:
+      self._time      = time
+      self._time_open = False
+
+  #---------------------------------------------------------------------
+  # write_changes
+  #---------------------------------------------------------------------
+  # Write a list of ( net id, value ) tuples for the current timestep.
+  def write_changes( self, changes ):
+
+    if not changes:
+      return
+
+    chunks = self._chunks
+
+    # New blocks begin with a snapshot of all nets
+    if self._start_time is None:
+      self._start_time = self._time
+      chunks.append( ''.join( [ '{:x} {:x}\n'.format( i, x )
+                                for i, x in enumerate( self._values ) ] ) )
+
+    if not self._time_open:
+      self._time_open = True
+      chunks.append( '#{:x}\n'.format( self._time ) )
+
+    values = self._values
+    for net_id, value in changes:
+      values[ net_id ] = value
+
+    chunk = ''.join( [ '{:x} {:x}\n'.format( i, x ) for i, x in changes ] )
+    chunks.append( chunk )
+
+    self._raw_size += len( chunk )
+    if self._raw_size >= self._block_size:
+      self._end_block()
+
+  #---------------------------------------------------------------------
+  # write_records
+  #---------------------------------------------------------------------
+  # Write the flat list of ( key, value ) records of a TraceBuffer, see
+  # tracebuffer.py.
+  def write_records( self, records ):
+
+    changes = []
+    for i in xrange( 0, len( records ), 2 ):
+      if records[i] == TRACE_TIME:
+        self.write_changes( changes )
+        self.set_time( records[i+1] )
+        changes = []
+      else:
+        changes.append( ( records[i], records[i+1] ) )
+
+    self.write_changes( changes )
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Blocks are only written once they are complete, see close().
+  def flush( self ):
+    pass
+
+  #---------------------------------------------------------------------
+  # _end_block
+  #---------------------------------------------------------------------
+  def _end_block( self ):
+
+    if self._start_time is None:
+      return
+
+    raw  = ''.join( self._chunks )
+    data = self._compress( raw )
+
+    self._index.append( ( self._start_time, self._time, self._offset ) )
+    self._write( struct.pack( _block_fmt, self._start_time, self._time,
+                              len( data ), len( raw ) ) + data )
+
+    self._chunks     = []
+    self._raw_size   = 0
+    self._start_time = None
+    self._time_open  = False
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Write out the last block and the block index.
+  def close( self ):
+
+    if self._closed:
+      return
+    self._closed = True
+
+    self._end_block()
+
+    index_offset = self._offset
+    self._write( ''.join( [ struct.pack( _index_fmt, *entry )
+                            for entry in self._index ] ) +
+                 struct.pack( _footer_fmt, index_offset, len( self._index ),
+                              _index_magic ) )
+    self._fd.close()
+
+  def __del__( self ):
+    self.close()
+
+#-----------------------------------------------------------------------
+# collect_wave_defs
+#-----------------------------------------------------------------------
+# Assign an id to every net in the model and return the definitions
+# stored in the waveform header, along with the list of nets.
+def collect_wave_defs( model ):
+
+  all_nets = []
+  signals  = []
+  scope    = []
+
+  for item in walk_signal_defs( model, '_wave_id' ):
+
+    if item[0] == 'scope':
+      scope.append( item[1].name )
+
+    elif item[0] == 'upscope':
+      scope.pop()
+
+    else:
+      _, i, net, is_new = item
+      if is_new:
+        net._wave_id     = len( all_nets )
+        net._wave_is_clk = i.name == 'clk'
+        all_nets.append( net )
+      signals.append( [ scope[:], mangle_name( i.name ), net._wave_id ] )
+
+  defs = {
+    'date'      : time.asctime(),
+    'timescale' : get_vcd_timescale( model ),
+    'nbits'     : [ net.nbits for net in all_nets ],
+    'init'      : [ '{:x}'.format( net.uint() ) for net in all_nets ],
+    'signals'   : signals,
+  }
+
+  return defs, all_nets
+
+#-----------------------------------------------------------------------
+# insert_wave_callbacks
+#-----------------------------------------------------------------------
+# Add callbacks which record value changes of each net in the design,
+# see insert_vcd_callbacks() in vcd.py which uses the same approach.
+def insert_wave_callbacks( sim, writer, nets ):
+
+  dirty = []
+
+  # Write the value of all nets which changed since the last flush
+  def flush():
+    changes = []
+    for net in dirty:
+      net._wave_dirty = False
+      value = net.uint()
+      if value != net._wave_last:
+        net._wave_last = value
+        changes.append( ( net._wave_id, value ) )
+    del dirty[:]
+    writer.write_changes( changes )
+
+  def create_wave_callback( net ):
+
+    net._wave_dirty = False
+    net._wave_last  = net.uint()
+
+    # Each signal adds itself to the dirty list when it first changes
+    if not net._wave_is_clk:
+      def cb():
+        if not net._wave_dirty:
+          net._wave_dirty = True
+          dirty.append( net )
+
+    # The clock signal ends the current timestep
+    else:
+      def cb():
+        flush()
+        value = net.uint()
+        net._wave_last = value
+        writer.set_time( 100*sim.ncycles + 50*value )
+        writer.write_changes( [ ( net._wave_id, value ) ] )
+
+    return cb
+
+  callbacks = [ create_wave_callback( net ) for net in nets ]
+  for net, cb in zip( nets, callbacks ):
+    sim._add_trace_callback( net, cb )
+
+  # Write out nets which changed while tracing was off under the time
+  # stamp of the last clock edge when tracing is turned back on
+  def resync():
+    for net in nets:
+      if not net._wave_is_clk and not net._wave_dirty:
+        net._wave_dirty = True
+        dirty.append( net )
+    if sim.ncycles:
+      writer.set_time( 100*sim.ncycles - 50 )
+    flush()
+
+  sim._trace_resync.append( resync )
+
+  # Write out pending changes before the callbacks are detached
+  sim._trace_suspend.append( flush )
+
+  def detach():
+    sim._remove_trace_callbacks( callbacks )
+    sim._trace_resync .remove( resync )
+    sim._trace_suspend.remove( flush  )
+
+  return flush, detach
+
+#-----------------------------------------------------------------------
+# WaveUtil
+#-----------------------------------------------------------------------
+# Hidden class used by the simulator tool for generating pwave output,
+# see VCDUtil in vcd.py. The simulator's wave attribute is set to the
+# WaveUtil, whose close() writes out the changes of the current timestep
+# followed by the last block and the index. The compression and the
+# (uncompressed) block size can be selected with the wave_compression
+# and wave_block_size attributes of the model, and the trace_async
+# attribute moves block compression out of the simulation thread.
+class WaveUtil( object ):
+
+  def __init__( self, simulator, outfile ):
+
+    model       = simulator.model
+    compression = getattr( model, 'wave_compression', 'zlib' )
+    block_size  = getattr( model, 'wave_block_size', WAVE_BLOCK_SIZE )
+
+    defs, nets  = collect_wave_defs( model )
+    args        = ( outfile, defs, compression, block_size )
+
+    # Blocks are compressed and written by a writer thread or process if
+    # asynchronous tracing is enabled, see tracebuffer.py
+
+    backend, size = get_trace_backend( model )
+    if backend:
+      writer = TraceBuffer( WaveWriter, args, backend, size )
+    else:
+      writer = WaveWriter( *args )
+
+    self._writer  = writer
+    self._closed  = False
+    self._pending, self._detach = \
+      insert_wave_callbacks( simulator, writer, nets )
+
+    simulator.wave = self
+    register_waveform( self )
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Write out the changes of the current timestep, blocks are only
+  # written once they are complete.
+  def flush( self ):
+    if not self._closed:
+      self._pending()
+      self._writer.flush()
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Write out the changes of the current timestep, the last block and
+  # the index, the simulator is not traced anymore after this.
+  def close( self ):
+
+    if self._closed:
+      return
+
+    self.flush()
+    self._closed = True
+    self._detach()
+    self._writer.close()
+
+#-----------------------------------------------------------------------
+# WaveReader
+#-----------------------------------------------------------------------
+class WaveReader( object ):
+  '''Reader for waveforms in the pwave format.
+
+  >>> wave = WaveReader( 'waves.pwave' )
+  >>> wave.values_at( wave.cycle_time( 10 ) )['top.out']
+  '''
+
+  def __init__( self, filename ):
+
+    self._fd = open( filename, 'rb' )
+
+    header = self._fd.read( _header_size )
+    if len( header ) < _header_size or not header.startswith( _magic ):
+      raise ValueError( '{} is not a pwave file!'.format( filename ) )
+
+    magic, version, compression, defs_len = \
+      struct.unpack( _header_fmt, header )
+
+    if version != _version:
+      raise ValueError( 'Unsupported pwave version {} in {}!'
+                        .format( version, filename ) )
+
+    _, self._decompress = _get_compressor( compression.rstrip( '\0' ) )
+
+    defs = json.loads( zlib.decompress( self._fd.read( defs_len ) ) )
+
+    self.timescale   = defs['timescale']
+    self.date        = defs['date']
+    self.nbits       = defs['nbits']
+    self.init_values = [ int( x, 16 ) for x in defs['init'] ]
+
+    # Hierarchical signal names and the net each signal belongs to
+
+    self._signals = defs['signals']
+    self.signals  = collections.OrderedDict()
+    for scope, name, net_id in self._signals:
+      self.signals[ '.'.join( scope + [ name ] ) ] = net_id
+
+    self._data_offset = self._fd.tell()
+    self._index       = self._read_index()
+    self._starts      = [ start for start, end, offset in self._index ]
+    self._cache       = ( None, None )
+
+  #---------------------------------------------------------------------
+  # _read_index
+  #---------------------------------------------------------------------
+  # Read the block index from the end of the file. If the simulation was
+  # interrupted before the index was written, rebuild the index from the
+  # block headers instead (this only skips over the blocks, it does not
+  # decompress them).
+  def _read_index( self ):
+
+    fd = self._fd
+    fd.seek( 0, 2 )
+    size = fd.tell()
+
+    if size >= self._data_offset + _footer_size:
+      fd.seek( size - _footer_size )
+      offset, count, magic = struct.unpack( _footer_fmt,
+                                            fd.read( _footer_size ) )
+      if magic == _index_magic:
+        fd.seek( offset )
+        return [ struct.unpack( _index_fmt, fd.read( _index_size ) )
+                 for _ in xrange( count ) ]
+
+    index  = []
+    offset = self._data_offset
+    while offset + _block_size <= size:
+      fd.seek( offset )
+      start, end, data_len, raw_len = \
+        struct.unpack( _block_fmt, fd.read( _block_size ) )
+      if offset + _block_size + data_len > size:
+        break
+      index.append( ( start, end, offset ) )
+      offset += _block_size + data_len
+
+    return index
+
+  #---------------------------------------------------------------------
+  # _read_block
+  #---------------------------------------------------------------------
+  # Return the snapshot and the list of ( time, changes ) timesteps of
+  # a block. The most recently read block is cached.
+  def _read_block( self, idx ):
+
+    if self._cache[0] == idx:
+      return self._cache[1]
+
+    start, end, offset = self._index[ idx ]
+    self._fd.seek( offset )
+    _, _, data_len, raw_len = \
+      struct.unpack( _block_fmt, self._fd.read( _block_size ) )
+    raw = self._decompress( self._fd.read( data_len ) )
+
+    snapshot  = list( self.init_values )
+    timesteps = []
+    changes   = None
+
+    for line in raw.splitlines():
+      if line[0] == '#':
+        changes = []
+        timesteps.append( ( int( line[1:], 16 ), changes ) )
+      else:
+        net_id, value = line.split()
+        if changes is None:
+          snapshot[ int( net_id, 16 ) ] = int( value, 16 )
+        else:
+          changes.append( ( int( net_id, 16 ), int( value, 16 ) ) )
+
+    self._cache = ( idx, ( snapshot, timesteps ) )
+    return snapshot, timesteps
+
+  #---------------------------------------------------------------------
+  # Public Methods
+  #---------------------------------------------------------------------
+
+  @property
+  def num_blocks( self ):
+    return len( self._index )
+
+  @property
+  def end_time( self ):
+    'Time of the last recorded timestep.'
+    return self._index[-1][1] if self._index else 0
+
+  def cycle_time( self, cycle ):
+    'Time of the rising clock edge of the given simulator cycle.'
+    return 100*cycle + 50
+
+  def changes( self ):
+    '''Iterate over all timesteps, yielding ( time, changes ) tuples where
+    changes is a list of ( net id, value ) tuples.'''
+    for idx in xrange( len( self._index ) ):
+      snapshot, timesteps = self._read_block( idx )
+      for timestep in timesteps:
+        yield timestep
+
+  def net_values_at( self, time ):
+    'Return the value of every net at the end of the given time.'
+
+    idx = bisect.bisect_right( self._starts, time ) - 1
+    if idx < 0:
+      return list( self.init_values )
+
+    snapshot, timesteps = self._read_block( idx )
+    values = list( snapshot )
+    for t, changes in timesteps:
+      if t > time:
+        break
+      for net_id, value in changes:
+        values[ net_id ] = value
+
+    return values
+
+  def values_at( self, time ):
+    'Return a dictionary with the value of every signal at the given time.'
+    values = self.net_values_at( time )
+    return { name : values[ net_id ]
+             for name, net_id in self.signals.items() }
+
+  def close( self ):
+    self._fd.close()
+
+#-----------------------------------------------------------------------
+# write_vcd
+#-----------------------------------------------------------------------
+# Write a VCD file given waveform definitions (see collect_wave_defs),
+# the initial value of each net, and an iterable of ( time, changes )
+# tuples where changes is a list of ( net id, value ) tuples.
+def write_vcd( o, defs, init_values, changes ):
+
+  print( '$date\n    {}\n$end\n$version\n    PyMTL ?.??\n$end\n'
+         '$timescale\n    {}\n$end\n'.format( defs['date'],
+                                                defs['timescale'] ),
+         file=o )
+
+  # Recreate the scopes from the scope of each signal
+
+  nbits      = defs['nbits']
+  vcd_symbol = _gen_vcd_symbol()
+  symbols    = [ vcd_symbol.next() for _ in nbits ]
+  scope      = []
+
+  for signal_scope, name, net_id in defs['signals']:
+
+    common = 0
+    while common < min( len( scope ), len( signal_scope ) ) and \
+          scope[ common ] == signal_scope[ common ]:
+      common += 1
+
+    for _ in scope[ common: ]:
+      print( '$upscope $end', file=o )
+    for s in signal_scope[ common: ]:
+      print( '$scope module {} $end'.format( s ), file=o )
+    scope = signal_scope
+
+    print( '$var reg {} {} {} $end'.format( nbits[ net_id ],
+           symbols[ net_id ], name ), file=o )
+
+  for _ in scope:
+    print( '$upscope $end', file=o )
+
+  # Value changes
+
+  fmts = [ 'b' + get_bin_fmt( n ) + ' ' for n in nbits ]
+
+  print( '$enddefinitions $end\n', file=o )
+  o.write( ''.join( [ fmts[ i ].format( x ) + symbols[ i ] + '\n'
+                      for i, x in enumerate( init_values ) ] ) )
+
+  last_time = None
+  for t, changes in changes:
+    lines = [ '#{}\n'.format( t ) ] if t != last_time else []
+    lines.extend( [ fmts[ i ].format( x ) + symbols[ i ] + '\n'
+                    for i, x in changes ] )
+    o.write( ''.join( lines ) )
+    last_time = t
+
+#-----------------------------------------------------------------------
+# wave_to_vcd
+#-----------------------------------------------------------------------
+def wave_to_vcd( wave_file, vcd_file ):
+  'Convert a pwave waveform into a VCD file.'
+
+  wave = WaveReader( wave_file )
+  o    = open( vcd_file, 'w' ) if isinstance( vcd_file, str ) else vcd_file
+
+  defs = { 'date'      : wave.date,
+           'timescale' : wave.timescale,
+           'nbits'     : wave.nbits,
+           'signals'   : wave._signals }
+
+  write_vcd( o, defs, wave.init_values, wave.changes() )
+
+  if o is not vcd_file:
+    o.close()
+  wave.close()
+
+#-----------------------------------------------------------------------
+# main
+#-----------------------------------------------------------------------
+if __name__ == '__main__':
+  if len( sys.argv ) != 3:
+    print( 'usage: {} input.pwave output.vcd'.format( sys.argv[0] ) )
+    sys.exit( 1 )
+  wave_to_vcd( sys.argv[1], sys.argv[2] )
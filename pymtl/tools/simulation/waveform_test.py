@@ -0,0 +1,245 @@
+#=======================================================================
+# waveform_test.py
+#=======================================================================
+
+import gc
+import pytest
+
+from pymtl       import *
+from waveform    import WaveReader, wave_to_vcd
+from tracebuffer import close_waveforms, _waveforms
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+
+class Counter( Model ):
+
+  def __init__( s ):
+    s.en    = InPort ( 1  )
+    s.count = OutPort( 16 )
+    s.next_ = Wire   ( 16 )
+
+    s.sub = Adder()
+    s.connect( s.sub.in_, s.count )
+    s.connect( s.sub.out, s.next_ )
+
+    @s.tick
+    def seq():
+      if   s.reset: s.count.next = 0
+      elif s.en:    s.count.next = s.next_
+
+class Adder( Model ):
+
+  def __init__( s ):
+    s.in_ = InPort ( 16 )
+    s.out = OutPort( 16 )
+
+    @s.combinational
+    def comb():
+      s.out.value = 0
+      s.out.value = s.in_ + 1
+
+def run_counter( tmpdir, ncycles, **attrs ):
+
+  model = Counter()
+  for name, value in attrs.items():
+    setattr( model, name, value )
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.reset()
+
+  counts = []
+  for i in range( ncycles ):
+    model.en.value = ( i % 3 ) != 0
+    sim.cycle()
+    counts.append( ( sim.ncycles-1, int( model.count ) ) )
+
+  return model, sim, counts
+
+#-----------------------------------------------------------------------
+# test_wave_reader
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'compression', [ 'none', 'zlib', 'bz2' ] )
+def test_wave_reader( tmpdir, compression ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 500, wave_file=wave_file,
+                                    wave_compression=compression,
+                                    wave_block_size=256 )
+  sim.wave.close()
+
+  wave = WaveReader( wave_file )
+
+  assert wave.num_blocks > 1
+  assert 'top.count' in wave.signals
+  assert 'top.sub.in_' in wave.signals
+  assert wave.signals['top.count'] == wave.signals['top.sub.in_']
+
+  for cycle, count in counts:
+    values = wave.values_at( wave.cycle_time( cycle ) )
+    assert values['top.count']   == count
+    assert values['top.sub.out'] == ( count + 1 ) & 0xffff
+    assert values['top.clk']     == 1
+
+  assert wave.values_at( 0 )['top.count'] == 0
+  assert wave.end_time == wave.cycle_time( sim.ncycles-1 )
+
+def test_wave_vcd_extension( tmpdir ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 20, vcd_file=wave_file )
+  sim.wave.close()
+
+  wave = WaveReader( wave_file )
+  cycle, count = counts[-1]
+  assert wave.values_at( wave.cycle_time( cycle ) )['top.count'] == count
+
+def test_wave_missing_index( tmpdir ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 200, wave_file=wave_file,
+                                    wave_block_size=256 )
+
+  # Simulate an interrupted simulation: only the full blocks are written
+
+  wave = WaveReader( wave_file )
+  assert wave.num_blocks > 1
+
+  for cycle, count in counts:
+    if wave.cycle_time( cycle ) < wave.end_time:
+      values = wave.values_at( wave.cycle_time( cycle ) )
+      assert values['top.count'] == count
+
+#-----------------------------------------------------------------------
+# test_wave_to_vcd
+#-----------------------------------------------------------------------
+# Converting a waveform should produce the same definitions and values
+# as the vcd writer. Changes made before the first clock edge are placed
+# at time zero rather than in the initial values, so we compare the
+# values at each timestep instead of the raw text.
+
+def replay_vcd( filename ):
+
+  lines   = open( filename ).read().split( '\n' )
+  defs    = lines[ lines.index( '$timescale' ):
+                   lines.index( '$enddefinitions $end' ) ]
+  values  = {}
+  history = []
+  for line in lines[ lines.index( '$enddefinitions $end' ): ]:
+    if line.startswith( '#' ):
+      if not history and line != '#0':
+        history.append( ( 0, dict( values ) ) )
+      history.append( ( int( line[1:] ), dict( values ) ) )
+    elif line.startswith( 'b' ):
+      value, symbol = line[1:].split()
+      values[ symbol ] = value
+      if history:
+        history[-1][1][ symbol ] = value
+
+  return defs, history
+
+def test_wave_to_vcd( tmpdir ):
+
+  vcd_file  = str( tmpdir.join( 'counter.vcd' ) )
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  conv_file = str( tmpdir.join( 'converted.vcd' ) )
+
+  model, sim, counts = run_counter( tmpdir, 100, vcd_file=vcd_file,
+                                    wave_file=wave_file,
+                                    wave_block_size=128 )
+
+  # Changes after the last cycle are written at the last timestep
+
+  model.sub.in_.value = 0x1234
+  sim.eval_combinational()
+
+  sim.vcd.close()
+  sim.wave.close()
+
+  wave_to_vcd( wave_file, conv_file )
+
+  defs, history = replay_vcd( conv_file )
+  assert ( defs, history ) == replay_vcd( vcd_file )
+
+  wave = WaveReader( wave_file )
+  values = wave.values_at( wave.end_time )
+  assert values['top.count']   == 0x1234
+  assert values['top.sub.out'] == 0x1235
+
+#-----------------------------------------------------------------------
+# test_wave_close_waveforms
+#-----------------------------------------------------------------------
+# Open waveforms are closed at the end of each test and at exit, which
+# only writes out the simulators which are still alive.
+
+def test_wave_close_waveforms( tmpdir ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 10, wave_file=wave_file )
+  model.en.value = 0
+  sim.eval_combinational()
+
+  close_waveforms()
+
+  wave = WaveReader( wave_file )
+  assert wave.values_at( wave.end_time )['top.en'] == 0
+  assert sim._trace_callbacks == []
+
+  # Waveforms of deleted simulators are not kept alive
+
+  run_counter( tmpdir, 10, wave_file=str( tmpdir.join( 'other.pwave' ) ) )
+  gc.collect()
+  assert not _waveforms
+
+#-----------------------------------------------------------------------
+# test_wave_scoped_window
+#-----------------------------------------------------------------------
+
+def test_wave_scoped_window( tmpdir ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 50, wave_file=wave_file,
+                                    trace_exclude='top.sub.*',
+                                    trace_start=20, trace_stop=30 )
+  sim.wave.close()
+
+  wave = WaveReader( wave_file )
+
+  assert 'top.count' in wave.signals
+  assert 'top.clk' in wave.signals
+  assert not [ x for x in wave.signals if x.startswith( 'top.sub.' ) ]
+
+  # Values are only tracked inside the tracing window, tracing resumes
+  # with the values at the end of the cycle before the window
+
+  for cycle, count in counts:
+    if 19 <= cycle < 30:
+      values = wave.values_at( wave.cycle_time( cycle ) )
+      assert values['top.count'] == count
+
+  assert wave.end_time == wave.cycle_time( 29 )
+
+#-----------------------------------------------------------------------
+# test_wave_async
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'backend', [ 'thread', 'process' ] )
+def test_wave_async( tmpdir, backend ):
+
+  wave_file = str( tmpdir.join( 'counter.pwave' ) )
+  model, sim, counts = run_counter( tmpdir, 300, wave_file=wave_file,
+                                    wave_block_size=256,
+                                    trace_async=backend,
+                                    trace_buffer_size=64 )
+  sim.wave.close()
+
+  wave = WaveReader( wave_file )
+
+  assert wave.num_blocks > 1
+  for cycle, count in counts:
+    values = wave.values_at( wave.cycle_time( cycle ) )
+    assert values['top.count']   == count
+    assert values['top.sub.out'] == ( count + 1 ) & 0xffff
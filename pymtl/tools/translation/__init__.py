@@ -1,2 +1,4 @@
-from verilator_sim import TranslationTool
-from cpp_sim       import get_cpp
+from verilator_sim  import TranslationTool
+from verilator_pool import VerilatorPool
+from fuse           import fuse_translated
+from cpp_sim        import get_cpp
@@ -6,7 +6,7 @@
 from pymtl                   import *
 from cpp_helpers             import gen_cheader, gen_cdef, gen_pywrapper
 from ..ast_helpers           import get_method_ast, print_simple_ast, print_ast
-from ...datatypes.SignalValue import SignalValueWrapper
+from ...datatypes.SignalValue import SignalValueWrapper, WrappedSignalValue
 from ..simulation            import sim_utils
 
 import sys
@@ -221,7 +221,7 @@ def get_type( signal, o=None ):
   elif isinstance( signal, Bits ):
     assert not isinstance( signal, BitStruct )
     return 'unsigned int'    # TODO: make a setbitwidth object
-  elif isinstance( signal, SignalValueWrapper ):
+  elif isinstance( signal, (SignalValueWrapper, WrappedSignalValue) ):
     if not o:
       raise Exception( "NESTED TYPES NOT ALLOWED" )
     return declare_class( signal, o )
@@ -241,13 +241,20 @@ def get_type( signal, o=None ):
 #-----------------------------------------------------------------------
 classes = set()
 def declare_class( signal, o ):
-  class_name = signal._data.__class__.__name__
+  if isinstance( signal, SignalValueWrapper ):
+    signal = signal._data
+  class_name = signal.__class__.__name__
   if class_name in classes:
     return class_name
   classes.add( class_name )
   print   >> o, "class {} {{".format( class_name )
   print   >> o, "  public:"
-  for name, value in signal._data.__dict__.items():
+  # Generated wrapped classes keep their fields in slots
+  if isinstance( signal, WrappedSignalValue ):
+    fields = [ ( name, getattr( signal, name ) ) for name in signal.__fields__ ]
+  else:
+    fields = signal.__dict__.items()
+  for name, value in fields:
     print >> o, "    {} {};".format( get_type(value), name );
   print   >> o, "};"
   return class_name
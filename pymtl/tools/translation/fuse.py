@@ -0,0 +1,386 @@
+#=======================================================================
+# fuse.py
+#=======================================================================
+# Fuse connected submodules which are simulated with Verilator into a
+# single verilated model.
+#
+# Every model returned by the TranslationTool (including imported
+# VerilogModels, which are translated when they are constructed) is a
+# separate shared library, so each connection between two of them goes
+# through Python and the event queue of the simulator every cycle.
+# fuse_translated() finds the clusters of such submodules which are
+# connected to each other in the same parent, and translates each
+# cluster as one Verilog top module. The connections within a cluster
+# are simulated entirely in C++, and only the ports of the cluster used
+# from outside (connected to other signals of the parent, or read and
+# written by its concurrent blocks) are exposed to Python.
+#
+# The pass rewrites the parent before it is elaborated:
+#
+#  - the submodules of the cluster are constructed again from the class
+#    and arguments recorded by the TranslationTool, so they can be
+#    translated as part of the cluster (they must not be modified after
+#    they are constructed)
+#  - each submodule of the cluster is replaced with a shell model which
+#    only has its ports, so the connections and the concurrent blocks of
+#    the parent which use them are unchanged
+#  - the translated cluster is added to the parent, and connected to the
+#    ports of the shells which are used from outside
+#
+# Ports of fused submodules which are not used from outside keep their
+# reset value, including ports only read by line tracing or by a test
+# bench after simulation. Use observe=True to expose all of them. The
+# shells do not have line traces, and a parent with fused submodules can
+# only be simulated, not translated.
+
+import re
+import hashlib
+import collections
+
+from ..ast_helpers         import get_method_ast
+from ...model.Model        import Model
+from ...model.signals      import InPort, OutPort, Constant
+from ...model.PortBundle   import PortBundle
+from ...model.metaclasses  import MetaCollectArgs
+from port_deps             import get_names, resolve_name
+from verilator_sim         import TranslationTool
+
+#-----------------------------------------------------------------------
+# fuse_translated
+#-----------------------------------------------------------------------
+# Fuse the clusters of translated submodules of an un-elaborated model
+# and of all of its submodules. Keyword arguments are passed to the
+# TranslationTool for each cluster. Returns the model.
+def fuse_translated( model, observe=False, **kwargs ):
+
+  for cluster in find_clusters( model, observe ):
+    fuse_cluster( model, cluster, **kwargs )
+
+  for name, child in get_children( model ):
+    if not hasattr( child, '_translated_from' ):
+      fuse_translated( child, observe, **kwargs )
+
+  return model
+
+#-----------------------------------------------------------------------
+# Cluster
+#-----------------------------------------------------------------------
+# A cluster is a list of ( name, submodule ) children, the list of the
+# connections of the parent between them (and to constants) which are
+# moved into the cluster, and the list of ( port, others, driven ) nets
+# which are used from outside. The port of each net is exposed by the
+# cluster, as an output if the net is driven by the cluster (driven),
+# and the other ports of the net which are used from outside are
+# connected to it by the parent.
+
+Cluster = collections.namedtuple( 'Cluster', 'children connections nets' )
+
+#-----------------------------------------------------------------------
+# find_clusters
+#-----------------------------------------------------------------------
+# Return the clusters of the translated children of an un-elaborated
+# model which are connected to each other.
+def find_clusters( model, observe=False ):
+
+  children = [ ( name, child ) for name, child in get_children( model )
+               if hasattr( child, '_translated_from' )
+               and not child.is_elaborated() ]
+
+  # Children referred to more than once, connected with connect_auto, or
+  # whose clk and reset are connected explicitly cannot be replaced
+
+  count = collections.Counter( id( child ) for name, child in get_children( model ) )
+  auto  = set( id( x ) for pair in getattr( model, '_auto_connects', [] )
+                       for x in pair )
+  clks  = {}
+  for name, child in children:
+    clks[ child.clk ] = clks[ child.reset ] = child
+
+  excluded = set( id( clks[x] ) for c in model.get_connections()
+                                for x in [ c.src_node, c.dest_node ]
+                                if x in clks )
+
+  children = [ ( name, child ) for name, child in children
+               if count[ id( child ) ] == 1 and id( child ) not in auto
+               and id( child ) not in excluded ]
+
+  # Ports of the children, in a deterministic order
+
+  owner = collections.OrderedDict()
+  for i, ( name, child ) in enumerate( children ):
+    for path, port in get_ports( child ):
+      owner[ port ] = i
+
+  # Group children connected to each other with a union-find
+
+  groups = range( len( children ) )
+
+  def find( i ):
+    while groups[ i ] != i:
+      i = groups[ i ]
+    return i
+
+  for c in model.get_connections():
+    if c.src_node in owner and c.dest_node in owner:
+      groups[ find( owner[ c.src_node ] ) ] = find( owner[ c.dest_node ] )
+
+  members = collections.OrderedDict()
+  for i in range( len( children ) ):
+    members.setdefault( find( i ), [] ).append( i )
+
+  # Ports read or written by the concurrent blocks of the model
+
+  refs = set()
+  for func in model.get_combinational_blocks() + model.get_tick_blocks() + \
+              model.get_posedge_clk_blocks():
+    loads, stores = get_names( get_method_ast( func )[0] )
+    for name in loads + stores:
+      refs.update( resolve_name( model, name ) )
+
+  clusters = []
+  for group in members.values():
+    if len( group ) > 1:
+      clusters.append( get_cluster( model, [ children[i] for i in group ],
+                                    refs, observe ) )
+  return clusters
+
+def get_cluster( model, children, refs, observe ):
+
+  ports = [ port for name, child in children for path, port in get_ports( child ) ]
+  index = dict( ( port, i ) for i, port in enumerate( ports ) )
+
+  # Connections within the cluster and to constants are moved into the
+  # cluster, other connections are used from outside
+
+  connections = []
+  used        = set( x for x in ports if x in refs )
+  consts      = set()
+
+  for c in sorted( model.get_connections(), key=lambda c: connection_key( c, index ) ):
+    src, dest = c.src_node in index, c.dest_node in index
+    if src and dest:
+      connections.append( c )
+    elif src or dest:
+      node, other = ( c.src_node, c.dest_node ) if src else ( c.dest_node, c.src_node )
+      if isinstance( other, Constant ):
+        connections.append( c )
+        consts.add( node )
+      else:
+        used.add( node )
+
+  # Nets within the cluster
+
+  nets = range( len( ports ) )
+
+  def find( i ):
+    while nets[ i ] != i:
+      i = nets[ i ]
+    return i
+
+  for c in connections:
+    if c.src_node in index and c.dest_node in index:
+      nets[ find( index[ c.src_node ] ) ] = find( index[ c.dest_node ] )
+
+  groups = collections.OrderedDict()
+  for i, port in enumerate( ports ):
+    groups.setdefault( find( i ), [] ).append( port )
+
+  exposed = []
+  for net in groups.values():
+    driven = any( isinstance( x, OutPort ) or x in consts for x in net )
+    if observe and driven:
+      outside = net
+    else:
+      outside = [ x for x in net if x in used ]
+    if outside:
+      exposed.append( ( outside[0], outside[1:], driven ) )
+
+  return Cluster( children, connections, exposed )
+
+def connection_key( c, index ):
+  return ( index.get( c.src_node, -1 ), index.get( c.dest_node, -1 ),
+           str( c.src_slice ), str( c.dest_slice ) )
+
+#-----------------------------------------------------------------------
+# fuse_cluster
+#-----------------------------------------------------------------------
+# Replace the children of a cluster with shells and a single translated
+# model. Returns the translated model.
+def fuse_cluster( model, cluster, **kwargs ):
+
+  # Construct the children again, and map their ports
+
+  fresh   = []
+  mapping = {}
+  paths   = {}
+  for name, child in cluster.children:
+    cls, args = child._translated_from
+    new_child = MetaCollectArgs.__call__( cls, **args )
+    fresh.append( ( sanitize( name ), new_child ) )
+    new_ports = dict( get_ports( new_child ) )
+    for path, port in get_ports( child ):
+      mapping[ port ] = new_ports[ path ]
+      paths  [ port ] = '{}.{}'.format( name, path )
+
+  def endpoint( node, addr ):
+    if isinstance( node, Constant ):
+      return int( node._signalvalue )
+    node = mapping[ node ]
+    return node if addr is None else node[ addr ]
+
+  connections = [ ( endpoint( c.src_node,  c.src_slice  ),
+                    endpoint( c.dest_node, c.dest_slice ) )
+                  for c in cluster.connections ]
+
+  # Ports of the cluster
+
+  names = set( name for name, child in fresh )
+  ports = []
+  for port, others, driven in cluster.nets:
+    name = unique_name( 'p_' + sanitize( paths[ port ] ), names )
+    ports.append( ( name, OutPort if driven else InPort, port.dtype,
+                    mapping[ port ] ) )
+
+  fused = FusedModel( fused_name( model, cluster, fresh, paths, ports ),
+                      fresh, ports, connections )
+  fused.vcd_file = None
+  fused = TranslationTool( fused, **kwargs )
+
+  # Rewrite the parent. The connections moved into the cluster are
+  # removed from the ports of the shells.
+
+  for c in cluster.connections:
+    model._connections.discard( c )
+    for node in [ c.src_node, c.dest_node ]:
+      if c in node.connections:
+        node.connections.remove( c )
+
+  for name, child in cluster.children:
+    replace_child( model, name, FusedShell( child ) )
+
+  attr = unique_name( sanitize( cluster.children[0][0] ) + '_fused',
+                      set( model.__dict__ ) )
+  setattr( model, attr, fused )
+
+  for ( name, cls, dtype, new_port ), ( port, others, driven ) in \
+      zip( ports, cluster.nets ):
+    model.connect( getattr( fused, name ), port )
+    for other in others:
+      model.connect( port, other )
+
+  return fused
+
+def fused_name( model, cluster, fresh, paths, ports ):
+
+  # Deterministic name for the same design, so the build can be reused
+
+  desc = []
+  for name, child in fresh:
+    args = [ ( k, re.sub( r' at 0x[0-9a-f]+', '', str( v ) ) )
+             for k, v in child._args.items() ]
+    desc.append( ( name, child.__class__.__module__,
+                   child.__class__.__name__, args ) )
+
+  for c in cluster.connections:
+    desc.append( ( paths.get( c.src_node,  c.src_node.name  ), str( c.src_slice  ),
+                   paths.get( c.dest_node, c.dest_node.name ), str( c.dest_slice ) ) )
+  desc.extend( [ ( x[0], x[1].__name__ ) for x in ports ] )
+
+  return '{}_fused_{}'.format( model.__class__.__name__,
+                               hashlib.sha1( repr( desc ) ).hexdigest()[:16] )
+
+#-----------------------------------------------------------------------
+# FusedModel
+#-----------------------------------------------------------------------
+class FusedModel( Model ):
+  'Cluster of submodules translated as one Verilog top module.'
+
+  def __init__( s, name, children, ports, connections ):
+
+    s.explicit_modulename = name
+
+    for name, child in children:
+      setattr( s, name, child )
+
+    for name, cls, dtype, port in ports:
+      setattr( s, name, cls( dtype ) )
+      s.connect( getattr( s, name ), port )
+
+    for src, dest in connections:
+      s.connect( src, dest )
+
+#-----------------------------------------------------------------------
+# FusedShell
+#-----------------------------------------------------------------------
+class FusedShell( Model ):
+  'Ports of a submodule which has been fused, without any logic.'
+
+  def __init__( s, child ):
+    for name, obj in child.__dict__.items():
+      if not name.startswith( '_' ) and name not in ( 'clk', 'reset' ) \
+         and is_port( obj ):
+        setattr( s, name, obj )
+
+#-----------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------
+
+def is_port( obj ):
+  if isinstance( obj, list ):
+    return bool( obj ) and all( is_port( x ) for x in obj )
+  return isinstance( obj, ( InPort, OutPort, PortBundle ) )
+
+# Return the ( name, submodule ) children of an un-elaborated model,
+# elements of lists are named 'name[i]'.
+def get_children( model ):
+  children = []
+  for name, obj in sorted( model.__dict__.items() ):
+    if name.startswith( '_' ):
+      continue
+    if isinstance( obj, Model ):
+      children.append( ( name, obj ) )
+    elif isinstance( obj, list ):
+      children.extend( [ ( '{}[{}]'.format( name, i ), x )
+                         for i, x in enumerate( obj ) if isinstance( x, Model ) ] )
+  return children
+
+def replace_child( model, name, new_child ):
+  match = re.match( r'(\w+)\[(\d+)\]$', name )
+  if match:
+    getattr( model, match.group( 1 ) )[ int( match.group( 2 ) ) ] = new_child
+  else:
+    setattr( model, name, new_child )
+
+# Return the ( path, port ) of the ports of an un-elaborated model, other
+# than clk and reset, e.g., ( 'in_', ... ), ( 'enq.msg', ... ) and
+# ( 'out[1]', ... ).
+def get_ports( model ):
+
+  ports = []
+
+  def add( path, obj ):
+    if isinstance( obj, ( InPort, OutPort ) ):
+      ports.append( ( path, obj ) )
+    elif isinstance( obj, PortBundle ):
+      for port in obj.get_ports():
+        add( '{}.{}'.format( path, port.name.split( '.' )[-1] ), port )
+    elif isinstance( obj, list ):
+      for i, x in enumerate( obj ):
+        add( '{}[{}]'.format( path, i ), x )
+
+  for name, obj in sorted( model.__dict__.items() ):
+    if not name.startswith( '_' ) and name not in ( 'clk', 'reset' ):
+      add( name, obj )
+
+  return ports
+
+def sanitize( name ):
+  return re.sub( r'_+', '_', re.sub( r'\W', '_', name ) ).strip( '_' )
+
+def unique_name( name, names ):
+  new_name, i = name, 1
+  while new_name in names:
+    new_name = '{}_{}'.format( name, i )
+    i += 1
+  names.add( new_name )
+  return new_name
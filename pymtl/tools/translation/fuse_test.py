@@ -0,0 +1,135 @@
+#=======================================================================
+# fuse_test.py
+#=======================================================================
+
+import pytest
+import fuse
+
+from pymtl      import *
+from pclib.rtl  import Reg, Mux
+from fuse       import fuse_translated, find_clusters, FusedShell
+
+def translated( model ):
+  'Mark a model as if it had been returned by the TranslationTool.'
+  model._translated_from = ( model.__class__, model._args )
+  return model
+
+#-----------------------------------------------------------------------
+# Pipeline
+#-----------------------------------------------------------------------
+# Chain of registers with a mux between the last two, where the mux is
+# also read by a combinational block of the parent. The side register
+# is not connected to any other translated submodule.
+
+class Pipeline( Model ):
+
+  def __init__( s, make = translated ):
+
+    s.in_  = InPort ( 8 )
+    s.sel  = InPort ( 1 )
+    s.out  = OutPort( 8 )
+    s.mid  = OutPort( 8 )
+    s.side = OutPort( 8 )
+
+    s.regs = [ make( Reg( 8 ) ) for _ in range( 3 ) ]
+    s.mux  = make( Mux( 8, 2 ) )
+    s.reg  = make( Reg( 8 ) )
+
+    s.connect( s.regs[0].in_, s.in_         )
+    s.connect( s.regs[1].in_, s.regs[0].out )
+    s.connect( s.mux.in_[0],  s.regs[1].out )
+    s.connect( s.mux.in_[1],  s.regs[0].out )
+    s.connect( s.mux.sel,     s.sel         )
+    s.connect( s.regs[2].in_, s.mux.out     )
+    s.connect( s.regs[2].out, s.out         )
+
+    s.connect( s.reg.in_,     s.in_         )
+    s.connect( s.reg.out,     s.side        )
+
+    @s.combinational
+    def comb():
+      s.mid.value = s.mux.out
+
+#-----------------------------------------------------------------------
+# test_find_clusters
+#-----------------------------------------------------------------------
+
+def test_find_clusters():
+
+  model    = Pipeline()
+  clusters = find_clusters( model )
+
+  assert len( clusters ) == 1
+  cluster = clusters[0]
+
+  names = [ name for name, child in cluster.children ]
+  assert names == [ 'mux', 'regs[0]', 'regs[1]', 'regs[2]' ]
+
+  # Connections between the registers and the mux are moved into the
+  # cluster
+
+  assert len( cluster.connections ) == 4
+
+  # The mux output is read by the parent, the select of the mux and the
+  # input of the first register are driven from outside, and the output
+  # of the last register is connected to an output port
+
+  nets = [ ( port, len( others ), driven ) for port, others, driven in cluster.nets ]
+  assert nets == [
+    ( model.mux.out,     0, True  ),
+    ( model.mux.sel,     0, False ),
+    ( model.regs[0].in_, 0, False ),
+    ( model.regs[2].out, 0, True  ),
+  ]
+
+  # With observe, the outputs of all of the registers are also exposed
+
+  assert len( find_clusters( Pipeline(), observe=True )[0].nets ) == 6
+
+  # Submodules which are not translated are not fused
+
+  assert find_clusters( Pipeline( make = lambda x: x ) ) == []
+
+#-----------------------------------------------------------------------
+# test_fuse
+#-----------------------------------------------------------------------
+# Fuse without translating the cluster, so the rewritten design can be
+# simulated and compared to the original one without Verilator.
+
+def run_pipeline( model ):
+
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+
+  outputs = []
+  for i in range( 10 ):
+    model.in_.value = i + 1
+    model.sel.value = i % 3 == 0
+    sim.cycle()
+    outputs.append( ( int( model.out ), int( model.mid ), int( model.side ) ) )
+  return outputs
+
+def test_fuse( monkeypatch ):
+
+  monkeypatch.setattr( fuse, 'TranslationTool', lambda model, **kwargs: model )
+
+  model = fuse_translated( Pipeline() )
+
+  assert isinstance( model.mux, FusedShell )
+  assert all( isinstance( x, FusedShell ) for x in model.regs )
+  assert not isinstance( model.reg, FusedShell )
+  assert isinstance( model.mux_fused, fuse.FusedModel )
+
+  assert run_pipeline( model ) == run_pipeline( Pipeline() )
+
+#-----------------------------------------------------------------------
+# test_fuse_verilator
+#-----------------------------------------------------------------------
+
+@requires_verilator
+def test_fuse_verilator():
+
+  model = fuse_translated( Pipeline( make = TranslationTool ) )
+  assert isinstance( model.mux, FusedShell )
+  assert run_pipeline( model ) == run_pipeline( Pipeline( make = lambda x: x ) )
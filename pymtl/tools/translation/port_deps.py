@@ -0,0 +1,263 @@
+#=======================================================================
+# port_deps.py
+#=======================================================================
+# Combinational dependencies between the ports of an elaborated model.
+#
+# The design is flattened into a graph of nets (signals joined by
+# structural connections) with an edge from every signal read to every
+# signal written by each assignment of the @combinational blocks, where
+# the conditions of enclosing if statements (and loops) count as reads.
+# The output ports reached from an input port depend combinationally on
+# that input, and the output ports reached from state (signals written by
+# sequential blocks) can change at a clock edge. Imported Verilog and
+# blackboxed models are opaque, so all of their outputs are assumed to
+# depend on all of their inputs and on state.
+#
+# Signals are found with the same AST visitor used to build the
+# sensitivity lists of the simulator, so the analysis detects the same
+# reads and writes as simulation does. Slices and list indexing refer to
+# the whole signal or list, which errs on the side of more dependencies.
+#
+# Reads hidden behind calls (e.g., s.helper(), getattr) or names which
+# cannot be resolved would silently drop dependencies, so if any block
+# calls something other than the known side-effect free helpers below
+# or uses a name which cannot be resolved, every output port is assumed
+# to depend on every input port and on state.
+
+import re
+import ast
+import collections
+
+from ..ast_helpers             import get_method_ast
+from ..simulation.ast_visitor  import DetectLoadsAndStores
+from ..integration.verilog     import VerilogModel
+from ...model.signals          import Signal, Constant, _SignalSlice
+from ...datatypes.SignalValue  import SignalValue
+
+_name_re = re.compile( r'\[\?\]|\w+' )
+
+# Functions which only compute a value from their arguments
+
+_pure_funcs = set([
+  'range', 'xrange', 'len', 'int', 'bool', 'min', 'max', 'abs',
+  'Bits', 'concat', 'zext', 'sext', 'reduce_and', 'reduce_or',
+  'reduce_xor',
+])
+
+# Types of the attributes of a model which are constant values
+
+_constant_types = ( int, long, bool, float, str, SignalValue )
+
+class _Unresolved( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# get_port_deps
+#-----------------------------------------------------------------------
+# Return ( comb_deps, seq_outports ), where comb_deps maps each output
+# port of the model to the list of input ports it depends on
+# combinationally, and seq_outports is the list of output ports which
+# depend on state. The clock is not considered an input.
+def get_port_deps( model ):
+
+  nets   = {}
+  edges  = []
+  state  = set()
+  opaque = []
+
+  # Union-find of the nets joined by structural connections
+
+  def find( x ):
+    root = nets.setdefault( x, x )
+    if root is not x:
+      root = nets[ x ] = find( root )
+    return root
+
+  def visit( m ):
+
+    for c in m.get_connections():
+      if not isinstance( c.src_node,  Constant ) and \
+         not isinstance( c.dest_node, Constant ):
+        nets[ find( c.src_node ) ] = find( c.dest_node )
+
+    if isinstance( m, VerilogModel ) or getattr( m, 'vblackbox', False ):
+      inports = [ x for x in m.get_inports() if x.name != 'clk' ]
+      for outport in m.get_outports():
+        state.add( outport )
+        edges.extend( [ ( x, outport ) for x in inports ] )
+      return
+
+    for func in m.get_combinational_blocks():
+      block_edges = get_block_edges( m, func )
+      if block_edges is None:
+        opaque.append( func )
+      else:
+        edges.extend( block_edges )
+
+    for func in set( m.get_tick_blocks() + m.get_posedge_clk_blocks() ):
+      loads, stores = get_names( get_method_ast( func )[0] )
+      for name in stores:
+        state.update( resolve_name( m, name ) )
+
+    for subm in m.get_submodules():
+      visit( subm )
+
+  visit( model )
+
+  inports  = [ x for x in model.get_inports() if x.name != 'clk' ]
+  outports = model.get_outports()
+
+  if opaque:
+    comb_deps = collections.OrderedDict( [ ( x, list( inports ) )
+                                           for x in outports ] )
+    return comb_deps, list( outports )
+
+  graph = collections.defaultdict( set )
+  for src, dest in edges:
+    graph[ find( src ) ].add( find( dest ) )
+
+  def reachable( signals ):
+    seen  = set()
+    stack = [ find( x ) for x in signals ]
+    while stack:
+      net = stack.pop()
+      if net not in seen:
+        seen.add( net )
+        stack.extend( graph[ net ] )
+    return seen
+
+  in_nets   = [ ( x, reachable( [ x ] ) ) for x in inports ]
+  seq_nets  = reachable( state )
+
+  comb_deps    = collections.OrderedDict()
+  seq_outports = []
+  for outport in outports:
+    net = find( outport )
+    comb_deps[ outport ] = [ x for x, seen in in_nets if net in seen ]
+    if net in seq_nets:
+      seq_outports.append( outport )
+
+  return comb_deps, seq_outports
+
+#-----------------------------------------------------------------------
+# get_block_edges
+#-----------------------------------------------------------------------
+# Return the ( read, written ) pairs of a combinational block. Every
+# assignment adds an edge from each name it reads, and each name read by
+# the conditions of the enclosing if/while/for statements, to each name
+# it writes. Signals are the nodes of the edges, other names (i.e., local
+# temporaries) are ( func, name ) pairs so that values flowing through
+# temporaries are followed. Returns None if the block calls a function
+# which is not known to be free of side effects, or uses a name of the
+# model which cannot be resolved.
+def get_block_edges( model, func ):
+
+  tree, _ = get_method_ast( func )
+
+  for node in ast.walk( tree ):
+    if isinstance( node, ast.Call ):
+      if not isinstance( node.func, ast.Name ) or \
+         node.func.id not in _pure_funcs:
+        return None
+
+  def nodes( names ):
+    found = []
+    for name in names:
+      signals = resolve_name( model, name, strict=True )
+      if signals:
+        found.extend( signals )
+      elif name.split( '.' )[0] not in ( 's', 'self' ):
+        found.append( ( func, name ) )
+    return found
+
+  edges = []
+
+  def walk( stmts, ctrl ):
+    for stmt in stmts:
+
+      if isinstance( stmt, ( ast.If, ast.While ) ):
+        test = ctrl + nodes( get_names( stmt.test )[0] )
+        walk( stmt.body,   test )
+        walk( stmt.orelse, test )
+
+      elif isinstance( stmt, ast.For ):
+        loop = ctrl + nodes( get_names( stmt.iter )[0] )
+        edges.extend( [ ( x, y ) for x in loop
+                                 for y in nodes( get_names( stmt.target )[1] ) ] )
+        walk( stmt.body,   loop )
+        walk( stmt.orelse, loop )
+
+      elif isinstance( stmt, ( ast.Assign, ast.AugAssign ) ):
+        loads, stores = get_names( stmt )
+        if isinstance( stmt, ast.AugAssign ):
+          loads = loads + stores
+        edges.extend( [ ( x, y ) for x in ctrl + nodes( loads )
+                                 for y in nodes( stores ) ] )
+
+      elif isinstance( stmt, ast.FunctionDef ):
+        walk( stmt.body, ctrl )
+
+  try:
+    walk( tree.body, [] )
+  except _Unresolved:
+    return None
+  return edges
+
+#-----------------------------------------------------------------------
+# get_names
+#-----------------------------------------------------------------------
+# Return the names read and written by an AST node.
+def get_names( node ):
+  visitor        = DetectLoadsAndStores()
+  visitor.assign = True
+  visitor.visit( node )
+  return visitor.load, visitor.store
+
+#-----------------------------------------------------------------------
+# resolve_name
+#-----------------------------------------------------------------------
+# Return the signals referred to by a name found in a concurrent block
+# (e.g., 's.out.value', 's.reqs[?].msg'). The name is followed from the
+# model until it reaches a signal, so attributes of the signal (value,
+# next, BitStruct fields) and slices refer to the signal itself, and
+# indexing a list refers to every element of the list. Names which are
+# not attributes of the model (temporaries, constants) have no signals.
+# With strict, _Unresolved is raised for attributes of the model which
+# do not exist or which are neither signals nor constant values.
+def resolve_name( model, name, strict = False ):
+
+  tokens = _name_re.findall( name )
+  if not tokens or tokens[0] not in ( 's', 'self' ):
+    return []
+
+  def unresolved():
+    if strict:
+      raise _Unresolved( name )
+    return []
+
+  def follow( obj, tokens ):
+
+    if isinstance( obj, Signal ):
+      return [ obj ]
+    if isinstance( obj, _SignalSlice ):
+      return [ obj._signal ]
+    if not tokens:
+      if isinstance( obj, _constant_types ):
+        return []
+      return unresolved()
+
+    if tokens[0] == '[?]':
+      if not isinstance( obj, list ):
+        return unresolved()
+      found = []
+      for x in obj:
+        found.extend( follow( x, tokens[1:] ) )
+      return found
+
+    try:
+      obj = getattr( obj, tokens[0] )
+    except AttributeError:
+      return unresolved()
+    return follow( obj, tokens[1:] )
+
+  return follow( model, tokens[1:] )
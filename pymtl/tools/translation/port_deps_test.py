@@ -0,0 +1,178 @@
+#=======================================================================
+# port_deps_test.py
+#=======================================================================
+
+from pymtl      import *
+from pclib.rtl  import RegEn, Mux
+from pclib.rtl  import SingleElementNormalQueue, SingleElementBypassQueue
+from port_deps  import get_port_deps
+
+def port_deps( model ):
+  model.elaborate()
+  comb_deps, seq_outports = get_port_deps( model )
+  comb_deps = dict( [ ( k.name, sorted( [ x.name for x in v ] ) )
+                      for k, v in comb_deps.items() ] )
+  return comb_deps, sorted( [ x.name for x in seq_outports ] )
+
+#-----------------------------------------------------------------------
+# test_behavioral
+#-----------------------------------------------------------------------
+
+class Behavioral( Model ):
+
+  def __init__( s, nports = 2 ):
+
+    s.a    = InPort ( 8 )
+    s.b    = InPort ( 8 )
+    s.c    = InPort ( 8 )
+    s.sel  = InPort ( 1 )
+    s.ins  = InPort [ nports ]( 8 )
+
+    s.mux  = OutPort( 8 )
+    s.acc  = OutPort( 8 )
+    s.sum  = OutPort( 8 )
+    s.q    = OutPort( 8 )
+    s.k    = OutPort( 8 )
+    s.outs = OutPort[ nports ]( 8 )
+
+    s.state = Wire( 8 )
+
+    s.connect( s.q, s.state )
+    s.connect( s.k, 5 )
+
+    @s.combinational
+    def comb():
+
+      if s.sel: tmp = s.a
+      else:     tmp = s.b
+      s.mux.value = tmp
+
+      s.sum.value = s.state + s.c
+
+      for i in range( nports ):
+        s.outs[i].value = s.ins[i]
+
+    @s.combinational
+    def comb_acc():
+      s.acc.value = s.state
+
+    @s.posedge_clk
+    def seq():
+      if s.reset: s.state.next = 0
+      else:       s.state.next = s.state + s.a
+
+def test_behavioral():
+
+  comb_deps, seq_outports = port_deps( Behavioral() )
+
+  assert comb_deps == {
+    'mux'     : [ 'a', 'b', 'sel' ],
+    'acc'     : [],
+    'sum'     : [ 'c' ],
+    'q'       : [],
+    'k'       : [],
+    'outs[0]' : [ 'ins[0]', 'ins[1]' ],
+    'outs[1]' : [ 'ins[0]', 'ins[1]' ],
+  }
+  assert seq_outports == [ 'acc', 'q', 'sum' ]
+
+#-----------------------------------------------------------------------
+# test_structural
+#-----------------------------------------------------------------------
+
+class Structural( Model ):
+
+  def __init__( s ):
+
+    s.in_ = InPort ( 8 )
+    s.en  = InPort ( 1 )
+    s.sel = InPort ( 1 )
+    s.out = OutPort( 8 )
+    s.reg = OutPort( 8 )
+
+    s.reg_ = RegEn( 8 )
+    s.mux  = Mux( 8, 2 )
+
+    s.connect( s.reg_.in_,   s.in_     )
+    s.connect( s.reg_.en,    s.en      )
+    s.connect( s.mux.in_[0], s.reg_.out )
+    s.connect( s.mux.in_[1], s.in_     )
+    s.connect( s.mux.sel,    s.sel     )
+    s.connect( s.mux.out,    s.out     )
+    s.connect( s.reg_.out,   s.reg     )
+
+def test_structural():
+
+  comb_deps, seq_outports = port_deps( Structural() )
+
+  assert comb_deps == { 'out' : [ 'in_', 'sel' ], 'reg' : [] }
+  assert seq_outports == [ 'out', 'reg' ]
+
+def test_queues():
+
+  comb_deps, seq_outports = port_deps( SingleElementNormalQueue( 8 ) )
+
+  assert all( not x for x in comb_deps.values() )
+  assert seq_outports == [ 'deq.msg', 'deq.val', 'enq.rdy' ]
+
+  comb_deps, seq_outports = port_deps( SingleElementBypassQueue( 8 ) )
+
+  assert 'enq.val' in comb_deps[ 'deq.val' ]
+  assert 'enq.msg' in comb_deps[ 'deq.msg' ]
+  assert 'deq.rdy' not in comb_deps[ 'deq.val' ]
+  assert seq_outports == [ 'deq.msg', 'deq.val', 'enq.rdy', 'full' ]
+
+#-----------------------------------------------------------------------
+# test_opaque
+#-----------------------------------------------------------------------
+# Blocks which call helpers or use names which cannot be resolved make
+# every output depend on every input and on state.
+
+class Opaque( Model ):
+
+  def __init__( s, mode ):
+
+    s.a   = InPort ( 8 )
+    s.b   = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.k   = OutPort( 8 )
+
+    s.connect( s.k, 5 )
+
+    def helper():
+      return s.b
+
+    if mode == 'call':
+      @s.combinational
+      def comb():
+        s.out.value = helper()
+
+    elif mode == 'getattr':
+      @s.combinational
+      def comb():
+        s.out.value = getattr( s, 'b' )
+
+    elif mode == 'unresolved':
+      s.regs = {}
+      @s.combinational
+      def comb():
+        s.out.value = s.regs[ s.a ]
+
+    else:
+      @s.combinational
+      def comb():
+        s.out.value = zext( s.a[0:4], 8 )
+
+def test_opaque():
+
+  for mode in [ 'call', 'getattr', 'unresolved' ]:
+    comb_deps, seq_outports = port_deps( Opaque( mode ) )
+    inputs = [ 'a', 'b', 'reset' ]
+    assert comb_deps == { 'out' : inputs, 'k' : inputs }
+    assert seq_outports == [ 'k', 'out' ]
+
+  # Calls of side-effect free helpers are followed
+
+  comb_deps, seq_outports = port_deps( Opaque( 'zext' ) )
+  assert comb_deps == { 'out' : [ 'a' ], 'k' : [] }
+  assert seq_outports == []
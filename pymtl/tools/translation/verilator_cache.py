@@ -0,0 +1,289 @@
+#=======================================================================
+# verilator_cache.py
+#=======================================================================
+# Content-addressed cache of Verilator builds shared across processes.
+#
+# Each build is stored in its own directory of the cache, named after a
+# hash of everything which affects the build: the generated Verilog, the
+# translation and wrapper options, the Verilator version, and the
+# wrapper templates. Identical designs therefore share a single build
+# whichever directory (or checkout) they are simulated from, and a
+# design is compiled once per cache even when many test processes
+# (e.g., pytest-xdist workers) need it at the same time.
+#
+# Builds are made in a temporary directory of the cache and renamed into
+# place once complete. Concurrent processes are coordinated with flock:
+#
+#  - locks/<key>.lock : held exclusively while checking for and building
+#                       an entry, so each entry is only built once
+#  - cache.lock       : held shared while an entry is being loaded, and
+#                       exclusively when entries are evicted
+#
+# Entries are evicted in least recently used order (the modification
+# time of an entry is updated every time it is used) when the total size
+# of the cache exceeds its limit. The lock files of entries which do not
+# exist (evicted entries, failed builds) are removed at the same time.
+#
+# The cache is disabled by default, it is configured with environment
+# variables:
+#
+#  - PYMTL_CACHE_DIR  : cache directory, e.g., ~/.cache/pymtl (default:
+#                       unset, which disables the cache)
+#  - PYMTL_CACHE_SIZE : size limit in bytes, K/M/G suffixes are accepted
+#                       (default: 4G)
+
+import os
+import time
+import errno
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import contextlib
+
+from subprocess import check_output, STDOUT, CalledProcessError
+
+_default_size = 4 << 30
+
+# Temporary build directories older than this are left over by crashed
+# builds and are removed by evict()
+
+_stale_age = 24*60*60
+
+#-----------------------------------------------------------------------
+# _flock
+#-----------------------------------------------------------------------
+# Lock files can be removed by evict() while other processes wait on
+# them, so the lock is taken again if the file was removed or replaced
+# while waiting.
+@contextlib.contextmanager
+def _flock( filename, operation ):
+  while True:
+    fd = os.open( filename, os.O_RDWR | os.O_CREAT, 0o666 )
+    try:
+      fcntl.flock( fd, operation )
+      try:
+        same = os.fstat( fd ).st_ino == os.stat( filename ).st_ino
+      except OSError:
+        same = False
+    except:
+      os.close( fd )
+      raise
+    if same:
+      break
+    os.close( fd )
+  try:
+    yield
+  finally:
+    os.close( fd )
+
+#-----------------------------------------------------------------------
+# _remove_lock
+#-----------------------------------------------------------------------
+# Remove a lock file unless it is held or waited on by another process.
+def _remove_lock( filename ):
+  try:
+    fd = os.open( filename, os.O_RDWR )
+  except OSError:
+    return
+  try:
+    fcntl.flock( fd, fcntl.LOCK_EX | fcntl.LOCK_NB )
+    os.unlink( filename )
+  except ( IOError, OSError ):
+    pass
+  finally:
+    os.close( fd )
+
+#-----------------------------------------------------------------------
+# _dir_size
+#-----------------------------------------------------------------------
+def _dir_size( path ):
+  size = 0
+  for root, dirs, files in os.walk( path ):
+    for name in files:
+      try:
+        size += os.lstat( os.path.join( root, name ) ).st_size
+      except OSError:
+        pass
+  return size
+
+#-----------------------------------------------------------------------
+# parse_size
+#-----------------------------------------------------------------------
+def parse_size( size ):
+  'Parse a size in bytes with an optional K, M, or G suffix.'
+
+  units = { 'K' : 1 << 10, 'M' : 1 << 20, 'G' : 1 << 30 }
+
+  size = str( size ).strip().upper().rstrip( 'B' )
+  if size and size[-1] in units:
+    return int( float( size[:-1] ) * units[ size[-1] ] )
+  return int( size )
+
+#-----------------------------------------------------------------------
+# get_verilator_version
+#-----------------------------------------------------------------------
+_verilator_version = None
+
+def get_verilator_version():
+  global _verilator_version
+  if _verilator_version is None:
+    try:
+      _verilator_version = check_output( [ 'verilator', '--version' ],
+                                         stderr=STDOUT ).strip()
+    except ( OSError, CalledProcessError ):
+      _verilator_version = 'unknown'
+  return _verilator_version
+
+#-----------------------------------------------------------------------
+# VerilatorCache
+#-----------------------------------------------------------------------
+class VerilatorCache( object ):
+  '''Directory of builds indexed by content hash.
+
+  >>> cache = VerilatorCache( '/tmp/cache' )
+  >>> key   = cache.key( verilog_src, xinit, vcd_en, lint )
+  >>> with cache.entry( key, build ) as path:
+  ...   load( path )
+  '''
+
+  def __init__( self, path, max_size = _default_size ):
+
+    self.path     = os.path.abspath( os.path.expanduser( path ) )
+    self.max_size = max_size
+
+    self._locks   = os.path.join( self.path, 'locks' )
+    self._lock    = os.path.join( self.path, 'cache.lock' )
+
+    try:
+      os.makedirs( self._locks )
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+  #---------------------------------------------------------------------
+  # key
+  #---------------------------------------------------------------------
+  # Hash an arbitrary number of build inputs.
+  def key( self, *parts ):
+    h = hashlib.sha1()
+    for part in parts:
+      part = str( part )
+      h.update( '{}:'.format( len( part ) ) )
+      h.update( part )
+    return h.hexdigest()
+
+  #---------------------------------------------------------------------
+  # entry
+  #---------------------------------------------------------------------
+  # Context manager returning the directory of an entry, which is built
+  # first by calling build( directory ) if the cache does not have it.
+  # The entry cannot be evicted until the context exits.
+  @contextlib.contextmanager
+  def entry( self, key, build ):
+
+    path  = os.path.join( self.path, key )
+    built = False
+
+    while True:
+
+      with _flock( os.path.join( self._locks, key + '.lock' ), fcntl.LOCK_EX ):
+        if not os.path.isdir( path ):
+          self._build( path, build )
+          built = True
+
+      with _flock( self._lock, fcntl.LOCK_SH ):
+
+        # The entry may have been evicted by another process since it was
+        # checked, in which case it is built again
+
+        if not os.path.isdir( path ):
+          continue
+
+        os.utime( path, None )
+        yield path
+        break
+
+    if built:
+      self.evict( keep=key )
+
+  def _build( self, path, build ):
+
+    tmp = tempfile.mkdtemp( prefix='tmp-', dir=self.path )
+    try:
+      build( tmp )
+      os.rename( tmp, path )
+    except:
+      shutil.rmtree( tmp, ignore_errors=True )
+      raise
+
+  #---------------------------------------------------------------------
+  # entries
+  #---------------------------------------------------------------------
+  # Return ( key, last use time, size ) of every entry.
+  def entries( self ):
+
+    entries = []
+    for name in os.listdir( self.path ):
+      path = os.path.join( self.path, name )
+      if name == 'locks' or name.startswith( 'tmp-' ) \
+                         or not os.path.isdir( path ):
+        continue
+      try:
+        entries.append( ( name, os.stat( path ).st_mtime, _dir_size( path ) ) )
+      except OSError:
+        pass
+
+    return entries
+
+  #---------------------------------------------------------------------
+  # evict
+  #---------------------------------------------------------------------
+  # Remove the least recently used entries until the cache fits in its
+  # size limit, the entry named keep is never removed.
+  def evict( self, keep = None ):
+
+    with _flock( self._lock, fcntl.LOCK_EX ):
+
+      now = time.time()
+      for name in os.listdir( self.path ):
+        path = os.path.join( self.path, name )
+        if name.startswith( 'tmp-' ) and \
+           now - os.stat( path ).st_mtime > _stale_age:
+          shutil.rmtree( path, ignore_errors=True )
+
+      entries = sorted( self.entries(), key=lambda x: x[1] )
+      total   = sum( x[2] for x in entries )
+
+      for name, mtime, size in entries:
+        if total <= self.max_size:
+          break
+        if name == keep:
+          continue
+        shutil.rmtree( os.path.join( self.path, name ), ignore_errors=True )
+        total -= size
+
+      for name in os.listdir( self._locks ):
+        if name.endswith( '.lock' ) and \
+           not os.path.isdir( os.path.join( self.path, name[:-5] ) ):
+          _remove_lock( os.path.join( self._locks, name ) )
+
+  #---------------------------------------------------------------------
+  # size
+  #---------------------------------------------------------------------
+  def size( self ):
+    return sum( x[2] for x in self.entries() )
+
+#-----------------------------------------------------------------------
+# get_verilator_cache
+#-----------------------------------------------------------------------
+# Return the cache configured by the environment, or None if caching is
+# disabled (i.e., PYMTL_CACHE_DIR is not set).
+def get_verilator_cache():
+
+  path = os.environ.get( 'PYMTL_CACHE_DIR' )
+  if not path:
+    return None
+
+  size = os.environ.get( 'PYMTL_CACHE_SIZE' )
+  return VerilatorCache( path, parse_size( size ) if size else _default_size )
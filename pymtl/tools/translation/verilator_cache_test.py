@@ -0,0 +1,209 @@
+#=======================================================================
+# verilator_cache_test.py
+#=======================================================================
+
+import os
+import fcntl
+import time
+import pytest
+import multiprocessing
+
+from verilator_cache import VerilatorCache, get_verilator_cache, parse_size
+
+def make_build( tmpdir, size=100 ):
+  log = tmpdir.join( 'builds' )
+  def build( path ):
+    with open( str( log ), 'a' ) as fd:
+      fd.write( path + '\n' )
+    with open( os.path.join( path, 'lib.so' ), 'w' ) as fd:
+      fd.write( 'x' * size )
+  return build, log
+
+def nbuilds( log ):
+  return len( log.readlines() ) if log.check() else 0
+
+#-----------------------------------------------------------------------
+# test_cache_entry
+#-----------------------------------------------------------------------
+
+def test_cache_entry( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ) )
+  build, log = make_build( tmpdir )
+
+  key = cache.key( 'module top; endmodule', 'zeros', False, False )
+  assert key == cache.key( 'module top; endmodule', 'zeros', False, False )
+  assert key != cache.key( 'module top; endmodule', 'ones',  False, False )
+  assert cache.key( 'ab', 'c' ) != cache.key( 'a', 'bc' )
+
+  with cache.entry( key, build ) as path:
+    assert open( os.path.join( path, 'lib.so' ) ).read() == 'x' * 100
+  assert nbuilds( log ) == 1
+
+  # The entry is reused
+
+  with cache.entry( key, build ) as path:
+    assert os.path.basename( path ) == key
+  assert nbuilds( log ) == 1
+
+  assert [ x[0] for x in cache.entries() ] == [ key ]
+  assert cache.size() == 100
+
+def test_cache_build_error( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ) )
+
+  def build( path ):
+    open( os.path.join( path, 'partial' ), 'w' ).close()
+    raise RuntimeError( 'compile error' )
+
+  with pytest.raises( RuntimeError ):
+    with cache.entry( cache.key( 'bad' ), build ):
+      pass
+
+  # Failed builds leave nothing behind
+
+  assert cache.entries() == []
+  assert sorted( os.listdir( cache.path ) ) == [ 'locks' ]
+
+#-----------------------------------------------------------------------
+# test_cache_concurrent
+#-----------------------------------------------------------------------
+
+def use_entry( args ):
+  cache_dir, tmpdir, key = args
+  build, log = make_build( tmpdir )
+  cache = VerilatorCache( cache_dir )
+  def slow_build( path ):
+    time.sleep( 0.1 )
+    build( path )
+  with cache.entry( key, slow_build ) as path:
+    return open( os.path.join( path, 'lib.so' ) ).read()
+
+def test_cache_concurrent( tmpdir ):
+
+  cache_dir = str( tmpdir.join( 'cache' ) )
+  keys      = [ 'design{}'.format( i % 2 ) for i in range( 8 ) ]
+
+  pool = multiprocessing.Pool( 8 )
+  try:
+    results = pool.map( use_entry, [ ( cache_dir, tmpdir, key )
+                                     for key in keys ] )
+  finally:
+    pool.close()
+    pool.join()
+
+  # Each unique design is built once
+
+  assert results == [ 'x' * 100 ] * 8
+  assert nbuilds( tmpdir.join( 'builds' ) ) == 2
+
+#-----------------------------------------------------------------------
+# test_cache_evict
+#-----------------------------------------------------------------------
+
+def test_cache_evict( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ), max_size=250 )
+  build, log = make_build( tmpdir )
+
+  for key in [ 'a', 'b' ]:
+    with cache.entry( key, build ):
+      pass
+
+  # Make 'a' the most recently used entry
+
+  os.utime( os.path.join( cache.path, 'b' ), ( 1000, 1000 ) )
+  with cache.entry( 'a', build ):
+    pass
+
+  with cache.entry( 'c', build ):
+    pass
+
+  assert sorted( x[0] for x in cache.entries() ) == [ 'a', 'c' ]
+  assert cache.size() <= 250
+
+  # The entry just built is kept even if it does not fit
+
+  cache.max_size = 50
+  with cache.entry( 'd', build ):
+    pass
+  assert [ x[0] for x in cache.entries() ] == [ 'd' ]
+
+  # Evicted entries are rebuilt
+
+  with cache.entry( 'a', build ):
+    pass
+  assert nbuilds( log ) == 5
+
+def test_cache_evict_stale( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ) )
+  stale = tmpdir.join( 'cache', 'tmp-crashed' )
+  stale.ensure( dir=True )
+  os.utime( str( stale ), ( 1000, 1000 ) )
+
+  cache.evict()
+  assert not stale.check()
+
+#-----------------------------------------------------------------------
+# test_cache_config
+#-----------------------------------------------------------------------
+
+def test_cache_config( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.setenv( 'PYMTL_CACHE_SIZE', '2M' )
+  cache = get_verilator_cache()
+  assert cache.path == str( tmpdir.join( 'cache' ) )
+  assert cache.max_size == 2 << 20
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', '' )
+  assert get_verilator_cache() is None
+
+def test_parse_size():
+  assert parse_size( '1000' ) == 1000
+  assert parse_size( '4k'   ) == 4096
+  assert parse_size( '1.5G' ) == 3 << 29
+  assert parse_size( '10MB' ) == 10 << 20
+
+def test_cache_disabled_by_default( monkeypatch ):
+  monkeypatch.delenv( 'PYMTL_CACHE_DIR', raising=False )
+  assert get_verilator_cache() is None
+
+#-----------------------------------------------------------------------
+# test_cache_evict_locks
+#-----------------------------------------------------------------------
+# Lock files of evicted entries are removed, unless another process is
+# using them.
+
+def test_cache_evict_locks( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ), max_size=150 )
+  build, log = make_build( tmpdir )
+
+  with cache.entry( 'a', build ):
+    pass
+  os.utime( os.path.join( cache.path, 'a' ), ( 1000, 1000 ) )
+  with cache.entry( 'b', build ):
+    pass
+
+  locks = tmpdir.join( 'cache', 'locks' )
+  assert sorted( x.basename for x in locks.listdir() ) == [ 'b.lock' ]
+
+  # Locks which are held are kept
+
+  fd = os.open( str( locks.join( 'c.lock' ) ), os.O_RDWR | os.O_CREAT )
+  fcntl.flock( fd, fcntl.LOCK_EX )
+  cache.evict()
+  assert locks.join( 'c.lock' ).check()
+  os.close( fd )
+
+  cache.evict()
+  assert not locks.join( 'c.lock' ).check()
+
+  # Entries are still built once after their lock was removed
+
+  with cache.entry( 'a', build ):
+    pass
+  assert nbuilds( log ) == 3
@@ -5,15 +5,25 @@
 from __future__ import print_function
 
 import os
+import re
 import shutil
+import hashlib
+import contextlib
+import multiprocessing
 
 import verilog_structural
 from ...tools.simulation.vcd import get_vcd_timescale
 
-from subprocess          import check_output, STDOUT, CalledProcessError
-from ...model.signals    import InPort, OutPort
-from ...model.PortBundle import PortBundle
-from exceptions          import VerilatorCompileError
+from subprocess           import check_output, STDOUT, CalledProcessError
+from distutils.spawn      import find_executable
+from multiprocessing.pool import ThreadPool
+from ...model.signals     import InPort, OutPort
+from ...model.PortBundle  import PortBundle
+from ...datatypes.Bits    import Bits
+from exceptions           import VerilatorCompileError
+from verilator_cache      import VerilatorCache, get_verilator_cache
+from verilator_cache      import get_verilator_version
+from port_deps            import get_port_deps
 
 #-----------------------------------------------------------------------
 # verilog_to_pymtl
@@ -21,9 +31,12 @@ from exceptions          import VerilatorCompileError
 # Create a PyMTL compatible interface for Verilog HDL.
 
 def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_en, lint, verilator_xinit ):
+                      lib_file, py_wrapper_file, vcd_en, lint, verilator_xinit,
+                      opt_level=None, threads=None, obj_dir=None ):
 
   model_name = model.class_name
+  threads    = get_threads( threads )
+  obj_dir    = obj_dir or 'obj_dir_' + model_name
 
   try:
     vlinetrace = model.vlinetrace
@@ -31,7 +44,7 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
     vlinetrace = False
 
   # Verilate the model  # TODO: clean this up
-  verilate_model( verilog_file, model_name, vcd_en, lint )
+  verilate_model( verilog_file, model_name, vcd_en, lint, threads, obj_dir )
 
   # Add names to ports of module
   for port in model.get_ports():
@@ -43,7 +56,7 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
 
   # Create Shared C Library
   create_shared_lib( model_name, c_wrapper_file, lib_file,
-                     vcd_en, vlinetrace )
+                     vcd_en, vlinetrace, opt_level, threads, obj_dir )
 
   # Create PyMTL wrapper for CFFI interface to Verilated model
   create_verilator_py_wrapper( model, py_wrapper_file, lib_file,
@@ -55,7 +68,8 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
 # Convert Verilog HDL into a C++ simulator using Verilator.
 # http://www.veripool.org/wiki/verilator
 
-def verilate_model( filename, model_name, vcd_en, lint ):
+def verilate_model( filename, model_name, vcd_en, lint, threads=1,
+                    obj_dir=None ):
 
   # verilator commandline template
 
@@ -65,7 +79,7 @@ def verilate_model( filename, model_name, vcd_en, lint ):
   # verilator commandline options
 
   source  = filename
-  obj_dir = 'obj_dir_' + model_name
+  obj_dir = obj_dir or 'obj_dir_' + model_name
   flags   = ' '.join([
               '-Wno-lint' if not lint else '',
               '-Wno-UNOPTFLAT',
@@ -73,6 +87,7 @@ def verilate_model( filename, model_name, vcd_en, lint ):
               '--unroll-stmts 1000000',
               '--assert',
               '--trace' if vcd_en else '',
+              '--threads {}'.format( threads ) if threads > 1 else '',
             ])
 
   # remove the obj_dir because issues with staleness
@@ -161,14 +176,55 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
 
     return code.format( **locals() )
 
+  # Utility functions for copying ports from/to the packed vectors used
+  # by eval_packed and run_cycles, see pack_vectors
+  def port_to_unpack( port, offset ):
+    v_name = port.verilator_name
+    if   port.nbits <= 32:
+      return [ 'model->{} = in[{}];'.format( v_name, offset ) ]
+    elif port.nbits <= 64:
+      return [ 'model->{0} = (vluint64_t) in[{1}] | '
+               '(vluint64_t) in[{2}] << 32;'.format( v_name, offset, offset+1 ) ]
+    return [ 'model->{}[{}] = in[{}];'.format( v_name, i, offset+i )
+             for i in range( port_words( port.nbits ) ) ]
+
+  def port_to_pack( port, offset ):
+    v_name = port.verilator_name
+    if   port.nbits <= 32:
+      return [ 'out[{}] = model->{};'.format( offset, v_name ) ]
+    elif port.nbits <= 64:
+      return [ 'out[{}] = (uint32_t) model->{};'.format( offset, v_name ),
+               'out[{}] = (uint32_t) ( model->{} >> 32 );'.format( offset+1,
+                                                                 v_name ) ]
+    return [ 'out[{}] = model->{}[{}];'.format( offset+i, v_name, i )
+             for i in range( port_words( port.nbits ) ) ]
+
+  def packed_ports( ports, to_code ):
+    code, offset = [], 0
+    for port in ports:
+      code.extend( to_code( port, offset ) )
+      offset += port_words( port.nbits )
+    return code, offset
+
   # Create port declaration, initialization, and extern statements
   indent_zero = '\n'
   indent_two  = '\n  '
   indent_four = '\n    '
   indent_six  = '\n      '
 
-  port_externs = indent_two .join( [ port_to_decl( x ) for x in ports ] )
-  port_decls   = indent_zero.join( [ port_to_decl( x ) for x in ports ] )
+  inports, outports       = get_packed_ports( model )
+  port_unpacks, in_words  = packed_ports( inports,  port_to_unpack )
+  port_packs,   out_words = packed_ports( outports, port_to_pack   )
+
+  # All input and output values are also kept packed in the struct, so
+  # they can be transferred with a single copy (see eval_packed)
+
+  decls = [ port_to_decl( x ) for x in ports ] + [
+            'uint32_t in_buf[{}];' .format( max( 1, in_words  ) ),
+            'uint32_t out_buf[{}];'.format( max( 1, out_words ) ) ]
+
+  port_externs = indent_two .join( decls )
+  port_decls   = indent_zero.join( decls )
   port_inits   = indent_two .join( [ port_to_init( x ) for x in ports ] )
 
   # Convert verilator_xinit to number
@@ -186,6 +242,10 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
                           port_externs  = port_externs,
                           port_decls    = port_decls,
                           port_inits    = port_inits,
+                          port_unpacks  = indent_two .join( port_unpacks ),
+                          port_packs    = indent_two .join( port_packs ),
+                          in_words      = in_words,
+                          out_words     = out_words,
                           # What was this for? -cbatten
                           # vcd_prefix    = vcd_file[:-4],
                           vcd_timescale = get_vcd_timescale( model ),
@@ -253,7 +313,7 @@ def try_cmd( name, cmd ):
   # print( "cmd: ", cmd )
 
   try:
-    result = check_output( cmd.split() , stderr=STDOUT )
+    return check_output( cmd.split() , stderr=STDOUT )
 
   # handle gcc/llvm failure
 
@@ -274,11 +334,12 @@ def try_cmd( name, cmd ):
       error     = e.output
     ))
 
-def compile( flags, include_dirs, output_file, input_files ):
+def compile( flags, include_dirs, output_file, input_files, cxx='g++' ):
 
-  compile_cmd = 'g++ {flags} {idirs} -o {ofile} {ifiles}'
+  compile_cmd = '{cxx} {flags} {idirs} -o {ofile} {ifiles}'
 
   compile_cmd = compile_cmd.format(
+    cxx    = cxx,
     flags  = flags,
     idirs  = ' '.join( [ '-I'+s for s in include_dirs ] ),
     ofile  = output_file,
@@ -310,8 +371,214 @@ def make_lib( output_file, input_files ):
 
   try_cmd( "Make library", ranlib_cmd )
 
+#-----------------------------------------------------------------------
+# Compiler configuration
+#-----------------------------------------------------------------------
+# The C++ compilation of Verilated models is configured with environment
+# variables:
+#
+#  - PYMTL_VERILATOR_OPT  : optimization level of the generated code and
+#                           of the Verilator runtime (default: 0), e.g.,
+#                           0 for short tests and 3 for long simulations;
+#                           the opt_level argument of TranslationTool
+#                           overrides it
+#  - PYMTL_VERILATOR_JOBS : number of files compiled in parallel
+#                           (default: number of CPUs)
+#  - PYMTL_CCACHE         : set to 1 to compile through ccache if it is
+#                           installed
+#  - PYMTL_OBJECT_CACHE   : set to 1 to reuse the object files of
+#                           unchanged generated sources from the
+#                           Verilator build cache (or from a cache in
+#                           the current directory if PYMTL_CACHE_DIR is
+#                           not set), see compile_cached
+#  - CXX                  : C++ compiler (default: g++)
+
+def get_opt_level( opt_level=None ):
+  'Return the optimization flag, e.g., -O3 for opt_level 3.'
+
+  if opt_level is None:
+    opt_level = os.environ.get( 'PYMTL_VERILATOR_OPT', '0' )
+
+  opt_level = str( opt_level )
+  if opt_level.startswith( '-O' ):
+    opt_level = opt_level[2:]
+
+  if opt_level not in ( '0', '1', '2', '3', 's', 'fast', 'g' ):
+    raise VerilatorCompileError(
+      'Invalid optimization level "{}", use 0, 1, 2, 3, s, fast or g!'
+      .format( opt_level ) )
+
+  return '-O' + opt_level
+
+def get_threads( threads=None ):
+  'Return the number of threads of the verilated model.'
+
+  if threads is None:
+    threads = os.environ.get( 'PYMTL_VERILATOR_THREADS', '1' )
+
+  try:
+    nthreads = int( threads )
+  except ValueError:
+    nthreads = 0
+
+  if nthreads < 1:
+    raise VerilatorCompileError(
+      'Invalid number of threads "{}", use 1 or more!'.format( threads ) )
+
+  return nthreads
+
+def get_compile_jobs():
+  jobs = os.environ.get( 'PYMTL_VERILATOR_JOBS' )
+  return max( int( jobs ), 1 ) if jobs else multiprocessing.cpu_count()
+
+def get_cxx():
+  cxx = os.environ.get( 'CXX', 'g++' )
+  if os.environ.get( 'PYMTL_CCACHE', '' ) not in ( '', '0' ) \
+     and find_executable( 'ccache' ):
+    cxx = 'ccache ' + cxx
+  return cxx
+
+def get_object_cache():
+  'Return the cache of object files, or None if it is disabled.'
+
+  if os.environ.get( 'PYMTL_OBJECT_CACHE', '' ) in ( '', '0' ):
+    return None
+
+  cache = get_verilator_cache()
+  if cache is None:
+    cache = VerilatorCache( 'obj_dir_verilator_objects' )
+  return cache
+
+#-----------------------------------------------------------------------
+# get_source_digest
+#-----------------------------------------------------------------------
+# Hash a source file along with the headers it includes with quotes from
+# its own directory (e.g., the headers generated by Verilator next to
+# the sources), following the includes of those headers. Headers from
+# the include directories (the Verilator runtime) are not read, they are
+# identified by the Verilator version instead.
+
+_include_re = re.compile( r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE )
+
+def get_source_digest( input_file ):
+
+  h    = hashlib.sha1()
+  seen = set()
+
+  def visit( path ):
+    path = os.path.normpath( path )
+    if path in seen:
+      return
+    seen.add( path )
+    with open( path ) as fd:
+      source = fd.read()
+    h.update( '{}:{}:'.format( len( source ), os.path.basename( path ) ) )
+    h.update( source )
+    for name in _include_re.findall( source ):
+      header = os.path.join( os.path.dirname( path ), name )
+      if os.path.isfile( header ):
+        visit( header )
+
+  visit( input_file )
+  return h.hexdigest()
+
+#-----------------------------------------------------------------------
+# compile_cached
+#-----------------------------------------------------------------------
+# Compile a source file into an object file through the cache. Objects
+# are looked up by the hash of the source and of the local headers it
+# includes (see get_source_digest), so a small change to the design only
+# recompiles the generated files whose code, or the headers they
+# include, actually changed. The sources are only read, so looking up
+# unchanged objects does not run the compiler.
+
+def compile_cached( cache, flags, include_dirs, output_file, input_file,
+                    cxx='g++' ):
+
+  # The compiler is part of the key, but not ccache
+
+  compiler = cxx.split()[-1]
+  key      = cache.key( 'verilator-object', compiler, flags, include_dirs,
+                        get_verilator_version(),
+                        get_source_digest( input_file ) )
+
+  def build( path ):
+    compile( flags + ' -c', include_dirs, os.path.join( path, 'object.o' ),
+             [ input_file ], cxx )
+
+  with cache.entry( key, build ) as path:
+    shutil.copyfile( os.path.join( path, 'object.o' ), output_file )
+
+#-----------------------------------------------------------------------
+# compile_objects
+#-----------------------------------------------------------------------
+# Compile each source file into an object file of obj_dir, using jobs
+# parallel compiler processes, and return the object files. Objects are
+# reused from cache if one is given (see compile_cached).
+
+def compile_objects( flags, include_dirs, obj_dir, input_files,
+                     cxx='g++', jobs=1, cache=None ):
+
+  objects = [ os.path.join( obj_dir, os.path.splitext(
+                os.path.basename( x ) )[0] + '.o' ) for x in input_files ]
+
+  def compile_object( args ):
+    output_file, input_file = args
+    if cache is not None:
+      compile_cached( cache, flags, include_dirs, output_file, input_file, cxx )
+    else:
+      compile( flags + ' -c', include_dirs, output_file, [ input_file ], cxx )
+
+  pool = ThreadPool( max( min( jobs, len( input_files ) ), 1 ) )
+  try:
+    pool.map( compile_object, zip( objects, input_files ) )
+  finally:
+    pool.close()
+    pool.join()
+
+  return objects
+
+#-----------------------------------------------------------------------
+# verilator_runtime
+#-----------------------------------------------------------------------
+# Context manager returning a static library of the Verilator runtime
+# sources, which is only built once per compiler, flags, and Verilator
+# installation. Libraries are kept in the Verilator build cache (see
+# verilator_cache.py), or in the current directory if it is disabled.
+
+_runtime_sources = [ 'verilated.cpp', 'verilated_dpi.cpp',
+                     'verilated_vcd_c.cpp' ]
+
+_threaded_runtime_sources = _runtime_sources + [ 'verilated_threads.cpp' ]
+
+@contextlib.contextmanager
+def verilator_runtime( verilator_include_dir, include_dirs, flags,
+                       cxx='g++', jobs=1, threaded=False ):
+
+  cache = get_verilator_cache()
+  if cache is None:
+    cache = VerilatorCache( 'obj_dir_verilator_runtime' )
+
+  sources = [ os.path.join( verilator_include_dir, x ) for x in
+              ( _threaded_runtime_sources if threaded else _runtime_sources ) ]
+
+  # The compiler is part of the key, but not ccache
+
+  key = cache.key( 'verilator-runtime', cxx.split()[-1], flags,
+                   verilator_include_dir, get_verilator_version(), threaded )
+
+  def build( path ):
+    objects = compile_objects( flags, include_dirs, path, sources, cxx, jobs )
+    make_lib( os.path.join( path, 'libverilated.a' ), objects )
+    for x in objects:
+      os.remove( x )
+
+  with cache.entry( key, build ) as path:
+    yield os.path.join( path, 'libverilated.a' )
+
 def create_shared_lib( model_name, c_wrapper_file, lib_file,
-                       vcd_en, vlinetrace ):
+                       vcd_en, vlinetrace, opt_level=None, threads=1,
+                       obj_dir=None ):
 
   # We need to find out where the verilator include directories are
   # globally installed. We first check the PYMTL_VERILATOR_INCLUDE_DIR
@@ -378,45 +645,13 @@ Error:
     verilator_include_dir+"/vltstd",
   ]
 
-  # Compile standard Verilator code if libverilator.a does not exist.
-  # Originally, I was also including verilated_dpi.cpp in this library,
-  # but for some reason that screws up line tracing. Somehow there is
-  # some kind of global state or something that is shared across the
-  # shared libraries or something. I was able to fix it by recompiling
-  # verilated_dpi if linetracing is enabled. Actually, the line tracing
-  # doesn't work -- if you use this line tracing approach, so we are back
-  # to always recomping everyting every time for now.
-
-  # if not os.path.exists( "libverilator.a" ):
-  #
-  #   compile(
-  #     flags        = "-O3 -c",
-  #     include_dirs = include_dirs,
-  #     output_file  = "verilator.o",
-  #     input_files  = [ verilator_include_dir+"/verilated.cpp" ]
-  #   )
-  #
-  #   compile(
-  #     flags        = "-O3 -c",
-  #     include_dirs = include_dirs,
-  #     output_file  = "verilator_vcd_c.o",
-  #     input_files  = [ verilator_include_dir+"/verilated_vcd_c.cpp" ]
-  #   )
-  #
-  #   # compile(
-  #   #   flags        = "-O3 -c",
-  #   #   include_dirs = include_dirs,
-  #   #   output_file  = "verilator_dpi.o",
-  #   #   input_files  = [ verilator_include_dir+"/verilated_dpi.cpp" ]
-  #   # )
-  #
-  #   make_lib(
-  #     output_file  = "libverilator.a",
-  #     # input_files  = [ "verilator.o", "verilator_vcd_c.o", "verilator_dpi.o" ]
-  #     input_files  = [ "verilator.o", "verilator_vcd_c.o" ]
-  #    )
-
-  obj_dir_prefix = "obj_dir_{m}/V{m}".format( m=model_name )
+  # The Verilator runtime (verilated.cpp, etc.) used to be compiled with
+  # every model. It is now compiled once into a static library which is
+  # linked into the shared library of each model, so each model still
+  # gets its own copy of the runtime state.
+
+  obj_dir        = obj_dir or "obj_dir_" + model_name
+  obj_dir_prefix = "{d}/V{m}".format( d=obj_dir, m=model_name )
 
   # We need to find a list of all the generated classes. We look in the
   # Verilator makefile for that.
@@ -433,33 +668,56 @@ Error:
           found = False
         else:
           filename = line.strip()[:-2]
-          cpp_file = "obj_dir_{m}/{f}.cpp".format( m=model_name, f=filename )
+          cpp_file = "{d}/{f}.cpp".format( d=obj_dir, f=filename )
           cpp_sources_list.append( cpp_file )
 
   # Compile this module
 
   cpp_sources_list += [
     obj_dir_prefix+"__Syms.cpp",
-    verilator_include_dir+"/verilated.cpp",
-    verilator_include_dir+"/verilated_dpi.cpp",
     c_wrapper_file,
   ]
 
   if vcd_en:
     cpp_sources_list += [
-      verilator_include_dir+"/verilated_vcd_c.cpp",
       obj_dir_prefix+"__Trace.cpp",
       obj_dir_prefix+"__Trace__Slow.cpp",
     ]
 
-  compile(
-    # flags        = "-O1 -fstrict-aliasing -fPIC -shared -L. -lverilator",
-    flags        = "-O0 -fPIC -shared",
+  flags = get_opt_level( opt_level ) + " -fPIC"
+  cxx   = get_cxx()
+  jobs  = get_compile_jobs()
+
+  # Models verilated with --threads run their mtasks on a thread pool of
+  # the threaded Verilator runtime, the model and the runtime have to be
+  # compiled with VL_THREADED
+
+  threaded = threads > 1
+  if threaded:
+    flags += " -DVL_THREADED -pthread"
+
+  objects = compile_objects(
+    flags        = flags,
     include_dirs = include_dirs,
-    output_file  = lib_file,
+    obj_dir      = obj_dir,
     input_files  = cpp_sources_list,
+    cxx          = cxx,
+    jobs         = jobs,
+    cache        = get_object_cache(),
   )
 
+  # Link the objects with the Verilator runtime
+
+  with verilator_runtime( verilator_include_dir, include_dirs, flags,
+                          cxx, jobs, threaded ) as runtime_lib:
+    compile(
+      flags        = "-shared -pthread" if threaded else "-shared",
+      include_dirs = [],
+      output_file  = lib_file,
+      input_files  = objects + [ runtime_lib ],
+      cxx          = cxx,
+    )
+
 #-----------------------------------------------------------------------
 # create_verilator_py_wrapper
 #-----------------------------------------------------------------------
@@ -471,27 +729,35 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
   template_filename = template_dir + os.path.sep + 'verilator_wrapper.templ.py'
 
   port_defs  = []
-  set_inputs = []
-  set_comb   = []
-  set_next   = []
 
   from cpp_helpers import recurse_port_hierarchy
   for x in model.get_ports( preserve_hierarchy=True ):
     recurse_port_hierarchy( x, port_defs )
 
-  for port in model.get_inports():
-    if port.name == 'clk': continue
-    input_ = set_input_stmt( port )
-    set_inputs.extend( input_ )
+  inports, outports = get_packed_ports( model )
+  run_inports  = ', '.join( [ 's.' + x.name for x in inports  ] )
+  run_outports = ', '.join( [ 's.' + x.name for x in outports ] )
+
+  in_format    = get_packed_format( inports  )
+  out_format   = get_packed_format( outports )
+
+  # Outputs which depend combinationally on the inputs (or on nothing,
+  # i.e., constants) are written after the inputs change, and outputs
+  # which depend on state are written at the clock edge
 
-  for port in model.get_outports():
-    comb, next_ = set_output_stmt( port )
-    set_comb.extend( comb  )
-    set_next.extend( next_ )
+  comb_deps, seq_outports = get_port_deps( model )
+  comb_outports = [ x for x in outports if comb_deps[ x ]
+                                        or x not in seq_outports ]
+
+  pack_args    = pack_inputs_args( inports )
+  set_comb     = set_outputs_stmts( outports, 'value', comb_outports )
+  set_next     = set_outputs_stmts( outports, 'next',  seq_outports  )
+  set_all      = set_outputs_stmts( outports, 'value' )
 
   # pretty printing
-  indent_four = '\n    '
-  indent_six  = '\n      '
+  indent_four  = '\n    '
+  indent_six   = '\n      '
+  indent_eight = '\n        '
 
   # create source
   with open( template_filename , 'r' ) as template, \
@@ -499,14 +765,20 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
 
     py_src = template.read()
     py_src = py_src.format(
-        model_name  = model.class_name,
-        port_decls  = cdefs,
-        lib_file    = lib_file,
-        port_defs   = indent_four.join( port_defs ),
-        set_inputs  = indent_six .join( set_inputs ),
-        set_comb    = indent_six .join( set_comb ),
-        set_next    = indent_six .join( set_next ),
-        vlinetrace  = '1' if vlinetrace else '0',
+        model_name   = model.class_name,
+        port_decls   = cdefs,
+        lib_file     = lib_file,
+        port_defs    = indent_four.join( port_defs ),
+        in_format    = in_format,
+        out_format   = out_format,
+        pack_args    = ( ',' + indent_eight ).join( pack_args ),
+        set_comb     = indent_six .join( set_comb ),
+        set_next     = indent_six .join( set_next ),
+        run_inports  = run_inports,
+        run_outports = run_outports,
+        set_all      = indent_four.join( set_all ),
+        init_all     = indent_eight.join( set_all ),
+        vlinetrace   = '1' if vlinetrace else '0',
     )
 
     #py_src += 'XTraceEverOn()' # TODO: add for tracing?
@@ -515,48 +787,146 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
     #print( py_src )
 
 #-----------------------------------------------------------------------
-# get_indices
-#-----------------------------------------------------------------------
-# Utility function for determining assignment of wide ports
-def get_indices( port ):
-  num_assigns = 1 if port.nbits <= 64 else (port.nbits-1)/32 + 1
-  if num_assigns == 1:
-    return [(0, "")]
-  return [ ( i, '[{}:{}]'.format( i*32, min( i*32+32, port.nbits) ) )
-           for i in range(num_assigns) ]
-
-#-----------------------------------------------------------------------
-# set_input_stmt
-#-----------------------------------------------------------------------
-def set_input_stmt( port ):
-  inputs = []
-  for idx, offset in get_indices( port ):
-    inputs.append( 's._m.{v_name}[{idx}] = s.{py_name}{offset}' \
-                    .format( v_name  = port.verilator_name,
-                             py_name = port.name,
-                             idx     = idx,
-                             offset  = offset )
-                   )
-  return inputs
-
-#-----------------------------------------------------------------------
-# set_output_stmt
-#-----------------------------------------------------------------------
-# TODO: no way to distinguish between combinational and sequential
-#       outputs, so we set outputs both ways...
-#       This seems broken, but I can't think of a better way.
-def set_output_stmt( port ):
-  comb, next_ = [], []
-  for idx, offset in get_indices( port ):
-    assign = 's.{py_name}{offset}.{sigtype} = s._m.{v_name}[{idx}]' \
-             .format( v_name  = port.verilator_name,
-                      py_name = port.name,
-                      idx     = idx,
-                      offset  = offset,
-                      sigtype = '{sigtype}' )
-    comb .append( assign.format( sigtype = 'value' ) )
-    next_.append( assign.format( sigtype = 'next'  ) )
-  return comb, next_
+# get_packed_ports
+#-----------------------------------------------------------------------
+# Return the input and output ports in the order they are packed into
+# the vectors used by run_cycles. The clock is driven by run_cycles
+# itself so it is not part of the input vectors.
+def get_packed_ports( model ):
+  inports  = [ x for x in model.get_inports() if x.name != 'clk' ]
+  outports = model.get_outports()
+  return inports, outports
+
+#-----------------------------------------------------------------------
+# port_words
+#-----------------------------------------------------------------------
+# Number of 32-bit words used by a port in a packed vector.
+def port_words( nbits ):
+  return ( nbits - 1 ) / 32 + 1
+
+#-----------------------------------------------------------------------
+# pack_vectors
+#-----------------------------------------------------------------------
+# Pack rows of port values (one row per cycle, one value per port) into
+# a flat list of 32-bit words. Each value starts on a new word and wider
+# values are split into words starting from the least significant bits.
+def pack_vectors( nbits, rows ):
+
+  words = []
+  for row in rows:
+    if len( row ) != len( nbits ):
+      raise ValueError( 'Expected {} values per cycle but got {}!'
+                        .format( len( nbits ), len( row ) ) )
+    for n, value in zip( nbits, row ):
+      value = int( value ) & ( ( 1 << n ) - 1 )
+      for i in range( port_words( n ) ):
+        words.append( int( value & 0xffffffff ) )
+        value >>= 32
+
+  return words
+
+#-----------------------------------------------------------------------
+# unpack_vectors
+#-----------------------------------------------------------------------
+# Inverse of pack_vectors, returns a list of ncycles rows of Bits.
+def unpack_vectors( nbits, words, ncycles ):
+
+  rows = []
+  idx  = 0
+  for cycle in range( ncycles ):
+    row = []
+    for n in nbits:
+      value = 0
+      for i in range( port_words( n ) ):
+        value |= int( words[idx] ) << ( 32*i )
+        idx   += 1
+      row.append( Bits( n, value ) )
+    rows.append( tuple( row ) )
+
+  return rows
+
+#-----------------------------------------------------------------------
+# get_port_fields
+#-----------------------------------------------------------------------
+# Split a port into the fields used to transfer it with the struct
+# module. Ports of up to 32 bits are a single I field, ports of up to 64
+# bits a single Q field, and wider ports are split into Q fields plus a
+# final I field if needed, so each port takes the same words as in
+# pack_vectors. Returns the format character and shift of every field.
+def get_port_fields( nbits ):
+  nwords = port_words( nbits )
+  if nwords == 1:
+    return [ ( 'I', 0 ) ]
+  fields = [ ( 'Q', 64*i ) for i in range( nwords / 2 ) ]
+  if nwords % 2:
+    fields.append( ( 'I', 64*( nwords / 2 ) ) )
+  return fields
+
+#-----------------------------------------------------------------------
+# get_packed_format
+#-----------------------------------------------------------------------
+# Format string of the struct module for a packed vector of ports.
+def get_packed_format( ports ):
+  return '<' + ''.join( [ fmt for x in ports
+                                for fmt, shift in get_port_fields( x.nbits ) ] )
+
+#-----------------------------------------------------------------------
+# pack_inputs_args
+#-----------------------------------------------------------------------
+# Python expressions for the fields of the packed input vector. Ports
+# are read directly (i.e., not through an attribute of the port), and
+# the wrapper assigns the expressions to a temporary, so that the ports
+# are detected in the sensitivity list of the block.
+def pack_inputs_args( ports ):
+  args = []
+  for port in ports:
+    fields = get_port_fields( port.nbits )
+    if len( fields ) == 1:
+      args.append( 'int( s.{} )'.format( port.name ) )
+      continue
+    for fmt, shift in fields:
+      mask = 0xffffffff if fmt == 'I' else 0xffffffffffffffff
+      args.append( 'int( s.{} ) >> {} & {:#x}'.format( port.name, shift, mask )
+                   if shift else
+                   'int( s.{} ) & {:#x}'.format( port.name, mask ) )
+  return args
+
+#-----------------------------------------------------------------------
+# set_outputs_stmts
+#-----------------------------------------------------------------------
+# Python statements unpacking the packed output vector of ports into the
+# given subset of the ports (all of them by default). The fields of each
+# port are compared with the fields last written to the port, so only
+# the ports whose value changed are written.
+#
+# Note that the last written fields are kept in a dict and not a list,
+# since lists read in a combinational block are added to its
+# sensitivity list.
+def set_outputs_stmts( ports, sigtype, written = None ):
+
+  stmts = [ 'out  = s._unpack_outputs( s._out_buf )',
+            'prev = s._outputs' ]
+
+  idx = 0
+  for port in ports:
+    nfields = len( get_port_fields( port.nbits ) )
+    fields  = range( idx, idx + nfields )
+    idx    += nfields
+
+    if written is not None and port not in written:
+      continue
+
+    changed = ' or '.join( [ 'out[{0}] != prev[{0}]'.format( i ) for i in fields ] )
+    update  = ', '.join( [ 'prev[{}]'.format( i ) for i in fields ] ) + ' = ' + \
+              ', '.join( [ 'out[{}]' .format( i ) for i in fields ] )
+    value   = ' | '.join( [ 'out[{}] << {}'.format( i, 64*j ) if j else
+                            'out[{}]'.format( i ) for j, i in enumerate( fields ) ] )
+
+    stmts.extend( [ 'if {}:'.format( changed ),
+                    '  ' + update,
+                    '  s.{}.{} = {}'.format( port.name, sigtype, value ) ] )
+
+  return stmts if len( stmts ) > 2 else [ 'pass' ]
 
 #-----------------------------------------------------------------------
 # verilator_mangle
@@ -0,0 +1,508 @@
+#=======================================================================
+# verilator_cffi_test.py
+#=======================================================================
+# Tests for the C++ compilation helpers, these use a fake Verilator
+# runtime so they only require a C++ compiler.
+
+import os
+import imp
+import cffi
+import struct
+import pytest
+
+from distutils.spawn import find_executable
+
+import verilator_cffi
+
+from exceptions      import VerilatorCompileError
+from verilator_cffi  import get_opt_level, get_compile_jobs, get_cxx
+from verilator_cffi  import get_threads
+from verilator_cffi  import compile, compile_objects, verilator_runtime
+from verilator_cffi  import get_object_cache
+from verilator_cache import VerilatorCache
+from verilator_cffi  import pack_vectors, unpack_vectors, verilator_mangle
+from verilator_cffi  import get_port_fields
+from verilator_cffi  import create_c_wrapper, create_verilator_py_wrapper
+
+from pymtl              import *
+from verilog_structural import mangle_name
+from pclib.test         import run_test_vector_sim
+from pclib.test.test_utils import RunTestVectorSimError
+
+requires_cxx = pytest.mark.skipif( not find_executable( 'g++' ),
+                                   reason='requires g++' )
+
+#-----------------------------------------------------------------------
+# test_config
+#-----------------------------------------------------------------------
+
+def test_opt_level( monkeypatch ):
+
+  monkeypatch.delenv( 'PYMTL_VERILATOR_OPT', raising=False )
+  assert get_opt_level()      == '-O0'
+  assert get_opt_level( 3 )   == '-O3'
+  assert get_opt_level( 's' ) == '-Os'
+
+  monkeypatch.setenv( 'PYMTL_VERILATOR_OPT', '-O2' )
+  assert get_opt_level()      == '-O2'
+  assert get_opt_level( 1 )   == '-O1'
+
+  with pytest.raises( VerilatorCompileError ):
+    get_opt_level( 4 )
+
+def test_threads( monkeypatch ):
+
+  monkeypatch.delenv( 'PYMTL_VERILATOR_THREADS', raising=False )
+  assert get_threads()    == 1
+  assert get_threads( 4 ) == 4
+
+  monkeypatch.setenv( 'PYMTL_VERILATOR_THREADS', '2' )
+  assert get_threads()    == 2
+
+  for threads in [ 0, 'many' ]:
+    with pytest.raises( VerilatorCompileError ):
+      get_threads( threads )
+
+def test_jobs_and_cxx( monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_VERILATOR_JOBS', '3' )
+  assert get_compile_jobs() == 3
+  monkeypatch.delenv( 'PYMTL_VERILATOR_JOBS' )
+  assert get_compile_jobs() >= 1
+
+  monkeypatch.setenv( 'CXX', 'clang++' )
+  monkeypatch.delenv( 'PYMTL_CCACHE', raising=False )
+  assert get_cxx() == 'clang++'
+
+  monkeypatch.setenv( 'PYMTL_CCACHE', '1' )
+  monkeypatch.setattr( verilator_cffi, 'find_executable', lambda x: x )
+  assert get_cxx() == 'ccache clang++'
+  monkeypatch.setattr( verilator_cffi, 'find_executable', lambda x: None )
+  assert get_cxx() == 'clang++'
+
+#-----------------------------------------------------------------------
+# test_runtime
+#-----------------------------------------------------------------------
+
+def make_fake_runtime( tmpdir ):
+  include_dir = tmpdir.mkdir( 'verilator' )
+  for i, name in enumerate( [ 'verilated', 'verilated_dpi',
+                              'verilated_vcd_c', 'verilated_threads' ] ):
+    include_dir.join( name + '.cpp' ).write(
+      'extern "C" int {}_fn() {{ return {}; }}\n'.format( name, i+1 ) )
+  return str( include_dir )
+
+@requires_cxx
+def test_runtime( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  include_dir = make_fake_runtime( tmpdir )
+
+  with verilator_runtime( include_dir, [ include_dir ], '-O1 -fPIC',
+                          jobs=3 ) as lib:
+    assert os.path.basename( lib ) == 'libverilated.a'
+    assert os.listdir( os.path.dirname( lib ) ) == [ 'libverilated.a' ]
+    mtime = os.stat( lib ).st_mtime
+
+  # The library is only built once per flag set
+
+  with verilator_runtime( include_dir, [ include_dir ], '-O1 -fPIC' ) as lib2:
+    assert lib2 == lib
+    assert os.stat( lib2 ).st_mtime == mtime
+
+  with verilator_runtime( include_dir, [ include_dir ], '-O2 -fPIC' ) as lib3:
+    assert lib3 != lib
+
+  # The threaded runtime is a separate library
+
+  with verilator_runtime( include_dir, [ include_dir ], '-O1 -fPIC',
+                          threaded=True ) as lib4:
+    assert lib4 != lib
+    assert os.path.getsize( lib4 ) > os.path.getsize( lib )
+
+#-----------------------------------------------------------------------
+# test_compile_and_link
+#-----------------------------------------------------------------------
+
+@requires_cxx
+def test_compile_and_link( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  include_dir = make_fake_runtime( tmpdir )
+
+  sources = []
+  for i in range( 4 ):
+    src = tmpdir.join( 'model{}.cpp'.format( i ) )
+    src.write( 'extern "C" int verilated_fn();\n'
+               'extern "C" int model{0}_fn() {{ return {0} + verilated_fn(); }}\n'
+               .format( i ) )
+    sources.append( str( src ) )
+
+  obj_dir = tmpdir.mkdir( 'obj_dir' )
+  objects = compile_objects( '-O0 -fPIC', [], str( obj_dir ), sources,
+                             jobs=4 )
+  assert sorted( os.listdir( str( obj_dir ) ) ) == \
+         [ 'model{}.o'.format( i ) for i in range( 4 ) ]
+
+  lib_file = str( tmpdir.join( 'libmodel.so' ) )
+  with verilator_runtime( include_dir, [], '-O0 -fPIC' ) as runtime_lib:
+    compile( '-shared', [], lib_file, objects + [ runtime_lib ] )
+
+  ffi = cffi.FFI()
+  ffi.cdef( 'int model3_fn();' )
+  lib = ffi.dlopen( lib_file )
+  assert lib.model3_fn() == 4
+
+#-----------------------------------------------------------------------
+# test_object_cache
+#-----------------------------------------------------------------------
+
+def test_get_object_cache( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.delenv( 'PYMTL_OBJECT_CACHE', raising=False )
+  assert get_object_cache() is None
+
+  monkeypatch.setenv( 'PYMTL_OBJECT_CACHE', '1' )
+  assert get_object_cache().path == str( tmpdir.join( 'cache' ) )
+
+@requires_cxx
+def test_object_cache( tmpdir ):
+
+  cache = VerilatorCache( str( tmpdir.join( 'cache' ) ) )
+
+  # Sources share a header, like the files generated by Verilator
+
+  src_dir = tmpdir.mkdir( 'src' )
+  src_dir.join( 'model.h' ).write( '#include "base.h"\n' )
+  src_dir.join( 'base.h' ).write( '#define BASE 10\n' )
+
+  def build( name, values ):
+    sources = []
+    for i, value in enumerate( values ):
+      src = src_dir.join( 'model{}.cpp'.format( i ) )
+      src.write( '#include "model.h"\n'
+                 'extern "C" int model{}_fn() {{ return BASE + {}; }}\n'
+                 .format( i, value ) )
+      sources.append( str( src ) )
+
+    obj_dir = tmpdir.mkdir( name )
+    objects = compile_objects( '-O0 -fPIC', [], str( obj_dir ), sources,
+                               jobs=2, cache=cache )
+
+    lib_file = str( obj_dir.join( 'libmodel.so' ) )
+    compile( '-shared', [], lib_file, objects )
+
+    ffi = cffi.FFI()
+    ffi.cdef( ''.join( 'int model{}_fn();'.format( i )
+                       for i in range( len( values ) ) ) )
+    lib = ffi.dlopen( lib_file )
+    return [ getattr( lib, 'model{}_fn'.format( i ) )()
+             for i in range( len( values ) ) ]
+
+  assert build( 'a', [ 1, 2, 3 ] ) == [ 11, 12, 13 ]
+  assert len( cache.entries() ) == 3
+
+  # Objects of unchanged sources are reused, even from another directory
+
+  assert build( 'b', [ 1, 2, 3 ] ) == [ 11, 12, 13 ]
+  assert len( cache.entries() ) == 3
+
+  assert build( 'c', [ 1, 5, 3 ] ) == [ 11, 15, 13 ]
+  assert len( cache.entries() ) == 4
+
+  # Changes to the headers included by the sources are part of the key
+
+  src_dir.join( 'base.h' ).write( '#define BASE 20\n' )
+  assert build( 'd', [ 1, 5, 3 ] ) == [ 21, 25, 23 ]
+  assert len( cache.entries() ) == 7
+
+@requires_cxx
+def test_compile_error( tmpdir ):
+
+  src = tmpdir.join( 'bad.cpp' )
+  src.write( 'this is not C++' )
+  with pytest.raises( Exception ):
+    compile_objects( '-O0', [], str( tmpdir ), [ str( src ) ] )
+
+#-----------------------------------------------------------------------
+# test_pack_vectors
+#-----------------------------------------------------------------------
+
+def test_pack_vectors():
+
+  nbits = [ 1, 32, 40, 70 ]
+  rows  = [ ( 1, 0xdeadbeef, 0x12345678ab, ( 1 << 69 ) | 0x5 ),
+            ( 0, -1,         Bits( 40, 3 ), 0 ) ]
+
+  words = pack_vectors( nbits, rows )
+  assert words == [ 1, 0xdeadbeef, 0x345678ab, 0x12, 0x5, 0, 0x20,
+                    0, 0xffffffff, 3, 0, 0, 0, 0 ]
+
+  unpacked = unpack_vectors( nbits, words, 2 )
+  assert unpacked[0] == rows[0]
+  assert unpacked[1] == ( 0, 0xffffffff, 3, 0 )
+  assert [ x.nbits for x in unpacked[1] ] == nbits
+
+  with pytest.raises( ValueError ):
+    pack_vectors( nbits, [ ( 1, 2 ) ] )
+
+def test_port_fields():
+
+  assert get_port_fields( 1   ) == [ ( 'I', 0 ) ]
+  assert get_port_fields( 32  ) == [ ( 'I', 0 ) ]
+  assert get_port_fields( 33  ) == [ ( 'Q', 0 ) ]
+  assert get_port_fields( 70  ) == [ ( 'Q', 0 ), ( 'I', 64 ) ]
+  assert get_port_fields( 512 ) == [ ( 'Q', 64*i ) for i in range( 8 ) ]
+
+  # Fields take the same words as pack_vectors
+
+  for nbits in [ 1, 32, 33, 64, 65, 70, 96, 128, 512 ]:
+    value = ( ( 1 << nbits ) - 1 ) ^ ( 1 << ( nbits / 2 ) )
+    data  = ''.join( [ struct.pack( '<' + fmt, value >> shift &
+                                    ( 0xffffffff if fmt == 'I' else
+                                      0xffffffffffffffff ) )
+                       for fmt, shift in get_port_fields( nbits ) ] )
+    assert struct.unpack( '<{}I'.format( len( data ) / 4 ), data ) == \
+           tuple( pack_vectors( [ nbits ], [ ( value, ) ] ) )
+
+#-----------------------------------------------------------------------
+# test_run_cycles
+#-----------------------------------------------------------------------
+# Build the C and Python wrappers around a hand-written stand-in for a
+# Verilated model of Accum, so run_cycles can be checked without
+# Verilator.
+
+class Accum( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InPort  ( 8  )
+    s.wide = InPort  ( 70 )
+    s.out  = OutPort ( 40 )
+    s.wout = OutPort ( 70 )
+
+    s.acc  = Wire( 40 )
+
+    @s.tick
+    def seq():
+      if s.reset: s.acc.next = 0
+      else:       s.acc.next = s.acc + s.in_
+
+    @s.combinational
+    def comb():
+      s.out.value  = s.acc + s.in_
+      s.wout.value = s.wide
+
+verilated_h = '''
+#pragma once
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <assert.h>
+typedef uint64_t vluint64_t;
+struct Verilated { static void randReset( int ) {} };
+'''
+
+verilated_accum_h = '''
+#include "verilated.h"
+class VAccum {
+ public:
+  unsigned char clk, reset, in_, prev_clk;
+  vluint64_t    out, acc;
+  uint32_t      wide[3], wout[3];
+  VAccum() : clk(0), reset(0), in_(0), prev_clk(0), out(0), acc(0) {
+    memset( wide, 0, sizeof( wide ) );
+    memset( wout, 0, sizeof( wout ) );
+  }
+  void eval() {
+    if ( clk && !prev_clk )
+      acc = reset ? 0 : ( acc + in_ ) & 0xffffffffffULL;
+    prev_clk = clk;
+    out = ( acc + in_ ) & 0xffffffffffULL;
+    for ( int i = 0; i < 3; i++ )
+      wout[i] = wide[i];
+  }
+  void final() {}
+};
+'''
+
+def make_accum_wrapper( tmpdir ):
+  return make_wrapper( tmpdir, Accum(), verilated_accum_h, 'VAccum' )
+
+def make_wrapper( tmpdir, model, verilated_model_h, class_name ):
+
+  model.elaborate()
+  for port in model.get_ports():
+    port.verilog_name   = mangle_name( port.name )
+    port.verilator_name = verilator_mangle( port.verilog_name )
+
+  include_dir = tmpdir.mkdir( 'include' )
+  include_dir.join( 'verilated.h' ).write( verilated_h )
+  include_dir.join( 'verilated_vcd_c.h' ).write( '' )
+  # Model names include a hash of the parameters
+
+  name = model.class_name
+  tmpdir.mkdir( 'obj_dir_' + name ).join( 'V{}.h'.format( name ) ).write(
+    verilated_model_h.replace( class_name, 'V' + name ) )
+
+  c_wrapper_file  = str( tmpdir.join( name + '_v.cpp' ) )
+  py_wrapper_file = str( tmpdir.join( name + '_v.py' ) )
+  lib_file        = 'lib{}_v.so'.format( name )
+
+  cdefs = create_c_wrapper( model, c_wrapper_file, False, False, 'zeros' )
+  compile( '-O0 -fPIC -shared', [ str( include_dir ), str( tmpdir ) ],
+           str( tmpdir.join( lib_file ) ), [ c_wrapper_file ] )
+  create_verilator_py_wrapper( model, py_wrapper_file, lib_file,
+                               cdefs, False )
+
+  return getattr( imp.load_source( name + '_v', py_wrapper_file ), name )
+
+accum_test_vectors = [
+  'in_  wide                out*         wout*',
+  [ 1,  0,                  1,           0                  ],
+  [ 2,  0x3fffffffffffffff, 3,           0x3fffffffffffffff ],
+  [ 3,  1 << 69,            6,           1 << 69            ],
+  [ 0,  5,                  6,           5                  ],
+  [ 255, 5,                 261,         5                  ],
+]
+
+@requires_cxx
+def test_run_cycles( tmpdir ):
+
+  AccumWrapper = make_accum_wrapper( tmpdir )
+
+  # wout only depends on inputs, so it is not written at the clock edge
+
+  src = tmpdir.join( AccumWrapper.__name__ + '_v.py' ).read()
+  assert 's.out.value'  in src and 's.out.next' in src
+  assert 's.wout.value' in src and 's.wout.next' not in src
+
+  model = AccumWrapper()
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+
+  assert [ x.nbits for x in model.run_inports()  ] == [ 8, 1, 70 ]
+  assert [ x.nbits for x in model.run_outports() ] == [ 40, 70 ]
+
+  outputs = model.run_cycles( [ [ 1, 0, 7 ], [ 2, 0, 8 ], [ 3, 0, 9 ] ] )
+  assert outputs == [ ( 1, 7 ), ( 3, 8 ), ( 6, 9 ) ]
+
+  # Simulation continues from the state left by run_cycles
+
+  sim.eval_combinational()
+  assert model.out == 6 + 3 and model.wout == 9
+  sim.cycle()
+  assert model.out == 9 + 3
+  model.in_.value = 0
+  sim.cycle()
+  assert model.out == 9
+
+#-----------------------------------------------------------------------
+# test_run_test_vector_batch
+#-----------------------------------------------------------------------
+# run_test_vector_sim uses run_cycles by default only if the line trace
+# is off and no VCD is dumped, batch forces either mode.
+
+@requires_cxx
+def test_run_test_vector_batch( tmpdir, monkeypatch ):
+
+  AccumWrapper = make_accum_wrapper( tmpdir )
+
+  # Batched and cycle by cycle simulation agree with the PyMTL model
+
+  for batch in [ True, False ]:
+    run_test_vector_sim( AccumWrapper(), accum_test_vectors, batch=batch )
+  run_test_vector_sim( Accum(), accum_test_vectors )
+
+  # Mismatches are reported with the row number in both modes
+
+  bad_vectors = accum_test_vectors[:4] + [ [ 0, 5, 7, 5 ] ]
+  for batch in [ True, False ]:
+    with pytest.raises( RunTestVectorSimError ) as excinfo:
+      run_test_vector_sim( AccumWrapper(), bad_vectors, batch=batch )
+    assert 'row number     : 4' in str( excinfo.value )
+
+  # The simulator counts the batched cycles
+
+  ncycles  = []
+  sim_skip = SimulationTool.skip_cycles.im_func
+  def skip_cycles( s, n ):
+    ncycles.append( n )
+    return sim_skip( s, n )
+
+  monkeypatch.setattr( SimulationTool, 'line_trace_mode', 'off' )
+  monkeypatch.setattr( SimulationTool, 'skip_cycles', skip_cycles )
+  run_test_vector_sim( AccumWrapper(), accum_test_vectors )
+  assert ncycles == [ len( accum_test_vectors ) - 1 ]
+
+  # run_cycles is not called if the line trace is on, a VCD is dumped
+  # or batch is False
+
+  def run_cycles( s, in_vectors ):
+    raise AssertionError( 'run_cycles called' )
+
+  monkeypatch.setattr( AccumWrapper, 'run_cycles', run_cycles )
+  run_test_vector_sim( AccumWrapper(), accum_test_vectors, batch=False )
+  run_test_vector_sim( AccumWrapper(), accum_test_vectors,
+                       dump_vcd=str( tmpdir.join( 'accum.vcd' ) ) )
+  with pytest.raises( AssertionError ):
+    run_test_vector_sim( AccumWrapper(), accum_test_vectors )
+
+  monkeypatch.setattr( SimulationTool, 'line_trace_mode', 'full' )
+  run_test_vector_sim( AccumWrapper(), accum_test_vectors )
+  with pytest.raises( AssertionError ):
+    run_test_vector_sim( AccumWrapper(), accum_test_vectors, batch=True )
+
+  with pytest.raises( AssertionError ):
+    run_test_vector_sim( Accum(), accum_test_vectors, batch=True )
+
+#-----------------------------------------------------------------------
+# test_initial_outputs
+#-----------------------------------------------------------------------
+# Registered outputs show the initial state of the model before the
+# first clock edge, e.g., when registers are initialized with ones.
+
+class RegOut( Model ):
+
+  def __init__( s ):
+
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+
+    @s.posedge_clk
+    def seq():
+      s.out.next = s.in_
+
+verilated_regout_h = '''
+#include "verilated.h"
+class VRegOut {
+ public:
+  unsigned char clk, reset, in_, out, prev_clk;
+  VRegOut() : clk(0), reset(0), in_(0), out(0xff), prev_clk(0) {}
+  void eval() {
+    if ( clk && !prev_clk )
+      out = in_;
+    prev_clk = clk;
+  }
+  void final() {}
+};
+'''
+
+@requires_cxx
+def test_initial_outputs( tmpdir ):
+
+  RegOutWrapper = make_wrapper( tmpdir, RegOut(), verilated_regout_h,
+                                'VRegOut' )
+
+  model = RegOutWrapper()
+  model.elaborate()
+  sim = SimulationTool( model )
+
+  sim.eval_combinational()
+  assert model.out == 0xff
+
+  model.in_.value = 3
+  sim.cycle()
+  assert model.out == 3
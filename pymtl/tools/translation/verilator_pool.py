@@ -0,0 +1,87 @@
+#=======================================================================
+# verilator_pool.py
+#=======================================================================
+# Many independent instances of a translated model simulated from a
+# thread pool.
+#
+# Regressions often run the same design against many independent
+# stimulus streams. Instead of translating, elaborating and simulating
+# the design once per stream (or per process), the pool creates one
+# instance of the verilated model per stream from the shared library of
+# a single model returned by the TranslationTool. Each stream is
+# simulated in C with run_instance_cycles, which releases the GIL while
+# the cycles run, so the streams are simulated in parallel on all cores.
+#
+# Instances are only driven by one thread at a time, but different
+# instances of the same model run concurrently. Designs which use global
+# Verilator state in their cycles ($display, $finish, DPI) should be
+# translated with threads > 1, which builds them against the thread-safe
+# Verilator runtime.
+
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+#-----------------------------------------------------------------------
+# VerilatorPool
+#-----------------------------------------------------------------------
+class VerilatorPool( object ):
+  '''Independent instances of a translated model driven by threads.
+
+  >>> model   = TranslationTool( MyModel() )
+  >>> pool    = VerilatorPool( model, 8 )
+  >>> outputs = pool.run_cycles( [ in_vectors_0, ..., in_vectors_7 ] )
+  >>> pool.close()
+
+  Every stream of input vectors has one row per cycle, with one value
+  for each port of model.run_inports(), and the rows of output values of
+  each stream are returned in the order of model.run_outports(), the
+  same as model.run_cycles(). Instances keep their state across calls.
+  '''
+
+  def __init__( self, model, ninstances, nthreads = None, reset = True ):
+
+    self.model     = model
+    self.instances = [ model.new_instance() for _ in range( ninstances ) ]
+
+    if nthreads is None:
+      nthreads = multiprocessing.cpu_count()
+    self._pool = ThreadPool( max( min( nthreads, ninstances ), 1 ) )
+
+    if reset:
+      self.reset()
+
+  #---------------------------------------------------------------------
+  # reset
+  #---------------------------------------------------------------------
+  # Reset every instance for two cycles like SimulationTool.reset(),
+  # with all of the other inputs set to zero.
+  def reset( self ):
+    reset = self.model.reset
+    row   = [ 1 if x is reset else 0 for x in self.model.run_inports() ]
+    self.run_cycles( [ [ row, row ] ] * len( self.instances ) )
+
+  #---------------------------------------------------------------------
+  # run_cycles
+  #---------------------------------------------------------------------
+  # Simulate the i-th stream of input vectors on the i-th instance, and
+  # return the list of output vectors of every instance.
+  def run_cycles( self, streams ):
+
+    if len( streams ) != len( self.instances ):
+      raise ValueError( 'Expected {} streams of input vectors, got {}!'
+                        .format( len( self.instances ), len( streams ) ) )
+
+    def run( args ):
+      m, in_vectors = args
+      return self.model.run_instance_cycles( m, in_vectors )
+
+    return self._pool.map( run, zip( self.instances, streams ) )
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  def close( self ):
+    self._pool.close()
+    self._pool.join()
+    self.instances = []
@@ -0,0 +1,47 @@
+#=======================================================================
+# verilator_pool_test.py
+#=======================================================================
+
+import pytest
+
+from verilator_pool      import VerilatorPool
+from verilator_cffi_test import make_accum_wrapper, requires_cxx
+
+#-----------------------------------------------------------------------
+# test_pool
+#-----------------------------------------------------------------------
+# Uses the stand-in for a Verilated Accum model of verilator_cffi_test,
+# with inputs ( in_, reset, wide ) and outputs ( out, wout ).
+
+@requires_cxx
+def test_pool( tmpdir ):
+
+  model = make_accum_wrapper( tmpdir )()
+  pool  = VerilatorPool( model, 4, nthreads=2 )
+
+  try:
+
+    # Each instance accumulates its own stream
+
+    streams = [ [ [ i+1, 0, 100*i + j ] for j in range( 3 ) ]
+                for i in range( 4 ) ]
+    outputs = pool.run_cycles( streams )
+
+    for i, out_vectors in enumerate( outputs ):
+      step = i+1
+      assert out_vectors == [ ( step*(j+1), 100*i + j ) for j in range( 3 ) ]
+
+    # Instances keep their state across calls
+
+    outputs = pool.run_cycles( [ [ [ 0, 0, 0 ] ] ] * 4 )
+    assert [ x[0][0] for x in outputs ] == [ 3*(i+1) for i in range( 4 ) ]
+
+    pool.reset()
+    outputs = pool.run_cycles( [ [ [ 0, 0, 0 ] ] ] * 4 )
+    assert [ x[0][0] for x in outputs ] == [ 0 ] * 4
+
+    with pytest.raises( ValueError ):
+      pool.run_cycles( streams[:2] )
+
+  finally:
+    pool.close()
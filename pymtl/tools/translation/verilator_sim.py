@@ -5,38 +5,93 @@
 from __future__ import print_function
 
 import os
+import imp
 import sys
-import filecmp
+import shutil
+import hashlib
+import collections
+import py_compile
 import verilog
 
-from os.path        import exists
-from verilator_cffi import verilog_to_pymtl
+from StringIO        import StringIO
+from os.path         import exists
+from verilator_cffi  import verilog_to_pymtl, get_opt_level, get_threads
+from verilator_cache import get_verilator_cache, get_verilator_version
+from ...tools.simulation.vcd import get_vcd_timescale
+
+#-----------------------------------------------------------------------
+# _get_build_sources
+#-----------------------------------------------------------------------
+# Return the wrapper templates and the build scripts, which are part of
+# the cache key so that changes to the wrappers or to the compiler flags
+# invalidate cached builds.
+def _get_build_sources():
+  src_dir = os.path.dirname( os.path.abspath( __file__ ) )
+  sources = []
+  for name in [ 'verilator_wrapper.templ.c', 'verilator_wrapper.templ.py',
+                'verilator_cffi.py', 'port_deps.py' ]:
+    with open( os.path.join( src_dir, name ) ) as fd:
+      sources.append( fd.read() )
+  return sources
+
+#-----------------------------------------------------------------------
+# _get_build_stamp
+#-----------------------------------------------------------------------
+# Hash of the Verilog source and of the build settings, which is stored
+# next to builds made without the cache so that changing a setting (e.g.,
+# the optimization level, the number of threads or VCD tracing) triggers
+# a rebuild even if the Verilog did not change.
+def _get_build_stamp( *settings ):
+  h = hashlib.sha1()
+  for setting in settings:
+    setting = str( setting )
+    h.update( '{}:'.format( len( setting ) ) )
+    h.update( setting )
+  return h.hexdigest()
 
 #-----------------------------------------------------------------------
 # TranslationTool
 #-----------------------------------------------------------------------
-def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xinit="zeros" ):
+def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xinit="zeros",
+                     opt_level=None, threads=None ):
   """Translates a PyMTL model into Python-wrapped Verilog.
 
   model_inst:      an un-elaborated Model instance
   lint:            run verilator linter, warnings are fatal
                    (disables -Wno-lint flag)
   enable_blackbox: also generate a .v file with black boxes
+  opt_level:       C++ optimization level of the verilated model
+                   (default: PYMTL_VERILATOR_OPT or 0)
+  threads:         number of threads of the verilated model, see
+                   Verilator --threads (default: PYMTL_VERILATOR_THREADS
+                   or 1)
   """
 
+  # Remember how the model was constructed, so that it can be constructed
+  # again and translated together with its neighbors (see fuse.py)
+
+  translated_from = ( model_inst.__class__,
+                      collections.OrderedDict( model_inst._args ) )
+
   model_inst.elaborate()
 
   # Translate the PyMTL module to Verilog, if we've already done
   # translation check if there's been any changes to the source
   model_name      = model_inst.class_name
   verilog_file    = model_name + '.v'
-  temp_file       = model_name + '.v.tmp'
-  c_wrapper_file  = model_name + '_v.cpp'
-  py_wrapper_file = model_name + '_v.py'
-  lib_file        = 'lib{}_v.so'.format( model_name )
-  obj_dir         = 'obj_dir_' + model_name
   blackbox_file   = model_name + '_blackbox' + '.v'
 
+  # Traced builds use their own wrappers, library and obj_dir (e.g.,
+  # lib<model>_v_trace.so), so the traced and untraced builds of a model
+  # can coexist in the same directory
+
+  def get_files( vcd_en ):
+    suffix = '_trace' if vcd_en else ''
+    return ( '{}_v{}.cpp'  .format( model_name, suffix ),
+             'lib{}_v{}.so'.format( model_name, suffix ),
+             '{}_v{}.py'   .format( model_name, suffix ),
+             'obj_dir_{}{}'.format( model_name, suffix ) )
+
   vcd_en   = True
   vcd_file = ''
   try:
@@ -45,50 +100,160 @@ def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xi
   except AttributeError:
     vcd_en = False
 
-  # Write the output to a temporary file
-  with open( temp_file, 'w+' ) as fd:
-    verilog.translate( model_inst, fd, verilator_xinit=verilator_xinit )
+  # A vcd_file of None means VCD dumping may be turned on later by setting
+  # vcd_file on the returned model before it is elaborated (imported
+  # Verilog models are translated when they are constructed, before the
+  # user can configure them). Such models are built without tracing, and
+  # the traced build is only made and loaded if a VCD file is actually
+  # configured.
+
+  cache    = get_verilator_cache()
+  deferred = vcd_file is None
+  if deferred:
+    vcd_en = False
+
+  # Translate the model in memory, it is only written if it changed
+  o = StringIO()
+  verilog.translate( model_inst, o, verilator_xinit=verilator_xinit )
+  verilog_src = o.getvalue()
 
   # write Verilog with black boxes
   if enable_blackbox:
     with open( blackbox_file, 'w+' ) as fd:
       verilog.translate( model_inst, fd, enable_blackbox=True, verilator_xinit=verilator_xinit )
 
-  # Check if the temporary file matches an existing file (caching)
+  try:
+    vlinetrace = model_inst.vlinetrace
+  except AttributeError:
+    vlinetrace = False
+
+  # Everything other than the Verilog source which affects the build
+
+  def get_settings( vcd_en ):
+    return [ model_name, verilator_xinit, vcd_en, lint, vlinetrace,
+             get_opt_level( opt_level ), get_threads( threads ),
+             get_vcd_timescale( model_inst ), get_verilator_version(),
+             _get_build_sources() ]
+
+  # Use the shared build cache if it is enabled, see verilator_cache.py
+
+  if cache is not None:
+
+    with open( verilog_file, 'w' ) as fd:
+      fd.write( verilog_src )
+
+    def get_key( vcd_en ):
+      return cache.key( verilog_src, *get_settings( vcd_en ) )
+
+    # Build in the temporary directory of the cache entry, only the
+    # wrappers and the shared library are kept. The Verilog source is
+    # written from memory since the traced build may be made much later.
+
+    def get_build( vcd_en ):
+      c_wrapper_file, lib_file, py_wrapper_file, obj_dir = get_files( vcd_en )
+      def build( build_dir ):
+        with open( os.path.join( build_dir, verilog_file ), 'w' ) as fd:
+          fd.write( verilog_src )
+        cwd = os.getcwd()
+        os.chdir( build_dir )
+        try:
+          verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
+                            lib_file, py_wrapper_file, vcd_en, lint,
+                            verilator_xinit, opt_level, threads,
+                            obj_dir=obj_dir )
+          py_compile.compile( py_wrapper_file, doraise=True )
+        finally:
+          os.chdir( cwd )
+        shutil.rmtree( os.path.join( build_dir, obj_dir ) )
+      return build
+
+    # Called by the wrapper on elaboration if a VCD file was configured,
+    # the library is loaded before the entry can be evicted
+
+    def load_traced( ffi ):
+      lib_file = get_files( True )[1]
+      with cache.entry( get_key( True ), get_build( True ) ) as entry:
+        return ffi.dlopen( os.path.join( entry, lib_file ) )
+
+    # The wrapper loads the library when the model is constructed, so
+    # the model is constructed before the entry can be evicted
+
+    py_wrapper_file = get_files( vcd_en )[2]
+    with cache.entry( get_key( vcd_en ), get_build( vcd_en ) ) as entry:
+      imported_module = imp.load_source( py_wrapper_file[:-3],
+                          os.path.join( entry, py_wrapper_file ) )
+      new_inst = imported_module.__dict__[ model_name ]()
+
+  else:
+
+    # Build in the current directory, the model is only verilated again
+    # if the Verilog or the settings differ from those of the existing
+    # build (caching). The Verilog is part of the stamp since the traced
+    # and untraced builds share the same Verilog file.
+
+    def build_local( vcd_en ):
+
+      c_wrapper_file, lib_file, py_wrapper_file, obj_dir = get_files( vcd_en )
+      stamp_file = os.path.join( obj_dir, 'pymtl_build.stamp' )
+
+      stamp  = _get_build_stamp( verilog_src, *get_settings( vcd_en ) )
+      cached = False
+      if (     exists(py_wrapper_file)
+           and exists(lib_file)
+           and exists(stamp_file) ):
+
+        with open( stamp_file ) as fd:
+          cached = fd.read() == stamp
+
+      # Verilate the module only if we've updated the verilog source
+      if not cached:
+        #print( "NOT CACHED", verilog_file )
+        with open( verilog_file, 'w' ) as fd:
+          fd.write( verilog_src )
+        if exists( stamp_file ):
+          os.remove( stamp_file )
+        verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
+                          lib_file, py_wrapper_file, vcd_en, lint,
+                          verilator_xinit, opt_level, threads,
+                          obj_dir=obj_dir )
+        with open( stamp_file, 'w' ) as fd:
+          fd.write( stamp )
+      #else:
+      #  print( "CACHED", verilog_file )
+
+      return lib_file, py_wrapper_file
+
+    # Called by the wrapper on elaboration if a VCD file was configured,
+    # the traced build is made in the directory of the untraced build
 
-  cached = False
-  if (     exists(verilog_file)
-       and exists(py_wrapper_file)
-       and exists(lib_file)
-       and exists(obj_dir) ):
+    build_dir = os.getcwd()
 
-    cached = filecmp.cmp( temp_file, verilog_file )
+    def load_traced( ffi ):
+      cwd = os.getcwd()
+      os.chdir( build_dir )
+      try:
+        lib_file, _ = build_local( True )
+        return ffi.dlopen( os.path.abspath( lib_file ) )
+      finally:
+        os.chdir( cwd )
 
-    # if not cached:
-    #   os.system( ' diff %s %s'%( temp_file, verilog_file ))
+    _, py_wrapper_file = build_local( vcd_en )
 
-  # Rename temp to actual output
-  os.rename( temp_file, verilog_file )
+    # Use some trickery to import the verilated version of the model
+    sys.path.append( os.getcwd() )
+    __import__( py_wrapper_file[:-3] )
+    imported_module = sys.modules[ py_wrapper_file[:-3] ]
 
-  # Verilate the module only if we've updated the verilog source
-  if not cached:
-    #print( "NOT CACHED", verilog_file )
-    verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_en, lint,
-                      verilator_xinit )
-  #else:
-  #  print( "CACHED", verilog_file )
+    # Get the model class from the module, instantiate and elaborate it
+    model_class = imported_module.__dict__[ model_name ]
+    new_inst    = model_class()
 
-  # Use some trickery to import the verilated version of the model
-  sys.path.append( os.getcwd() )
-  __import__( py_wrapper_file[:-3] )
-  imported_module = sys.modules[ py_wrapper_file[:-3] ]
+  new_inst._translated_from = translated_from
 
-  # Get the model class from the module, instantiate and elaborate it
-  model_class = imported_module.__dict__[ model_name ]
-  model_inst  = model_class()
+  if deferred:
+    new_inst._load_traced = load_traced
 
   if vcd_en:
-    model_inst.vcd_file = vcd_file
+    new_inst.vcd_file = vcd_file
 
-  return model_inst
+  return new_inst
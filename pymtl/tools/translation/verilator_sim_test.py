@@ -2,18 +2,14 @@
 # verilator_sim_test.py
 #=======================================================================
 
+import os
+import verilator_sim
+
 from pymtl          import SimulationTool
 from verilator_sim  import TranslationTool
 from pymtl          import requires_verilator
 from pclib.rtl      import Reg
 
-#-----------------------------------------------------------------------
-# Test Config
-#-----------------------------------------------------------------------
-# Skip all tests in module if verilator is not installed
-
-pytestmark = requires_verilator
-
 #-----------------------------------------------------------------------
 # Test Function
 #-----------------------------------------------------------------------
@@ -41,8 +37,175 @@ def reg_test( model ):
 # Run Tests
 #-----------------------------------------------------------------------
 
+@requires_verilator
 def test_reg8():
   reg_test( Reg(8) )
 
+@requires_verilator
 def test_reg16():
   reg_test( Reg(16) )
+
+#-----------------------------------------------------------------------
+# test_rebuild
+#-----------------------------------------------------------------------
+# Without the build cache, the model is built again when the Verilog or
+# any of the build settings change. Verilator is replaced by a stand-in
+# which writes a wrapper with an empty model class.
+
+def test_rebuild( tmpdir, monkeypatch ):
+
+  monkeypatch.chdir( tmpdir )
+  monkeypatch.delenv( 'PYMTL_CACHE_DIR', raising=False )
+  monkeypatch.delenv( 'PYMTL_VERILATOR_OPT', raising=False )
+  monkeypatch.setattr( verilator_sim, 'get_verilator_version', lambda: '4.0' )
+
+  builds = []
+
+  def verilog_to_pymtl( model, verilog_file, c_wrapper_file, lib_file,
+                        py_wrapper_file, vcd_en, lint, verilator_xinit,
+                        opt_level, threads, obj_dir ):
+    builds.append( ( opt_level, threads, vcd_en ) )
+    if not os.path.exists( obj_dir ):
+      os.mkdir( obj_dir )
+    open( lib_file, 'w' ).close()
+    with open( py_wrapper_file, 'w' ) as fd:
+      fd.write( 'class {}( object ): pass\n'.format( model.class_name ) )
+
+  monkeypatch.setattr( verilator_sim, 'verilog_to_pymtl', verilog_to_pymtl )
+
+  def translate( nbits = 8, **kwargs ):
+    model = Reg( nbits )
+    model.vcd_file = kwargs.pop( 'vcd_file', '' )
+    TranslationTool( model, **kwargs )
+    return model.class_name
+
+  name = translate()
+  translate()
+  assert builds == [ ( None, None, False ) ]
+
+  # The model is verilated again if the Verilog changes
+
+  translate_verilog = verilator_sim.verilog.translate
+
+  def edited( model, o, **kwargs ):
+    translate_verilog( model, o, **kwargs )
+    o.write( '// edited\n' )
+
+  monkeypatch.setattr( verilator_sim.verilog, 'translate', edited )
+  translate()
+  assert len( builds ) == 2
+  assert tmpdir.join( name + '.v' ).read().endswith( '// edited\n' )
+  monkeypatch.setattr( verilator_sim.verilog, 'translate', translate_verilog )
+  del builds[1:]
+
+  translate( opt_level = 3 )
+  translate( opt_level = 3 )
+  assert builds[1:] == [ ( 3, None, False ) ]
+
+  monkeypatch.setenv( 'PYMTL_VERILATOR_OPT', '3' )
+  translate()
+  assert builds[2:] == []
+
+  translate( threads = 2 )
+  translate( vcd_file = 'reg.vcd' )
+  translate( 16 )
+  assert builds[2:] == [ ( None, 2, False ), ( None, None, True ),
+                         ( None, None, False ) ]
+  del builds[2:]
+
+  # The traced build has its own files, so switching between traced and
+  # untraced builds does not rebuild either of them
+
+  translate( 16, vcd_file = 'reg.vcd' )
+  translate( 16 )
+  translate( 16, vcd_file = 'reg.vcd' )
+  assert builds[2:] == [ ( None, None, True ) ]
+  assert tmpdir.join( 'lib{}_v_trace.so'.format( name ) ).check()
+
+#-----------------------------------------------------------------------
+# test_deferred_trace
+#-----------------------------------------------------------------------
+# Models translated with a vcd_file of None (e.g., imported Verilog) are
+# built without tracing, the traced build is only made when the wrapper
+# asks for it because a VCD file was configured.
+
+def test_deferred_trace( tmpdir, monkeypatch ):
+
+  monkeypatch.chdir( tmpdir )
+  monkeypatch.delenv( 'PYMTL_CACHE_DIR', raising=False )
+  monkeypatch.setattr( verilator_sim, 'get_verilator_version', lambda: '4.0' )
+
+  builds = []
+
+  def verilog_to_pymtl( model, verilog_file, c_wrapper_file, lib_file,
+                        py_wrapper_file, vcd_en, lint, verilator_xinit,
+                        opt_level, threads, obj_dir ):
+    builds.append( ( lib_file, vcd_en ) )
+    if not os.path.exists( obj_dir ):
+      os.mkdir( obj_dir )
+    open( lib_file, 'w' ).close()
+    with open( py_wrapper_file, 'w' ) as fd:
+      fd.write( 'class {}( object ): pass\n'.format( model.class_name ) )
+
+  monkeypatch.setattr( verilator_sim, 'verilog_to_pymtl', verilog_to_pymtl )
+
+  class FFI( object ):
+    def dlopen( self, path ):
+      return path
+
+  model = Reg( 8 )
+  model.vcd_file = None
+  vmodel = TranslationTool( model )
+  name   = model.class_name
+  assert builds == [ ( 'lib{}_v.so'.format( name ), False ) ]
+
+  # The traced build is made on demand, from any working directory
+
+  monkeypatch.chdir( tmpdir.mkdir( 'elsewhere' ) )
+  lib = tmpdir.join( 'lib{}_v_trace.so'.format( name ) )
+  assert vmodel._load_traced( FFI() ) == str( lib )
+  assert vmodel._load_traced( FFI() ) == str( lib )
+  assert builds[1:] == [ ( lib.basename, True ) ]
+
+#-----------------------------------------------------------------------
+# test_cached_construct
+#-----------------------------------------------------------------------
+# With the build cache, the model (which loads the library) is
+# constructed while the cache entry is still protected from eviction.
+
+def test_cached_construct( tmpdir, monkeypatch ):
+
+  cache_dir = tmpdir.join( 'cache' )
+
+  monkeypatch.chdir( tmpdir )
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( cache_dir ) )
+  monkeypatch.setattr( verilator_sim, 'get_verilator_version', lambda: '4.0' )
+
+  # The stand-in model checks whether the cache is locked for eviction
+
+  wrapper = '''
+import fcntl
+class {name}( object ):
+  def __init__( s ):
+    with open( {lock!r} ) as fd:
+      try:
+        fcntl.flock( fd, fcntl.LOCK_EX | fcntl.LOCK_NB )
+        s.evictable = True
+      except IOError:
+        s.evictable = False
+'''
+
+  def verilog_to_pymtl( model, verilog_file, c_wrapper_file, lib_file,
+                        py_wrapper_file, vcd_en, lint, verilator_xinit,
+                        opt_level, threads, obj_dir ):
+    os.mkdir( obj_dir )
+    open( lib_file, 'w' ).close()
+    with open( py_wrapper_file, 'w' ) as fd:
+      fd.write( wrapper.format( name = model.class_name,
+                                lock = str( cache_dir.join( 'cache.lock' ) ) ) )
+
+  monkeypatch.setattr( verilator_sim, 'verilog_to_pymtl', verilog_to_pymtl )
+
+  model = Reg( 8 )
+  model.vcd_file = ''
+  assert not TranslationTool( model ).evictable
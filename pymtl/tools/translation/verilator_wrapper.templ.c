@@ -17,6 +17,11 @@
 // set to true when Verilog module has line tracing
 #define VLINETRACE {vlinetrace}
 
+// number of 32-bit words in the packed input and output vectors of a
+// single cycle, see pack_outputs()
+#define IN_WORDS  {in_words}
+#define OUT_WORDS {out_words}
+
 #if VLINETRACE
 #include "obj_dir_{model_name}/V{model_name}__Syms.h"
 #include "svdpi.h"
@@ -52,6 +57,10 @@ extern "C" {{
   V{model_name}_t * create_model( const char * );
   void destroy_model( V{model_name}_t *);
   void eval( V{model_name}_t * );
+  void eval_packed( V{model_name}_t * );
+  void tick_packed( V{model_name}_t * );
+  void run_cycles( V{model_name}_t *, unsigned int,
+                   const uint32_t *, uint32_t * );
 
   #if VLINETRACE
   void trace( V{model_name}_t *, char * );
@@ -174,6 +183,92 @@ void eval( V{model_name}_t * m ) {{
 
 }}
 
+//----------------------------------------------------------------------
+// unpack_inputs(), pack_outputs()
+//----------------------------------------------------------------------
+// Copy the input ports from a packed vector of IN_WORDS words and the
+// output ports to a packed vector of OUT_WORDS words. Ports are packed
+// in declaration order (clk excluded) into little-endian 32-bit words,
+// with every port starting on a new word.
+
+static inline void unpack_inputs( V{model_name} * model, const uint32_t * in ) {{
+  {port_unpacks}
+}}
+
+static inline void pack_outputs( V{model_name} * model, uint32_t * out ) {{
+  {port_packs}
+}}
+
+//----------------------------------------------------------------------
+// eval_packed()
+//----------------------------------------------------------------------
+// Set the inputs from m->in_buf, evaluate the combinational logic, and
+// copy the outputs to m->out_buf.
+
+void eval_packed( V{model_name}_t * m ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  unpack_inputs( model, m->in_buf );
+  eval( m );
+  pack_outputs( model, m->out_buf );
+
+}}
+
+//----------------------------------------------------------------------
+// tick_packed()
+//----------------------------------------------------------------------
+// Toggle the clock and copy the outputs to m->out_buf.
+
+void tick_packed( V{model_name}_t * m ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  model->clk = 0;
+  eval( m );
+  model->clk = 1;
+  eval( m );
+  pack_outputs( model, m->out_buf );
+
+}}
+
+//----------------------------------------------------------------------
+// run_cycles()
+//----------------------------------------------------------------------
+// Simulate n cycles without returning to Python. For every cycle the
+// input ports are set from the next IN_WORDS words of in_buf, the
+// combinational logic is evaluated, the output ports are written to the
+// next OUT_WORDS words of out_buf, and then the clock is toggled. This
+// is the same sequence as setting the inputs, calling
+// eval_combinational(), checking the outputs, and calling cycle() from
+// Python. The outputs at the end are left in m->out_buf.
+
+void run_cycles( V{model_name}_t * m, unsigned int n,
+                 const uint32_t * in_buf, uint32_t * out_buf ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  for ( unsigned int i = 0; i < n; i++ ) {{
+
+    // set inputs and evaluate combinational logic
+    unpack_inputs( model, in_buf + i*IN_WORDS );
+    eval( m );
+
+    // sample outputs
+    pack_outputs( model, out_buf + i*OUT_WORDS );
+
+    // tick
+    model->clk = 0;
+    eval( m );
+    model->clk = 1;
+    eval( m );
+
+  }}
+
+  pack_outputs( model, m->out_buf );
+
+}}
+
 //----------------------------------------------------------------------
 // trace()
 //----------------------------------------------------------------------
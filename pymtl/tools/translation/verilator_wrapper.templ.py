@@ -5,16 +5,24 @@
 # were a normal PyMTL model.
 
 import os
+import struct
 
 from pymtl import *
 from cffi  import FFI
 
+from pymtl.tools.translation.verilator_cffi import port_words
+from pymtl.tools.translation.verilator_cffi import pack_vectors, unpack_vectors
+
 #-----------------------------------------------------------------------
 # {model_name}
 #-----------------------------------------------------------------------
 class {model_name}( Model ):
   id_ = 0
 
+  # Set by the TranslationTool when the library was built without
+  # tracing, loads the traced build of the model if a VCD file is set
+  _load_traced = None
+
   def __init__( s ):
 
     # initialize FFI, define the exposed interface
@@ -36,15 +44,23 @@ class {model_name}( Model ):
       V{model_name}_t * create_model( const char * );
       void destroy_model( V{model_name}_t *);
       void eval( V{model_name}_t * );
+      void eval_packed( V{model_name}_t * );
+      void tick_packed( V{model_name}_t * );
+      void run_cycles( V{model_name}_t *, unsigned int,
+                       const uint32_t *, uint32_t * );
       void trace( V{model_name}_t *, char * );
 
     ''')
 
     # Import the shared library containing the model. We defer
     # construction to the elaborate_logic function to allow the user to
-    # set the vcd_file.
+    # set the vcd_file. CFFI releases the GIL for the duration of every
+    # call into the library, so other Python threads keep running while
+    # the model is evaluated (a model must still only be driven by one
+    # thread at a time).
 
-    s._ffi = s.ffi.dlopen('./{lib_file}')
+    s._ffi = s.ffi.dlopen( os.path.join( os.path.dirname(
+               os.path.abspath( __file__ ) ), '{lib_file}' ) )
 
     # dummy class to emulate PortBundles
     class BundleProxy( PortBundle ):
@@ -64,7 +80,8 @@ class {model_name}( Model ):
     s._convert_string = s.ffi.string
 
   def __del__( s ):
-    s._ffi.destroy_model( s._m )
+    if hasattr( s, '_m' ):
+      s._ffi.destroy_model( s._m )
 
   def elaborate_logic( s ):
 
@@ -93,35 +110,127 @@ class {model_name}( Model ):
       filen, ext         = os.path.splitext( s.vcd_file )
       verilator_vcd_file = '{{}}.verilator1{{}}'.format(filen, ext)
 
+    # Switch to the traced build of the model if it is needed
+
+    if s.vcd_file and s._load_traced:
+      s._ffi = s._load_traced( s.ffi )
+
     # Construct the model.
 
     s._m = s._ffi.create_model( s.ffi.new("char[]", verilator_vcd_file) )
 
+    # All of the inputs and outputs are transferred through packed
+    # vectors in the model struct, with one struct module call each way.
+    # We keep the last fields written to each output port so only the
+    # output ports which changed are written.
+
+    in_struct  = struct.Struct( '{in_format}' )
+    out_struct = struct.Struct( '{out_format}' )
+
+    s._in_buf         = s.ffi.buffer( s._m.in_buf  )
+    s._out_buf        = s.ffi.buffer( s._m.out_buf )
+    s._pack_inputs    = in_struct.pack_into
+    s._unpack_outputs = out_struct.unpack_from
+    s._outputs        = dict( enumerate(
+                          out_struct.unpack( '\0' * out_struct.size ) ) )
+
+    # The ports are created by the simulator with zero values, so the
+    # first evaluation writes all of the outputs to show the initial
+    # state of the model (e.g., registers initialized by verilator_xinit)
+    # before the first clock edge.
+
+    s._init_outputs   = True
+
     @s.combinational
     def logic():
 
       # set inputs
-      {set_inputs}
+      inputs = (
+        {pack_args},
+      )
+      s._pack_inputs( s._in_buf, 0, *inputs )
 
       # execute combinational logic
-      s._ffi.eval( s._m )
+      s._ffi.eval_packed( s._m )
+
+      if s._init_outputs:
+        s._init_outputs = False
+        {init_all}
 
-      # set outputs
-      # FIXME: currently write all outputs, not just combinational outs
+      # set outputs which depend combinationally on the inputs
       {set_comb}
 
     @s.posedge_clk
     def tick():
 
-      s._m.clk[0] = 0
-      s._ffi.eval( s._m )
-      s._m.clk[0] = 1
-      s._ffi.eval( s._m )
+      s._ffi.tick_packed( s._m )
 
-      # double buffer register outputs
-      # FIXME: currently write all outputs, not just registered outs
+      # double buffer outputs which depend on state
       {set_next}
 
+  #---------------------------------------------------------------------
+  # run_cycles
+  #---------------------------------------------------------------------
+  # Simulate one cycle per row of in_vectors entirely in C. Each row has
+  # one value for every port in run_inports(), and a row of output
+  # values sampled before the clock edge is returned for every cycle in
+  # the order of run_outports(). The ports are updated with the state of
+  # the model at the end so simulation can continue as usual, but the
+  # cycles are not seen by the simulator, which has to be told about
+  # them with SimulationTool.skip_cycles(). The GIL is released while
+  # the cycles are simulated, so run_cycles can be called from a worker
+  # thread to overlap the model with stimulus generation or checking.
+
+  def run_inports( s ):
+    return [ {run_inports} ]
+
+  def run_outports( s ):
+    return [ {run_outports} ]
+
+  def run_cycles( s, in_vectors ):
+
+    if not in_vectors:
+      return []
+
+    out_vectors = s.run_instance_cycles( s._m, in_vectors )
+
+    # bring the ports up to date with the model
+    for port, value in zip( s.run_inports(), in_vectors[-1] ):
+      port.value = value
+    {set_all}
+
+    return out_vectors
+
+  #---------------------------------------------------------------------
+  # new_instance, run_instance_cycles
+  #---------------------------------------------------------------------
+  # Create another instance of the verilated model in the same library,
+  # which has no ports and is not seen by the simulator, and simulate
+  # cycles on an instance like run_cycles does. Different instances can
+  # be simulated from different threads at the same time, see
+  # verilator_pool.py. Instances are destroyed when garbage collected.
+
+  def new_instance( s ):
+    m = s._ffi.create_model( s.ffi.new( "char[]", "" ) )
+    return s.ffi.gc( m, s._ffi.destroy_model )
+
+  def run_instance_cycles( s, m, in_vectors ):
+
+    if not in_vectors:
+      return []
+
+    in_nbits  = [ x.nbits for x in s.run_inports()  ]
+    out_nbits = [ x.nbits for x in s.run_outports() ]
+    ncycles   = len( in_vectors )
+
+    in_buf  = s.ffi.new( 'uint32_t[]', pack_vectors( in_nbits, in_vectors ) )
+    out_buf = s.ffi.new( 'uint32_t[]',
+                         max( 1, ncycles * sum( map( port_words, out_nbits ) ) ) )
+
+    s._ffi.run_cycles( m, ncycles, in_buf, out_buf )
+
+    return unpack_vectors( out_nbits, out_buf, ncycles )
+
   def line_trace( s ):
     if {vlinetrace}:
       s._ffi.trace( s._m, s._line_trace_str )
@@ -5,10 +5,14 @@
 
 from __future__ import print_function
 
+import os
 import sys
+import json
+import hashlib
 import collections
 import tempfile
 
+from StringIO           import StringIO
 from subprocess         import check_output, STDOUT, CalledProcessError
 from verilog_structural import *
 from verilog_behavioral import translate_logic_blocks
@@ -22,6 +26,19 @@ from ..integration      import verilog
 # Generates Verilog source from a PyMTL model.
 def translate( model, o=sys.stdout, enable_blackbox=False, verilator_xinit='zeros' ):
 
+  for source in translate_modules( model, enable_blackbox, verilator_xinit ).values():
+    o.write( source )
+
+#-----------------------------------------------------------------------
+# translate_modules
+#-----------------------------------------------------------------------
+# Generates the Verilog source of each unique module of a PyMTL model.
+# Returns an ordered dictionary from file names to sources: every module
+# is in <class_name>.v, and the sources of imported Verilog models are in
+# <top class_name>__imported.v. The sources concatenated in order are the
+# output of translate().
+def translate_modules( model, enable_blackbox=False, verilator_xinit='zeros' ):
+
   # List of models to translate
   translation_queue = collections.OrderedDict()
 
@@ -38,16 +55,60 @@ def translate( model, o=sys.stdout, enable_blackbox=False, verilator_xinit='zero
 
   # Collect all submodels in design and translate them
   collect_all_models( model )
+  sources = collections.OrderedDict()
   for k, v in translation_queue.items():
+    o = StringIO()
     if isinstance( v, verilog.VerilogModel ):
       x = verilog.import_module( v, o )
       if x not in append_queue:
         append_queue.append( x )
     else:
       translate_module( v, o, enable_blackbox, verilator_xinit )
+    sources[ k + '.v' ] = o.getvalue()
 
   # Append source code for imported modules and dependecies
-  verilog.import_sources( append_queue, o )
+  if append_queue:
+    o = StringIO()
+    verilog.import_sources( append_queue, o )
+    sources[ model.class_name + '__imported.v' ] = o.getvalue()
+
+  return sources
+
+#-----------------------------------------------------------------------
+# write_modules
+#-----------------------------------------------------------------------
+# Writes the Verilog source of each module of a PyMTL model to its own
+# file in directory (see translate_modules), along with a manifest,
+# <class_name>.manifest.json, listing the files in order with the SHA-1
+# of their contents. Only the files whose contents differ from the
+# previous manifest are written, and their names are returned, so builds
+# can tell which modules changed since the last translation.
+def write_modules( model, directory, enable_blackbox=False, verilator_xinit='zeros' ):
+
+  sources  = translate_modules( model, enable_blackbox, verilator_xinit )
+  manifest = os.path.join( directory, model.class_name + '.manifest.json' )
+
+  try:
+    with open( manifest ) as fd:
+      previous = dict( json.load( fd )[ 'files' ] )
+  except ( IOError, ValueError, KeyError, TypeError ):
+    previous = {}
+
+  files   = []
+  changed = []
+  for name, source in sources.items():
+    sha1 = hashlib.sha1( source ).hexdigest()
+    path = os.path.join( directory, name )
+    if previous.get( name ) != sha1 or not os.path.exists( path ):
+      with open( path, 'w' ) as fd:
+        fd.write( source )
+      changed.append( name )
+    files.append( [ name, sha1 ] )
+
+  with open( manifest, 'w' ) as fd:
+    json.dump( { 'top' : model.class_name, 'files' : files }, fd, indent=2 )
+
+  return changed
 
 #-----------------------------------------------------------------------
 # translate_module
@@ -0,0 +1,100 @@
+#=======================================================================
+# verilog_test.py
+#=======================================================================
+
+import json
+
+from StringIO  import StringIO
+from pymtl     import *
+from pclib.rtl import Reg, Mux
+
+from verilog   import translate, translate_modules, write_modules
+
+#-----------------------------------------------------------------------
+# RegMux
+#-----------------------------------------------------------------------
+
+class RegMux( Model ):
+
+  def __init__( s, nbits = 8, swap = False ):
+
+    s.explicit_modulename = 'RegMux'
+
+    s.in_ = InPort ( nbits )
+    s.sel = InPort ( 1 )
+    s.out = OutPort( nbits )
+
+    s.regs = [ Reg( nbits ) for _ in range( 2 ) ]
+    s.mux  = Mux( nbits, 2 )
+
+    s.connect( s.regs[0].in_,       s.in_         )
+    s.connect( s.regs[1].in_,       s.regs[0].out )
+    s.connect( s.mux.in_[swap],     s.regs[0].out )
+    s.connect( s.mux.in_[not swap], s.regs[1].out )
+    s.connect( s.mux.sel,           s.sel         )
+    s.connect( s.mux.out,           s.out         )
+
+def make_model( nbits = 8, swap = False ):
+  model = RegMux( nbits, swap )
+  model.elaborate()
+  return model
+
+#-----------------------------------------------------------------------
+# test_translate_modules
+#-----------------------------------------------------------------------
+
+def test_translate_modules():
+
+  model   = make_model()
+  sources = translate_modules( model )
+
+  # One source per unique module, in the order of translate()
+
+  assert sources.keys() == [ 'RegMux.v',
+                             model.mux.class_name + '.v',
+                             model.regs[0].class_name + '.v' ]
+
+  for name, source in sources.items():
+    assert 'module {}'.format( name[:-2] ) in source
+
+  o = StringIO()
+  translate( model, o )
+  assert o.getvalue() == ''.join( sources.values() )
+
+#-----------------------------------------------------------------------
+# test_write_modules
+#-----------------------------------------------------------------------
+
+def test_write_modules( tmpdir ):
+
+  model    = make_model()
+  sources  = translate_modules( model )
+  manifest = tmpdir.join( model.class_name + '.manifest.json' )
+
+  assert write_modules( model, str( tmpdir ) ) == sources.keys()
+
+  for name, source in sources.items():
+    assert tmpdir.join( name ).read() == source
+
+  files = json.loads( manifest.read() )[ 'files' ]
+  assert [ name for name, sha1 in files ] == sources.keys()
+
+  # Nothing is written again if the design did not change
+
+  assert write_modules( make_model(), str( tmpdir ) ) == []
+
+  # Only the modules which changed are written
+
+  model = make_model( swap = True )
+  assert write_modules( model, str( tmpdir ) ) == [ 'RegMux.v' ]
+
+  # Other parameters give other submodules, which are instantiated by
+  # the top module with another name
+
+  model = make_model( 16 )
+  assert write_modules( model, str( tmpdir ) ) == \
+         translate_modules( model ).keys()
+
+  tmpdir.join( model.mux.class_name + '.v' ).remove()
+  assert write_modules( model, str( tmpdir ) ) == \
+         [ model.mux.class_name + '.v' ]
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_verilator_threads.py
+#========================================================================
+# Benchmark of multi-threaded Verilator models on a mesh of pclib
+# components. Every tile of the mesh adds or subtracts the registered
+# values of its north and west neighbors, so the amount of logic (and
+# the parallelism available to Verilator) grows with the square of the
+# mesh size.
+#
+# For each number of threads, the mesh is translated with
+# TranslationTool( threads=N ) and simulated with run_cycles. The last
+# part runs the same cycles in chunks, first generating the stimulus of
+# each chunk in Python and then simulating it, and then generating the
+# next chunk while the model simulates the current one in a worker thread
+# (the GIL is released while the model is evaluated).
+#
+# Requires Verilator, the builds are kept in the Verilator build cache.
+#
+#   % python scripts/bench_verilator_threads.py [-n CYCLES] [--size N]
+#                                              [--threads 1,2,4]
+
+from __future__ import print_function
+
+import sys
+import time
+import random
+import argparse
+import threading
+
+from distutils.spawn import find_executable
+
+from pymtl      import *
+from pclib.rtl  import Adder, Subtractor, Mux, Reg
+
+#-------------------------------------------------------------------------
+# MeshTile
+#-------------------------------------------------------------------------
+
+class MeshTile( Model ):
+
+  def __init__( s, nbits = 32 ):
+
+    s.north = InPort ( nbits )
+    s.west  = InPort ( nbits )
+    s.sel   = InPort ( 1 )
+    s.out   = OutPort( nbits )
+
+    s.add = Adder     ( nbits )
+    s.sub = Subtractor( nbits )
+    s.mux = Mux       ( nbits, 2 )
+    s.reg = Reg       ( nbits )
+
+    s.connect( s.add.in0,    s.north     )
+    s.connect( s.add.in1,    s.west      )
+    s.connect( s.add.cin,    0           )
+    s.connect( s.sub.in0,    s.north     )
+    s.connect( s.sub.in1,    s.west      )
+    s.connect( s.mux.in_[0], s.add.out   )
+    s.connect( s.mux.in_[1], s.sub.out   )
+    s.connect( s.mux.sel,    s.sel       )
+    s.connect( s.reg.in_,    s.mux.out   )
+    s.connect( s.out,        s.reg.out   )
+
+#-------------------------------------------------------------------------
+# Mesh
+#-------------------------------------------------------------------------
+
+class Mesh( Model ):
+
+  def __init__( s, size = 16, nbits = 32 ):
+
+    s.in_north  = InPort [ size ]( nbits )
+    s.in_west   = InPort [ size ]( nbits )
+    s.sel       = InPort [ size ]( 1 )
+    s.out_south = OutPort[ size ]( nbits )
+    s.out_east  = OutPort[ size ]( nbits )
+
+    s.tiles = [ MeshTile( nbits ) for _ in range( size * size ) ]
+
+    for r in range( size ):
+      for c in range( size ):
+        tile = s.tiles[ r*size + c ]
+
+        if r == 0: s.connect( tile.north, s.in_north[c] )
+        else:      s.connect( tile.north, s.tiles[ (r-1)*size + c ].out )
+
+        if c == 0: s.connect( tile.west,  s.in_west[r] )
+        else:      s.connect( tile.west,  s.tiles[ r*size + c-1 ].out )
+
+        s.connect( tile.sel, s.sel[ (r + c) % size ] )
+
+    for i in range( size ):
+      s.connect( s.out_south[i], s.tiles[ (size-1)*size + i ].out )
+      s.connect( s.out_east[i],  s.tiles[ i*size + size-1 ].out )
+
+#-------------------------------------------------------------------------
+# Benchmarks
+#-------------------------------------------------------------------------
+
+def make_model( size, threads ):
+  model = TranslationTool( Mesh( size ), opt_level=3, threads=threads )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  return model
+
+def make_vectors( model, ncycles ):
+  nbits = [ 0 if x is model.reset else x.nbits for x in model.run_inports() ]
+  return [ [ random.getrandbits( x ) if x else 0 for x in nbits ]
+           for _ in range( ncycles ) ]
+
+def bench_threads( model, vectors ):
+  start = time.time()
+  model.run_cycles( vectors )
+  return time.time() - start
+
+def bench_overlap( model, ncycles, nchunks ):
+
+  chunk = max( ncycles / nchunks, 1 )
+
+  # Generate the stimulus of each chunk, then simulate it
+
+  start = time.time()
+  for i in range( nchunks ):
+    model.run_cycles( make_vectors( model, chunk ) )
+  serial = time.time() - start
+
+  # Generate the next chunk while the current one is simulated
+
+  start   = time.time()
+  vectors = make_vectors( model, chunk )
+  for i in range( nchunks ):
+    worker = threading.Thread( target=model.run_cycles, args=( vectors, ) )
+    worker.start()
+    if i < nchunks - 1:
+      vectors = make_vectors( model, chunk )
+    worker.join()
+  overlap = time.time() - start
+
+  return serial, overlap
+
+#-------------------------------------------------------------------------
+# main
+#-------------------------------------------------------------------------
+
+def main():
+
+  p = argparse.ArgumentParser()
+  p.add_argument( '-n', type=int, default=20000, help='cycles' )
+  p.add_argument( '--size', type=int, default=16, help='mesh size' )
+  p.add_argument( '--threads', default='1,2,4', help='thread counts' )
+  p.add_argument( '--chunks', type=int, default=20, help='overlap chunks' )
+  opts = p.parse_args()
+
+  if not find_executable( 'verilator' ):
+    print( 'verilator is required for this benchmark' )
+    sys.exit( 1 )
+
+  threads = [ int( x ) for x in opts.threads.split( ',' ) ]
+
+  print( 'mesh {0}x{0}, {1} cycles'.format( opts.size, opts.n ) )
+  print( '{:>8} {:>12} {:>12} {:>8}'.format(
+         'threads', 'time (s)', 'cycles/s', 'speedup' ) )
+
+  base = None
+  for n in threads:
+    model   = make_model( opts.size, n )
+    vectors = make_vectors( model, opts.n )
+    elapsed = bench_threads( model, vectors )
+    base    = base or elapsed
+    print( '{:8} {:12.3f} {:12.0f} {:7.2f}x'.format(
+           n, elapsed, opts.n / elapsed, base / elapsed ) )
+
+  serial, overlap = bench_overlap( model, opts.n, opts.chunks )
+  print( 'stimulus generation with {} threads: serial {:.3f} s, '
+         'overlapped {:.3f} s ({:.2f}x)'.format(
+         threads[-1], serial, overlap, serial / overlap ) )
+
+if __name__ == '__main__':
+  main()
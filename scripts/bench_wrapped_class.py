@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_wrapped_class.py
+#========================================================================
+# Microbenchmark comparing the concrete classes generated by
+# CreateWrappedClass against the original SignalValueWrapper, which
+# proxies every attribute access to the wrapped object.
+#
+#   % python scripts/bench_wrapped_class.py [-n ITERATIONS]
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from pymtl.datatypes.SignalValue import CreateWrappedClass, SignalValueWrapper
+
+#-------------------------------------------------------------------------
+# Transaction class passed over ports
+#-------------------------------------------------------------------------
+
+class Txn( object ):
+  __fields__ = [ 'opcode', 'addr', 'data' ]
+
+  def __init__( s, opcode = 0, addr = 0, data = 0 ):
+    s.opcode = opcode
+    s.addr   = addr
+    s.data   = data
+
+  def __eq__( s, other ):
+    return s.opcode == other.opcode and s.addr == other.addr \
+       and s.data   == other.data
+
+class ProxyTxn( SignalValueWrapper ):
+  __wraps__ = Txn
+
+ConcreteTxn = CreateWrappedClass( Txn )
+ConcreteTxn.__name__ = 'ConcreteTxn'
+
+#-------------------------------------------------------------------------
+# Benchmarks
+#-------------------------------------------------------------------------
+
+benchmarks = [
+  ( 'field read',  'x.addr'                ),
+  ( 'field write', 'x.addr = 3'            ),
+  ( 'copy [:]',    'x[:]'                  ),
+  ( 'write_value', 'x.write_value( y )'    ),
+  ( 'equality',    'x == y'                ),
+]
+
+def bench( cls, stmt, n ):
+  setup = ( 'from __main__ import {} as cls\n'
+            'x = cls( 1, 2, 3 )\n'
+            'y = cls( 1, 2, 4 )'.format( cls.__name__ ) )
+  return min( timeit.Timer( stmt, setup ).repeat( 3, n ) )
+
+#-------------------------------------------------------------------------
+# main
+#-------------------------------------------------------------------------
+
+def main():
+
+  p = argparse.ArgumentParser()
+  p.add_argument( '-n', type=int, default=200000, help='iterations' )
+  opts = p.parse_args()
+
+  print( '{:12} {:>12} {:>13} {:>8}'.format(
+         'benchmark', 'proxy (us)', 'concrete (us)', 'speedup' ) )
+
+  for name, stmt in benchmarks:
+    proxy    = bench( ProxyTxn,    stmt, opts.n ) / opts.n * 1e6
+    concrete = bench( ConcreteTxn, stmt, opts.n ) / opts.n * 1e6
+    print( '{:12} {:12.3f} {:13.3f} {:7.1f}x'.format(
+           name, proxy, concrete, proxy / concrete ) )
+
+if __name__ == '__main__':
+  main()